@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+"""Measure the decoding throughput of the replisome plugin.
+
+Create the benchmark tables, generate a fixed volume of changes and time
+pg_logical_slot_peek_changes() decoding them with several sets of options.
+Report the changes and bytes decoded per second, optionally appending the
+results to a file, as JSON lines, to compare them across commits.
+"""
+
+from __future__ import division, print_function
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+from datetime import datetime
+
+import psycopg2
+
+import logging
+logger = logging.getLogger('bench')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SLOT = 'rs_bench'
+
+# The benchmark cases: name, tables whose changes are emitted, options.
+# The cases using bench_part are skipped before PostgreSQL 10.
+CASES = [
+    ('narrow', ['bench_narrow'], [
+        ('include', {'table': 'bench_narrow'})]),
+    ('narrow-pretty', ['bench_narrow'], [
+        ('include', {'table': 'bench_narrow'}),
+        ('pretty-print', '1')]),
+    ('narrow-no-types', ['bench_narrow'], [
+        ('include', {'table': 'bench_narrow'}),
+        ('include-types', '0')]),
+    ('wide', ['bench_wide'], [
+        ('include', {'table': 'bench_wide'})]),
+    ('wide-columns', ['bench_wide'], [
+        ('include', {'table': 'bench_wide',
+            'columns': ['id', 'code', 'qty', 'price']})]),
+    ('wide-where', ['bench_wide'], [
+        ('include', {'table': 'bench_wide', 'where': 'qty < 10'})]),
+    ('toast', ['bench_toast'], [
+        ('include', {'table': 'bench_toast'})]),
+    ('toast-truncate', ['bench_toast'], [
+        ('include', {'table': 'bench_toast', 'max_value_bytes': 100})]),
+    ('toast-hash', ['bench_toast'], [
+        ('include', {'table': 'bench_toast',
+            'hash_columns': ['body', 'doc']})]),
+    ('bytea', ['bench_bytea'], [
+        ('include', {'table': 'bench_bytea'})]),
+    ('bytea-base64', ['bench_bytea'], [
+        ('include', {'table': 'bench_bytea'}),
+        ('bytea-format', 'base64')]),
+    ('partitions', ['bench_part'], [
+        ('include', {'tables': '^bench_part_'})]),
+    ('partitions-via-root', ['bench_part'], [
+        ('include', {'table': 'bench_part', 'via_root': True})]),
+    ('all', None, []),
+    ('all-chunks', None, [
+        ('write-in-chunks', '1')]),
+    ('all-chunks-8k', None, [
+        ('write-in-chunks', '1'),
+        ('chunk-size', '8192')]),
+]
+
+TABLES = ['bench_narrow', 'bench_wide', 'bench_toast', 'bench_bytea',
+    'bench_part']
+
+
+def main():
+    opt = parse_cmdline()
+    logging.basicConfig(
+        level=opt.loglevel,
+        format='%(asctime)s %(levelname)s %(message)s')
+
+    cluster = None
+    if opt.initdb:
+        cluster = Cluster(opt.pg_config, opt.port)
+        cluster.start()
+        opt.dsn = cluster.create_database('rs_bench')
+
+    try:
+        conn = psycopg2.connect(opt.dsn)
+        conn.autocommit = True
+        results = run(conn, opt)
+        conn.close()
+    finally:
+        if cluster is not None and not opt.keep:
+            cluster.destroy()
+
+    baseline = load_baseline(opt.baseline) if opt.baseline else {}
+    print_results(results, baseline)
+
+    if opt.output:
+        with open(opt.output, 'a') as f:
+            for res in results:
+                f.write(json.dumps(res, sort_keys=True))
+                f.write('\n')
+        logger.info("results appended to %s", opt.output)
+
+
+def run(conn, opt):
+    """Generate the changes and decode them with every case."""
+    cur = conn.cursor()
+    cur.execute("show server_version_num")
+    server_version = int(cur.fetchone()[0])
+
+    logger.info("creating the benchmark tables")
+    cur.execute(read_sql('decode_schema.sql'))
+
+    cur.execute("""
+        select 1 from pg_replication_slots where slot_name = %s""", (SLOT,))
+    if cur.fetchone():
+        cur.execute("select pg_drop_replication_slot(%s)", (SLOT,))
+    cur.execute(
+        "select pg_create_logical_replication_slot(%s, 'replisome')", (SLOT,))
+
+    try:
+        generate_changes(cur, opt.rows, opt.batch)
+
+        commit = git_commit()
+        timestamp = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        results = []
+        for name, tables, options in CASES:
+            if opt.cases and name not in opt.cases:
+                continue
+            if server_version < 100000 and tables and 'bench_part' in tables:
+                logger.info("skipping case %s: no partitioned tables", name)
+                continue
+
+            res = run_case(cur, name, options, opt.repeat)
+            res['changes'] = count_changes(
+                tables or TABLES, opt.rows, server_version)
+            res['changes_per_sec'] = res['changes'] / res['seconds']
+            res['bytes_per_sec'] = res['bytes'] / res['seconds']
+            res.update(commit=commit, timestamp=timestamp,
+                server_version=server_version, rows=opt.rows)
+            results.append(res)
+
+    finally:
+        cur.execute("select pg_drop_replication_slot(%s)", (SLOT,))
+
+    return results
+
+
+def generate_changes(cur, rows, batch):
+    """Run the workload on the ids from 1 to rows, a batch per transaction."""
+    workload = read_sql('decode_workload.sql')
+    logger.info("generating the changes of %d rows", rows)
+    for lo in range(1, rows + 1, batch):
+        hi = min(lo + batch - 1, rows)
+        cur.execute("select set_config('bench.lo', %s, false)", (str(lo),))
+        cur.execute("select set_config('bench.hi', %s, false)", (str(hi),))
+        cur.execute(workload)
+
+
+def count_changes(tables, rows, server_version):
+    """Return the number of changes generated for the tables.
+
+    Every row is inserted, updated, and deleted if its id is even.
+    """
+    if server_version < 100000:
+        tables = [t for t in tables if t != 'bench_part']
+    return len(tables) * (rows + rows + rows // 2)
+
+
+def run_case(cur, name, options, repeat):
+    """Decode the changes with a set of options, return the best time."""
+    args = []
+    for k, v in options:
+        args.append(k)
+        args.append(v if isinstance(v, str) else json.dumps(v))
+
+    logger.info("running case %s", name)
+    times = []
+    for i in range(repeat + 1):
+        t0 = time.time()
+        cur.execute("""
+            select count(*), coalesce(sum(octet_length(data)), 0)
+            from pg_logical_slot_peek_changes(
+                %s, NULL, NULL, variadic %s::text[])
+            """, (SLOT, args))
+        messages, nbytes = cur.fetchone()
+        # The first run warms up the caches
+        if i > 0:
+            times.append(time.time() - t0)
+
+    return {
+        'case': name,
+        'options': args,
+        'messages': int(messages),
+        'bytes': int(nbytes),
+        'seconds': min(times),
+    }
+
+
+def load_baseline(filename):
+    """Return the last result of every case in a results file."""
+    rv = {}
+    with open(filename) as f:
+        for line in f:
+            if line.strip():
+                res = json.loads(line)
+                rv[res['case']] = res
+    return rv
+
+
+def print_results(results, baseline):
+    header = "%-20s %10s %12s %14s %9s" % (
+        'case', 'seconds', 'changes/s', 'bytes/s', 'vs base')
+    print(header)
+    print('-' * len(header))
+    for res in results:
+        base = baseline.get(res['case'])
+        if base and base['changes_per_sec']:
+            ratio = "%+8.1f%%" % (
+                (res['changes_per_sec'] / base['changes_per_sec'] - 1) * 100)
+        else:
+            ratio = ''
+        print("%-20s %10.3f %12.0f %14.0f %9s" % (
+            res['case'], res['seconds'], res['changes_per_sec'],
+            res['bytes_per_sec'], ratio))
+
+
+def read_sql(filename):
+    with open(os.path.join(HERE, filename)) as f:
+        return f.read()
+
+
+def git_commit():
+    """Return the commit of the source tree, if available."""
+    try:
+        out = subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'], cwd=HERE)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.decode('ascii').strip()
+
+
+class Cluster(object):
+    """A throwaway database cluster configured for logical decoding."""
+    def __init__(self, pg_config, port):
+        self.bindir = subprocess.check_output(
+            [pg_config, '--bindir']).decode('utf8').strip()
+        self.port = port
+        self.basedir = tempfile.mkdtemp(prefix='rs-bench-')
+        self.datadir = os.path.join(self.basedir, 'data')
+
+    def start(self):
+        logger.info("creating a cluster in %s", self.datadir)
+        self._run('initdb', '-D', self.datadir, '-U', 'postgres',
+            '-A', 'trust', '-N')
+
+        with open(os.path.join(self.datadir, 'postgresql.conf'), 'a') as f:
+            f.write("""
+port = %d
+listen_addresses = ''
+unix_socket_directories = '%s'
+wal_level = logical
+max_replication_slots = 4
+max_wal_senders = 4
+fsync = off
+""" % (self.port, self.basedir))
+
+        self._run('pg_ctl', '-D', self.datadir, '-w',
+            '-l', os.path.join(self.basedir, 'postgres.log'), 'start')
+
+    def create_database(self, dbname):
+        """Create a database in the cluster and return its dsn."""
+        conn = psycopg2.connect(self.dsn('postgres'))
+        conn.autocommit = True
+        conn.cursor().execute('create database %s' % dbname)
+        conn.close()
+        return self.dsn(dbname)
+
+    def dsn(self, dbname):
+        return 'host=%s port=%d user=postgres dbname=%s' % (
+            self.basedir, self.port, dbname)
+
+    def destroy(self):
+        logger.info("destroying the cluster in %s", self.datadir)
+        try:
+            self._run('pg_ctl', '-D', self.datadir, '-w', '-m', 'fast', 'stop')
+        finally:
+            shutil.rmtree(self.basedir, ignore_errors=True)
+
+    def _run(self, cmd, *args):
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(
+                (os.path.join(self.bindir, cmd),) + args, stdout=devnull)
+
+
+def parse_cmdline():
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description=__doc__)
+
+    g = parser.add_mutually_exclusive_group(required=True)
+    g.add_argument('--dsn',
+        help="throwaway database configured for logical decoding to use: "
+            "the benchmark tables are dropped and created again")
+    g.add_argument('--initdb', action='store_true',
+        help="create a temporary cluster to run the benchmark")
+
+    parser.add_argument('--pg-config', default='pg_config',
+        help="pg_config of the installation to use with --initdb, "
+            "with replisome installed [default: %(default)s]")
+    parser.add_argument('--port', type=int, default=54329,
+        help="port of the cluster created with --initdb [default: %(default)s]")
+    parser.add_argument('--keep', action='store_true',
+        help="don't destroy the cluster created with --initdb")
+
+    parser.add_argument('--rows', type=int, default=20000,
+        help="rows to change in every table [default: %(default)s]")
+    parser.add_argument('--batch', type=int, default=1000,
+        help="rows to change in every transaction [default: %(default)s]")
+    parser.add_argument('--repeat', type=int, default=3,
+        help="times to decode the changes in every case, taking the best "
+            "[default: %(default)s]")
+    parser.add_argument('--case', dest='cases', action='append',
+        metavar='NAME', choices=[c[0] for c in CASES],
+        help="only run this case (can be repeated) [default: all]")
+
+    parser.add_argument('--output', metavar='FILE',
+        help="append the results to this file, a JSON object per line")
+    parser.add_argument('--baseline', metavar='FILE',
+        help="compare with the last results of every case in this file")
+
+    g = parser.add_mutually_exclusive_group()
+    g.add_argument('-v', '--verbose', dest='loglevel',
+        action='store_const', const=logging.DEBUG, default=logging.INFO,
+        help="print debugging information to stderr")
+    g.add_argument('-q', '--quiet', dest='loglevel',
+        action='store_const', const=logging.WARN,
+        help="minimal output on stderr")
+
+    opt = parser.parse_args()
+    if opt.rows < 1 or opt.batch < 1 or opt.repeat < 1:
+        parser.error("rows, batch and repeat must be positive")
+
+    return opt
+
+
+if __name__ == '__main__':
+    sys.exit(main())
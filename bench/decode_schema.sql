@@ -0,0 +1,60 @@
+-- Tables used by the decoding benchmark (bench/decode.py).
+--
+-- Representative layouts: a narrow table of ints, a wide table of mixed
+-- types, large text and jsonb values (stored out of line in TOAST), bytea,
+-- and a partitioned table (only from PostgreSQL 10).
+
+DROP TABLE IF EXISTS bench_narrow;
+CREATE TABLE bench_narrow (
+	id int PRIMARY KEY,
+	a int,
+	b int,
+	c int);
+
+DROP TABLE IF EXISTS bench_wide;
+CREATE TABLE bench_wide (
+	id int PRIMARY KEY,
+	code text,
+	name text,
+	qty int,
+	price numeric(12,2),
+	score float8,
+	active bool,
+	created timestamptz,
+	day date,
+	tags text[],
+	note varchar(100),
+	ref bigint);
+
+DROP TABLE IF EXISTS bench_toast;
+CREATE TABLE bench_toast (
+	id int PRIMARY KEY,
+	title text,
+	body text,
+	doc jsonb);
+
+-- Store the values uncompressed, so that they are really out of line
+ALTER TABLE bench_toast ALTER body SET STORAGE EXTERNAL;
+ALTER TABLE bench_toast ALTER doc SET STORAGE EXTERNAL;
+
+DROP TABLE IF EXISTS bench_bytea;
+CREATE TABLE bench_bytea (
+	id int PRIMARY KEY,
+	data bytea);
+
+DROP TABLE IF EXISTS bench_part CASCADE;
+DO $$
+BEGIN
+	IF current_setting('server_version_num')::int >= 100000 THEN
+		EXECUTE 'CREATE TABLE bench_part (id int NOT NULL, a int, data text)
+			PARTITION BY LIST ((id % 4))';
+		FOR i IN 0..3 LOOP
+			EXECUTE format(
+				'CREATE TABLE bench_part_%s PARTITION OF bench_part
+					FOR VALUES IN (%s)', i, i);
+			EXECUTE format(
+				'ALTER TABLE bench_part_%s ADD PRIMARY KEY (id)', i);
+		END LOOP;
+	END IF;
+END
+$$ LANGUAGE plpgsql;
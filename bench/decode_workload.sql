@@ -0,0 +1,76 @@
+-- A batch of changes for the decoding benchmark (bench/decode.py).
+--
+-- Insert the rows with id between the settings bench.lo and bench.hi into
+-- every table, update all of them, then delete the ones with even id: the
+-- script runs it in a transaction for each batch.
+
+INSERT INTO bench_narrow
+	SELECT i, i * 2, i % 1000, -i
+	FROM generate_series(
+		current_setting('bench.lo')::int, current_setting('bench.hi')::int) i;
+
+INSERT INTO bench_wide
+	SELECT i, 'C' || i, 'name of the item ' || i, i % 50, i / 100.0,
+		i / 7.0, i % 3 = 0, '2020-01-01'::timestamptz + i * '1 second'::interval,
+		'2020-01-01'::date + i % 1000, ARRAY['tag' || i % 10, 'tag' || i % 7],
+		repeat('n', i % 100), i::bigint * 1000003
+	FROM generate_series(
+		current_setting('bench.lo')::int, current_setting('bench.hi')::int) i;
+
+INSERT INTO bench_toast
+	SELECT i, 'title ' || i,
+		(SELECT string_agg(md5((i * 100 + j)::text), ' ')
+			FROM generate_series(1, 100) j),
+		(SELECT jsonb_object_agg('k' || j, md5((i * 100 + j)::text))
+			FROM generate_series(1, 100) j)
+	FROM generate_series(
+		current_setting('bench.lo')::int, current_setting('bench.hi')::int) i;
+
+INSERT INTO bench_bytea
+	SELECT i, decode(repeat(md5(i::text), 8), 'hex')
+	FROM generate_series(
+		current_setting('bench.lo')::int, current_setting('bench.hi')::int) i;
+
+UPDATE bench_narrow SET a = a + 1
+	WHERE id BETWEEN current_setting('bench.lo')::int
+		AND current_setting('bench.hi')::int;
+UPDATE bench_wide SET qty = qty + 1, active = NOT active
+	WHERE id BETWEEN current_setting('bench.lo')::int
+		AND current_setting('bench.hi')::int;
+UPDATE bench_toast SET title = title || '!'
+	WHERE id BETWEEN current_setting('bench.lo')::int
+		AND current_setting('bench.hi')::int;
+UPDATE bench_bytea SET data = data || '\x00'::bytea
+	WHERE id BETWEEN current_setting('bench.lo')::int
+		AND current_setting('bench.hi')::int;
+
+DELETE FROM bench_narrow
+	WHERE id BETWEEN current_setting('bench.lo')::int
+		AND current_setting('bench.hi')::int AND id % 2 = 0;
+DELETE FROM bench_wide
+	WHERE id BETWEEN current_setting('bench.lo')::int
+		AND current_setting('bench.hi')::int AND id % 2 = 0;
+DELETE FROM bench_toast
+	WHERE id BETWEEN current_setting('bench.lo')::int
+		AND current_setting('bench.hi')::int AND id % 2 = 0;
+DELETE FROM bench_bytea
+	WHERE id BETWEEN current_setting('bench.lo')::int
+		AND current_setting('bench.hi')::int AND id % 2 = 0;
+
+DO $$
+BEGIN
+	IF to_regclass('bench_part') IS NOT NULL THEN
+		INSERT INTO bench_part
+			SELECT i, i % 1000, md5(i::text)
+			FROM generate_series(
+				current_setting('bench.lo')::int,
+				current_setting('bench.hi')::int) i;
+		UPDATE bench_part SET a = a + 1
+			WHERE id BETWEEN current_setting('bench.lo')::int
+				AND current_setting('bench.hi')::int;
+		DELETE FROM bench_part
+			WHERE id BETWEEN current_setting('bench.lo')::int
+				AND current_setting('bench.hi')::int AND id % 2 = 0;
+	END IF;
+END
+$$ LANGUAGE plpgsql;
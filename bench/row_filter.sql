@@ -0,0 +1,46 @@
+-- Measure the decoding speed of a table filtered by a row filter.
+--
+-- Run on a throwaway database of a cluster configured for logical decoding
+-- and with the extension installed, e.g.:
+--
+--     psql -X -f bench/row_filter.sql rs_bench
+--
+-- Compare the timing of the decoding with and without the "where" option.
+
+\set VERBOSITY terse
+\set nrows 200000
+\timing off
+
+SET synchronous_commit = on;
+
+DROP TABLE IF EXISTS bench_rf;
+CREATE TABLE bench_rf (id int PRIMARY KEY, data text, n int);
+
+SELECT 'init' FROM pg_create_logical_replication_slot('bench_slot', 'replisome');
+
+INSERT INTO bench_rf
+	SELECT i, md5(i::text), i % 100 FROM generate_series(1, :nrows) i;
+UPDATE bench_rf SET data = data || 'x';
+DELETE FROM bench_rf;
+
+\timing on
+
+-- no row filter
+SELECT count(*) FROM pg_logical_slot_peek_changes('bench_slot', NULL, NULL,
+	'write-in-chunks', '1',
+	'include', '{"table": "bench_rf"}');
+
+-- row filter matching half of the rows
+SELECT count(*) FROM pg_logical_slot_peek_changes('bench_slot', NULL, NULL,
+	'write-in-chunks', '1',
+	'include', '{"table": "bench_rf", "where": "n < 50"}');
+
+-- row filter dropping every row
+SELECT count(*) FROM pg_logical_slot_peek_changes('bench_slot', NULL, NULL,
+	'write-in-chunks', '1',
+	'include', '{"table": "bench_rf", "where": "n < 0"}');
+
+\timing off
+
+SELECT 'stop' FROM pg_drop_replication_slot('bench_slot');
+DROP TABLE bench_rf;
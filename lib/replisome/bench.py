@@ -0,0 +1,444 @@
+"""Measure the throughput of the replisome Python pipeline.
+
+Generate a synthetic stream of messages, in the format emitted by the
+decoding plugin, and feed it to the receiver, the filters and the consumer
+of a pipeline in-process, without a server, measuring every stage. With
+--data-updater apply the changes to a database using a DataUpdater.
+"""
+
+import json
+import time
+import random
+import string
+
+from .errors import ConfigError
+from .config import parse_yaml, make_object, make_filters, make_consumer
+from .pipeline import accepts_raw
+from .receivers.ReplayReceiver import ReplayCursor, ReplayMessage
+
+import logging
+logger = logging.getLogger('replisome.bench')
+
+timer = getattr(time, 'perf_counter', time.time)
+
+# The types of the generated columns after the key, in rotation
+COLTYPES = ['text', 'int4', 'float8', 'bool', 'timestamptz']
+
+# The pg types to create the tables for the DataUpdater
+PGTYPES = {
+    'int4': 'int', 'text': 'text', 'float8': 'float8', 'bool': 'bool',
+    'timestamptz': 'timestamptz'}
+
+
+class StreamGenerator(object):
+    """
+    Generate the chunks of a synthetic replisome stream.
+
+    The stream contains changes to `ntables` tables of `ncols` columns: an
+    integer key ``id`` and other columns of the types in `COLTYPES`, with
+    text values of `value_size` characters. The operations are chosen
+    according to the weights in `ops` (a map from ``I``, ``U``, ``D``) and
+    are consistent: only existing rows are updated or deleted.
+
+    The chunks are the ones written by the plugin with the ``write-in-chunks``
+    option (or, with `ndjson`, the records written with the ``ndjson``
+    option), to feed to a `JsonReceiver`.
+    """
+    def __init__(self, ntables=5, ncols=10, value_size=20, ops=None,
+                 ndjson=False, seed=None):
+        if ntables < 1 or ncols < 1 or value_size < 0:
+            raise ConfigError("bad stream generator parameters")
+
+        self.ntables = ntables
+        self.ncols = ncols
+        self.value_size = value_size
+        self.ops = ops or {'I': 60, 'U': 30, 'D': 10}
+        self.ndjson = ndjson
+        self.random = random.Random(seed)
+
+        self.tables = ['bench_%d' % i for i in range(ntables)]
+        self.colnames = ['id'] + ['c%d' % i for i in range(1, ncols)]
+        self.coltypes = ['int4'] + [
+            COLTYPES[(i - 1) % len(COLTYPES)] for i in range(1, ncols)]
+
+        # A pool of text values, to make the generation cheap
+        letters = string.ascii_letters + string.digits + ' '
+        self._texts = [
+            ''.join(self.random.choice(letters) for i in range(value_size))
+            for j in range(1000)]
+
+        # The ids of the rows existing in every table
+        self._rows = [[] for t in self.tables]
+        self._next_id = [1] * ntables
+
+        # The tables whose names and key names have been emitted
+        self._names_emitted = set()
+        self._key_emitted = set()
+
+        self._xid = 1000
+        self._lsn = 0x1000000
+
+    def transactions(self, ntx, tx_size):
+        """
+        Generate `ntx` transactions of `tx_size` changes.
+
+        Return the list of the chunks of every transaction.
+        """
+        return [self.transaction(tx_size) for i in range(ntx)]
+
+    def transaction(self, size):
+        """Return the chunks of a transaction of `size` changes."""
+        self._xid += 1
+        changes = [self.change() for i in range(size)]
+
+        if self.ndjson:
+            rv = [self._dumps({'xid': self._xid, 'begin': True}) + '\n']
+            for ch in changes:
+                self._lsn += 0x100
+                rec = {'xid': self._xid, 'lsn': self._fmt_lsn(self._lsn)}
+                rec.update(ch)
+                rv.append(self._dumps(rec) + '\n')
+            self._lsn += 0x100
+            rv.append(self._dumps({
+                'commit': True, 'xid': self._xid,
+                'nextlsn': self._fmt_lsn(self._lsn)}) + '\n')
+
+        else:
+            rv = ['{"tx":[']
+            for i, ch in enumerate(changes):
+                rv.append((i and ',' or '') + self._dumps(ch))
+            rv.append(']}')
+
+        return rv
+
+    def change(self):
+        """Return a change to a random table, as a dict."""
+        nt = self.random.randrange(self.ntables)
+        rows = self._rows[nt]
+
+        op = self._choose_op()
+        if op != 'I' and not rows:
+            op = 'I'
+
+        ch = {'op': op, 'schema': 'public', 'table': self.tables[nt]}
+
+        if op == 'I':
+            id = self._next_id[nt]
+            self._next_id[nt] += 1
+            rows.append(id)
+        else:
+            i = self.random.randrange(len(rows))
+            id = rows[i]
+            if op == 'D':
+                rows[i] = rows[-1]
+                rows.pop()
+
+        if op != 'D':
+            if nt not in self._names_emitted:
+                self._names_emitted.add(nt)
+                ch['colnames'] = self.colnames
+                ch['coltypes'] = self.coltypes
+            ch['values'] = self._values(id)
+
+        if op != 'I':
+            if nt not in self._key_emitted:
+                self._key_emitted.add(nt)
+                ch['keynames'] = ['id']
+                ch['keytypes'] = ['int4']
+            ch['oldkey'] = [id]
+
+        return ch
+
+    def _choose_op(self):
+        n = self.random.uniform(0, sum(self.ops.values()))
+        for op in sorted(self.ops):
+            n -= self.ops[op]
+            if n <= 0:
+                return op
+        return op
+
+    def _values(self, id):
+        rv = [id]
+        rnd = self.random
+        for t in self.coltypes[1:]:
+            if t == 'text':
+                rv.append(rnd.choice(self._texts))
+            elif t == 'int4':
+                rv.append(rnd.randrange(1000000))
+            elif t == 'float8':
+                rv.append(rnd.random() * 1000)
+            elif t == 'bool':
+                rv.append(rnd.random() < 0.5)
+            elif t == 'timestamptz':
+                rv.append('2020-01-%02d %02d:%02d:%02d+00' % (
+                    rnd.randrange(1, 29), rnd.randrange(24),
+                    rnd.randrange(60), rnd.randrange(60)))
+        return rv
+
+    def _dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'))
+
+    def _fmt_lsn(self, lsn):
+        return '%X/%X' % (lsn >> 32, lsn & 0xFFFFFFFF)
+
+    def create_tables(self, cnn):
+        """Create the tables of the stream in a database."""
+        cur = cnn.cursor()
+        cols = ', '.join(
+            '%s %s' % (n, PGTYPES[t])
+            for n, t in zip(self.colnames[1:], self.coltypes[1:]))
+        for t in self.tables:
+            cur.execute("drop table if exists public.%s" % t)
+            cur.execute("create table public.%s (id int primary key%s)" % (
+                t, cols and ', ' + cols or ''))
+        cnn.commit()
+
+
+class Stage(object):
+    """The measures of a stage of the pipeline."""
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.messages = 0
+        self.changes = 0
+        self.bytes = None
+        self.memory = None
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+def run_pipeline(receiver, filters, consumer, chunks, memory=False):
+    """
+    Feed the chunks generated to the pipeline, a stage at time.
+
+    Every stage processes the entire output of the previous one, so that
+    its time and memory can be measured separately. Return the list of
+    `Stage` measured.
+    """
+    cursor = ReplayCursor()
+    payloads = [
+        [ReplayMessage(c.encode('ascii'), cursor) for c in tx]
+        for tx in chunks]
+
+    messages = []
+    receiver.message_cb = messages.append
+    receiver.raw = consumer is not None and accepts_raw(filters, consumer) \
+        and receiver.can_pass_raw()
+
+    def receive():
+        for tx in payloads:
+            for msg in tx:
+                receiver.consume(msg)
+
+    stage = Stage('receiver')
+    stage.bytes = sum(len(m.payload) for tx in payloads for m in tx)
+    _measure(stage, receive, memory)
+    _count(stage, messages)
+    stages = [stage]
+
+    for f in filters:
+        stage = Stage(_stage_name(f))
+        out = []
+
+        def apply_filter(f=f, inp=messages, out=out):
+            for msg in inp:
+                msg = f(msg)
+                if msg is not None:
+                    out.append(msg)
+
+        _measure(stage, apply_filter, memory)
+        _count(stage, out)
+        stages.append(stage)
+        messages = out
+
+    if consumer is not None:
+        stage = Stage(_stage_name(consumer))
+
+        def consume():
+            for msg in messages:
+                consumer(msg)
+
+        _measure(stage, consume, memory)
+        _count(stage, messages)
+        stages.append(stage)
+
+    return stages
+
+
+def _stage_name(obj):
+    # The name of a function, or the class of a callable object
+    return getattr(obj, '__name__', None) or type(obj).__name__
+
+
+def _measure(stage, f, memory):
+    if memory:
+        try:
+            import tracemalloc
+        except ImportError:
+            raise ConfigError("measuring memory requires Python 3.4")
+        tracemalloc.start()
+
+    t0 = timer()
+    try:
+        f()
+    finally:
+        stage.seconds = timer() - t0
+        if memory:
+            stage.memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+
+def _count(stage, messages):
+    stage.messages = len(messages)
+    if messages and isinstance(messages[0], bytes):
+        # undecoded messages: the changes are not counted
+        stage.changes = None
+    else:
+        stage.changes = sum(len(m['tx']) for m in messages)
+
+
+def make_bench_pipeline(conf, data_updater=None):
+    """
+    Return receiver, filters and consumer from a pipeline configuration.
+
+    The receiver connection parameters are ignored. If `data_updater` is
+    a dsn, the consumer is a `DataUpdater` writing there.
+    """
+    rconf = dict(conf.get('receiver') or {'class': 'JsonReceiver'})
+    for k in ('dsn', 'slot', 'plugin'):
+        rconf.pop(k, None)
+    try:
+        receiver = make_object(rconf, package='replisome.receivers')
+    except ConfigError as e:
+        raise ConfigError("bad receiver configuration: %s" % e)
+
+    filters = list(make_filters(conf.get('filters')))
+
+    if data_updater:
+        from .consumers.DataUpdater import DataUpdater
+        consumer = DataUpdater(data_updater)
+    elif conf.get('consumer'):
+        consumer = make_consumer(conf['consumer'])
+    else:
+        consumer = None
+
+    return receiver, filters, consumer
+
+
+def parse_ops(s):
+    """Parse an op mix such as ``60:30:10`` into a map of weights."""
+    try:
+        ws = [float(w) for w in s.split(':')]
+    except ValueError:
+        ws = []
+    if len(ws) != 3 or min(ws) < 0 or not sum(ws) or ws[0] == 0:
+        raise ConfigError(
+            "the ops mix should be three weights I:U:D, with I > 0, got %r"
+            % s)
+    return dict(zip('IUD', ws))
+
+
+def main(args=None):
+    opt = parse_cmdline(args)
+    logging.basicConfig(
+        level=opt.loglevel,
+        format='%(asctime)s %(levelname)s %(message)s')
+
+    conf = parse_yaml(opt.configfile) if opt.configfile else {}
+    receiver, filters, consumer = make_bench_pipeline(
+        conf, data_updater=opt.data_updater)
+
+    gen = StreamGenerator(
+        ntables=opt.tables, ncols=opt.columns, value_size=opt.value_size,
+        ops=parse_ops(opt.ops), ndjson=getattr(receiver, '_ndjson', False),
+        seed=opt.seed)
+
+    if opt.data_updater:
+        import psycopg2
+        logger.info("creating the tables in the target database")
+        cnn = psycopg2.connect(opt.data_updater)
+        gen.create_tables(cnn)
+        cnn.close()
+
+    logger.info("generating %d transactions of %d changes",
+        opt.transactions, opt.tx_size)
+    chunks = gen.transactions(opt.transactions, opt.tx_size)
+
+    stages = run_pipeline(
+        receiver, filters, consumer, chunks, memory=opt.memory)
+
+    print_stages(stages)
+
+    if opt.output:
+        res = {
+            'transactions': opt.transactions, 'tx_size': opt.tx_size,
+            'tables': opt.tables, 'columns': opt.columns,
+            'value_size': opt.value_size, 'ops': opt.ops,
+            'stages': [s.as_dict() for s in stages]}
+        with open(opt.output, 'a') as f:
+            f.write(json.dumps(res, sort_keys=True))
+            f.write('\n')
+        logger.info("results appended to %s", opt.output)
+
+
+def print_stages(stages):
+    header = "%-16s %9s %11s %12s %12s %10s" % (
+        'stage', 'seconds', 'messages/s', 'changes/s', 'MB/s', 'peak MB')
+    print(header)
+    print('-' * len(header))
+    for s in stages:
+        secs = s.seconds or 1e-9
+        print("%-16s %9.3f %11.0f %12s %12s %10s" % (
+            s.name, s.seconds, s.messages / secs,
+            '%.0f' % (s.changes / secs) if s.changes is not None else '',
+            '%.2f' % (s.bytes / secs / 1e6) if s.bytes is not None else '',
+            '%.2f' % (s.memory / 1e6) if s.memory is not None else ''))
+
+
+def parse_cmdline(args=None):
+    from argparse import ArgumentParser
+    parser = ArgumentParser(prog='replisome bench', description=__doc__)
+    parser.add_argument('configfile', nargs='?',
+        help="pipeline configuration file whose receiver options, filters "
+            "and consumer to use; the connection parameters are ignored "
+            "[default: a JsonReceiver only]")
+
+    g = parser.add_argument_group('stream')
+    g.add_argument('--transactions', type=int, default=1000,
+        help="number of transactions to generate [default: %(default)s]")
+    g.add_argument('--tx-size', type=int, default=10,
+        help="number of changes per transaction [default: %(default)s]")
+    g.add_argument('--tables', type=int, default=5,
+        help="number of tables changed [default: %(default)s]")
+    g.add_argument('--columns', type=int, default=10,
+        help="number of columns of the tables [default: %(default)s]")
+    g.add_argument('--value-size', type=int, default=20,
+        help="length of the text values [default: %(default)s]")
+    g.add_argument('--ops', default='60:30:10',
+        help="relative weights of inserts, updates and deletes "
+            "[default: %(default)s]")
+    g.add_argument('--seed', type=int,
+        help="seed of the random generator, for a reproducible stream")
+
+    parser.add_argument('--data-updater', metavar='DSN',
+        help="use a DataUpdater as consumer, applying the changes to this "
+            "database (the tables bench_N are dropped and created again)")
+    parser.add_argument('--memory', action='store_true',
+        help="measure the peak memory allocated by every stage (slower)")
+    parser.add_argument('--output', metavar='FILE',
+        help="append the results to this file, a JSON object per line")
+
+    g = parser.add_mutually_exclusive_group()
+    g.add_argument('-v', '--verbose', dest='loglevel',
+        action='store_const', const=logging.DEBUG, default=logging.INFO,
+        help="print debugging information to stderr")
+    g.add_argument('-q', '--quiet', dest='loglevel',
+        action='store_const', const=logging.WARN,
+        help="minimal output on stderr")
+
+    opt = parser.parse_args(args)
+    if opt.transactions < 1 or opt.tx_size < 1:
+        parser.error("transactions and tx-size must be positive")
+
+    return opt
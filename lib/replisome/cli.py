@@ -13,6 +13,20 @@ logger = logging.getLogger('replisome')
 
 
 def main():
+    # The subcommands have their own command line
+    if sys.argv[1:2] == ['bench']:
+        from .bench import main as bench_main
+        return bench_main(sys.argv[2:])
+    elif sys.argv[1:2] == ['record']:
+        from .recording import record_main
+        return record_main(sys.argv[2:])
+    elif sys.argv[1:2] == ['replay']:
+        from .recording import replay_main
+        return replay_main(sys.argv[2:])
+    elif sys.argv[1:2] == ['sync']:
+        from .sync import main as sync_main
+        return sync_main(sys.argv[2:])
+
     opt = parse_cmdline()
     logging.basicConfig(
         level=opt.loglevel,
@@ -31,7 +45,10 @@ def main():
 
 def parse_cmdline():
     from argparse import ArgumentParser
-    parser = ArgumentParser(description=__doc__)
+    parser = ArgumentParser(description=__doc__,
+        epilog="Other commands: '%(prog)s sync', '%(prog)s bench', "
+            "'%(prog)s record', '%(prog)s replay' (use --help with them for "
+            "details).")
     parser.add_argument('configfile', nargs='?',
         help="configuration file to parse; if not specified print on stderr")
 
@@ -42,8 +59,10 @@ def parse_cmdline():
         help="database to read from (override config file)")
     parser.add_argument('--slot',
         help="the replication slot to connect to (override config file)")
-    parser.add_argument('--lsn', default='0/0',
-        help="the replication starting point [default: %(default)s]")
+    parser.add_argument('--lsn',
+        help="the replication starting point [default: where the consumer "
+            "has stopped, if it keeps track of it, else where the slot has "
+            "stopped]")
 
     g = parser.add_mutually_exclusive_group()
     g.add_argument('-v', '--verbose', dest='loglevel',
@@ -38,13 +38,17 @@ def make_receiver(config, dsn=None, slot=None):
     except ConfigError as e:
         raise ConfigError("bad receiver configuration: %s" % e)
 
+    # A receiver not reading from a database, e.g. replaying a recording
+    required = getattr(obj, 'requires_connection', True)
+
     if dsn is not None:
         obj.dsn = dsn
     else:
         try:
             obj.dsn = config.pop('dsn')
         except KeyError:
-            raise ConfigError("no receiver dsn specified")
+            if required:
+                raise ConfigError("no receiver dsn specified")
 
     if slot is not None:
         obj.slot = slot
@@ -52,7 +56,8 @@ def make_receiver(config, dsn=None, slot=None):
         try:
             obj.slot = config.pop('slot')
         except KeyError:
-            raise ConfigError("no receiver slot specified")
+            if required:
+                raise ConfigError("no receiver slot specified")
 
     obj.plugin = config.pop('plugin', 'replisome')
 
@@ -1,10 +1,14 @@
+import json
+import numbers
+import binascii
+from io import BytesIO
 from operator import itemgetter
 
 import psycopg2.extras
 from psycopg2 import extensions as ext
 from psycopg2 import sql
 
-from replisome.errors import ReplisomeError
+from replisome.errors import ConfigError, ReplisomeError
 
 import logging
 logger = logging.getLogger('replisome.DataUpdater')
@@ -27,9 +31,39 @@ def tupgetter(*idxs):
         return itemgetter(*idxs)
 
 
+# Characters to escape in the COPY text format
+COPY_ESCAPES = {
+    ord(u'\\'): u'\\\\', ord(u'\t'): u'\\t', ord(u'\n'): u'\\n',
+    ord(u'\r'): u'\\r'}
+
+
+def copy_text(values):
+    """Return a record in COPY text format from a list of values."""
+    rv = []
+    for v in values:
+        if v is None:
+            rv.append('\\N')
+        elif v is True:
+            rv.append('t')
+        elif v is False:
+            rv.append('f')
+        elif isinstance(v, bytes):
+            rv.append('\\\\x' + binascii.b2a_hex(v).decode('ascii'))
+        elif isinstance(v, float):
+            rv.append(repr(v))
+        elif isinstance(v, numbers.Number):
+            rv.append(str(v))
+        else:
+            if not isinstance(v, type(u'')):
+                v = json.dumps(v)
+            rv.append(v.translate(COPY_ESCAPES))
+    return u'\t'.join(rv)
+
+
 class DataUpdater(object):
     def __init__(self, dsn, upsert=False,
-                 skip_missing_columns=False, skip_missing_tables=False):
+                 skip_missing_columns=False, skip_missing_tables=False,
+                 origin=None, track_progress=False):
         """
         Apply changes to a database receiving message from a replisome stream.
 
@@ -40,17 +74,36 @@ class DataUpdater(object):
             are found.
         :arg skip_missing_columns: If true records on non existing tables are
             dropped.
+        :arg origin: If not None, the name of a replication origin to set up
+            for the session (created if it doesn't exist), so that the changes
+            applied are not decoded by a slot with the 'only-local' option.
+        :arg track_progress: If true record the source position of every
+            transaction applied in the replication origin, in the same
+            transaction, so that replication can restart exactly from there
+            (see start_lsn()). It requires an origin and the messages to
+            contain the 'nextlsn' ('include-lsn' plugin option).
         """
+        if track_progress and origin is None:
+            raise ConfigError("track_progress requires an origin")
+
         self.dsn = dsn
         self.upsert = upsert
         self.skip_missing_columns = skip_missing_columns
         self.skip_missing_tables = skip_missing_tables
+        self.origin = origin
+        self.track_progress = track_progress
         self._connection = None
+        self._bulk_connection = None
 
         # Maps from the key() of the message to the columns and table key names
         self._colnames = {}
         self._keynames = {}
 
+        # Maps from the relation id to the (schema, table) names (with the
+        # 'relation-ids' plugin option, the names are only received in the
+        # first message about a relation).
+        self._relnames = {}
+
         # Maps from the key() of the message to the query to perform each
         # operation (insert, update, delete). The values are in the format
         # returned by _get_statement() and are invalidated when new colnames
@@ -58,14 +111,33 @@ class DataUpdater(object):
         # in the origin database).
         self._stmts = {'I': {}, 'U': {}, 'D': {}}
 
-    def get_connection(self):
-        cnn, self._connection = self._connection, None
+        # Maps from the key() of the message to the update statements for
+        # messages only containing some of the columns (with the
+        # 'update-changed-only' plugin option). Every value is a map from the
+        # tuple of the columns indexes to the statement.
+        self._partial_stmts = {}
+
+        # Maps from the key() of the message and its column names to the
+        # COPY statement to bulk load rows (see bulk_load()).
+        self._copy_stmts = {}
+
+    def get_connection(self, bulk=False):
+        """
+        Return a connection to the target database.
+
+        The connection to bulk load the data copied has no replication origin
+        set up: the copy can be run by many consumers in parallel.
+        """
+        if bulk:
+            cnn, self._bulk_connection = self._bulk_connection, None
+        else:
+            cnn, self._connection = self._connection, None
         if cnn is None:
-            cnn = self.connect()
+            cnn = self.connect(origin=not bulk)
 
         return cnn
 
-    def put_connection(self, cnn):
+    def put_connection(self, cnn, bulk=False):
         if cnn.closed:
             logger.info("discarding closed connection")
             return
@@ -80,13 +152,41 @@ class DataUpdater(object):
             logger.warn("rolling back transaction in status %s", status)
             cnn.rollback()
 
-        self._connection = cnn
+        if bulk:
+            self._bulk_connection = cnn
+        else:
+            self._connection = cnn
 
-    def connect(self):
+    def connect(self, origin=True):
         logger.info('connecting to target database at "%s"', self.dsn)
         cnn = psycopg2.connect(self.dsn)
+        if origin and self.origin is not None:
+            self.setup_origin(cnn)
         return cnn
 
+    def setup_origin(self, cnn):
+        """
+        Set up the replication origin for the session of a connection.
+        """
+        if cnn.server_version < 90500:
+            raise ReplisomeError(
+                "replication origins are only available from PostgreSQL 9.5")
+
+        logger.info('setting up replication origin "%s"', self.origin)
+        cur = cnn.cursor()
+        self._create_origin(cur)
+        cur.execute(
+            "select pg_replication_origin_session_setup(%s)", [self.origin])
+        cnn.commit()
+
+    def _create_origin(self, cur):
+        cur.execute("""
+            select pg_replication_origin_create(%(origin)s)
+            where not exists (
+                select 1 from pg_replication_origin
+                where roname = %(origin)s)
+            """, {'origin': self.origin})
+
     def process_message(self, msg):
         """
         Process an entire message returned by the source.
@@ -98,6 +198,9 @@ class DataUpdater(object):
             for ch in msg['tx']:
                 self.process_change(cnn, ch)
 
+            if self.track_progress:
+                self.save_progress(cnn, msg)
+
             cnn.commit()
         finally:
             self.put_connection(cnn)
@@ -105,13 +208,145 @@ class DataUpdater(object):
     def __call__(self, msg):
         self.process_message(msg)
 
+    def bulk_load(self, msg):
+        """
+        Load the rows copied by the initial data sync.
+
+        The message only contains inserts: the rows of the same table are
+        loaded using COPY, in a single transaction. Upserting requires
+        processing the changes as usual. The changes are not marked with the
+        replication origin and no progress is recorded: see set_progress().
+        """
+        cnn = self.get_connection(bulk=True)
+        try:
+            if self.upsert:
+                for ch in msg['tx']:
+                    self.process_change(cnn, ch)
+            else:
+                self._copy_changes(cnn, msg['tx'])
+
+            cnn.commit()
+        finally:
+            self.put_connection(cnn, bulk=True)
+
+    def _copy_changes(self, cnn, changes):
+        k = stmt = acc = None
+        rows = []
+        for ch in changes:
+            if 'colnames' in ch or self.key(ch) != k:
+                if rows:
+                    self._copy_rows(cnn, stmt, rows)
+                    rows = []
+                k = self.key(ch)
+                stmt, acc = self._get_copy(cnn, ch)
+
+            if stmt is not None:
+                rows.append(copy_text(acc(ch)))
+
+        if rows:
+            self._copy_rows(cnn, stmt, rows)
+
+    def _get_copy(self, cnn, msg):
+        """
+        Return the COPY statement to load the rows of a table.
+
+        Return a pair (sql, acc) as _get_statement().
+        """
+        k = self.key(msg)
+        if 'colnames' in msg:
+            self._colnames[k] = msg['colnames']
+
+        ck = (k, tuple(self._colnames[k]))
+        try:
+            return self._copy_stmts[ck]
+        except KeyError:
+            pass
+
+        rv = self.make_insert(cnn, msg, copy=True)
+        self._copy_stmts[ck] = rv
+        return rv
+
+    def _copy_rows(self, cnn, stmt, rows):
+        rows.append('')
+        data = '\n'.join(rows).encode(ext.encodings[cnn.encoding])
+        cur = cnn.cursor()
+        try:
+            cur.copy_expert(stmt, BytesIO(data))
+        except psycopg2.DatabaseError:
+            logger.error("error running the copy: %s", stmt)
+            raise
+        logger.debug("copy run: %s (%d rows)", stmt, len(rows) - 1)
+
+    def save_progress(self, cnn, msg):
+        """
+        Record the source position of a message in the replication origin.
+
+        The position is saved when the transaction is committed, atomically
+        with the changes applied.
+        """
+        if 'nextlsn' not in msg:
+            raise ReplisomeError(
+                "can't track progress: the message has no 'nextlsn'")
+
+        cur = cnn.cursor()
+        cur.execute(
+            "select pg_replication_origin_xact_setup(%s, %s)",
+            [msg['nextlsn'], msg.get('timestamp', 'now')])
+
+    def set_progress(self, lsn):
+        """
+        Record a source position in the origin, if tracking progress.
+
+        Used to record the point the data loaded by bulk_load() was copied
+        at. The origin must not be set up by any session: call it before
+        processing any message.
+        """
+        if not self.track_progress:
+            return
+
+        logger.info("recording position %s in origin %s", lsn, self.origin)
+        cnn = self.connect(origin=False)
+        try:
+            cur = cnn.cursor()
+            self._create_origin(cur)
+            cur.execute(
+                "select pg_replication_origin_advance(%s, %s)",
+                [self.origin, lsn])
+            cnn.commit()
+        finally:
+            cnn.close()
+
+    def start_lsn(self):
+        """
+        Return the position to start replication from.
+
+        Return the position of the last transaction applied if tracking
+        progress, otherwise None.
+        """
+        if not self.track_progress:
+            return None
+
+        cnn = self.get_connection()
+        try:
+            cur = cnn.cursor()
+            cur.execute(
+                "select pg_replication_origin_progress(%s, true)",
+                [self.origin])
+            rv = cur.fetchone()[0]
+            cnn.commit()
+        finally:
+            self.put_connection(cnn)
+
+        logger.info("last position applied: %s", rv)
+        return rv
+
     def process_change(self, cnn, msg):
         """
         Process one of the changes in a replisome message.
         """
         stmt, acc = self._get_statement(cnn, msg)
         if stmt is None:
-            logger.debug("skipping message on %s", msg['table'])
+            logger.debug("skipping message on %s", self.key(msg))
             return
 
         cur = cnn.cursor()
@@ -131,11 +366,19 @@ class DataUpdater(object):
         query argument.
         """
         k = self.key(msg)
+        if 'relid' in msg and 'table' in msg:
+            logger.debug("got relation %s for table %s", k, msg['table'])
+            self._relnames[k] = (msg.get('schema'), msg['table'])
+            for stmts in self._stmts.values():
+                stmts.pop(k, None)
+            self._partial_stmts.pop(k, None)
+
         if 'colnames' in msg:
             logger.debug("got new columns for table %s", k)
             if k in self._colnames:
                 self._stmts['I'].pop(k, None)
                 self._stmts['U'].pop(k, None)
+                self._partial_stmts.pop(k, None)
             self._colnames[k] = msg['colnames']
 
         if 'keynames' in msg:
@@ -143,6 +386,7 @@ class DataUpdater(object):
             if k in self._keynames:
                 self._stmts['U'].pop(k, None)
                 self._stmts['D'].pop(k, None)
+                self._partial_stmts.pop(k, None)
             self._keynames[k] = msg['keynames']
 
         rv = self._get_special_statement(cnn, msg)
@@ -150,6 +394,9 @@ class DataUpdater(object):
             return rv
 
         op = msg['op']
+        if op == 'U' and 'colidxs' in msg:
+            return self._get_partial_update(cnn, msg)
+
         stmts = self._stmts[op]
         try:
             rv = stmts[k]
@@ -171,14 +418,32 @@ class DataUpdater(object):
             unchs = [i for (i, v) in enumerate(msg['values'])
                      if v == UNCHANGED_TOAST]
             if unchs:
-                return self.make_update(cnn, msg, unchanged_idxs=unchs)
+                return self.make_update(cnn, msg, unchanged_idxs=unchs,
+                                        colidxs=msg.get('colidxs'))
+
+    def _get_partial_update(self, cnn, msg):
+        """
+        Return the statement to process an update with only some columns.
+
+        The statements are cached by the set of columns received.
+        """
+        stmts = self._partial_stmts.setdefault(self.key(msg), {})
+        colidxs = tuple(msg['colidxs'])
+        try:
+            rv = stmts[colidxs]
+        except KeyError:
+            rv = stmts[colidxs] = self.make_update(
+                cnn, msg, colidxs=colidxs)
 
-    def make_insert(self, cnn, msg):
+        return rv
+
+    def make_insert(self, cnn, msg, copy=False):
         """
         Return the query and message-to-argument function to perform an insert.
+
+        :arg copy: if true return a ``COPY FROM STDIN`` statement instead.
         """
-        s = msg.get('schema')
-        t = msg['table']
+        s, t = self.table_names(msg)
         local_cols = self.get_table_columns(cnn, s, t)
         if local_cols is None:
             if not self.skip_missing_tables:
@@ -229,13 +494,19 @@ class DataUpdater(object):
 
         cols = colmap(msg_cols)
 
-        bits = [sql.SQL('insert into ')]
-        if 'schema' in msg:
-            bits.append(sql.Identifier(msg['schema']))
+        bits = [sql.SQL(copy and 'copy ' or 'insert into ')]
+        if s is not None:
+            bits.append(sql.Identifier(s))
             bits.append(sql.SQL('.'))
-        bits.append(sql.Identifier(msg['table']))
+        bits.append(sql.Identifier(t))
         bits.append(sql.SQL(' ('))
         bits.append(sql.SQL(',').join(map(sql.Identifier, cols)))
+        if copy:
+            bits.append(sql.SQL(') from stdin'))
+            stmt = sql.Composed(bits).as_string(cnn)
+            logger.debug("generated copy: %s", stmt)
+            return stmt, acc
+
         bits.append(sql.SQL(') values ('))
         bits.append(sql.SQL(',').join(sql.Placeholder() * len(cols)))
         bits.append(sql.SQL(')'))
@@ -262,12 +533,16 @@ class DataUpdater(object):
 
         return stmt, acc
 
-    def make_update(self, cnn, msg, unchanged_idxs=()):
+    def make_update(self, cnn, msg, unchanged_idxs=(), colidxs=None):
         """
         Return the query and message-to-argument function to perform an update.
+
+        :arg unchanged_idxs: indexes of the values not to update.
+        :arg colidxs: if not None, the indexes of the columns the values in
+            the message refer to (if the message only contains the columns
+            changed).
         """
-        s = msg.get('schema')
-        t = msg['table']
+        s, t = self.table_names(msg)
         local_cols = self.get_table_columns(cnn, s, t)
         if local_cols is None:
             if not self.skip_missing_tables:
@@ -280,6 +555,8 @@ class DataUpdater(object):
         local_cols = set(local_cols)
         msg_cols = self._colnames[self.key(msg)]
         msg_keys = self._keynames[self.key(msg)]
+        if colidxs is not None:
+            msg_cols = [msg_cols[i] for i in colidxs]
 
         if not self.skip_missing_columns:
             missing = set(msg_cols) - local_cols
@@ -307,22 +584,34 @@ class DataUpdater(object):
 
         colmap = tupgetter(*idxs)
         keymap = tupgetter(*kidxs)
+        keycols = keymap(msg_keys)
+
+        # If the key is unchanged the message may have no oldkey
+        # ('omit-unchanged-key' plugin option): take it from the values.
+        try:
+            valkeymap = tupgetter(*[msg_cols.index(c) for c in keycols])
+        except ValueError:
+            valkeymap = None
 
         logger.debug(
             "the local table has %d field in common with the message",
             len(idxs))
 
-        def acc(msg, _colmap=colmap, _keymap=keymap):
-            return _colmap(msg['values']) + _keymap(msg['oldkey'])
+        def acc(msg, _colmap=colmap, _keymap=keymap, _valkeymap=valkeymap):
+            if 'oldkey' in msg:
+                return _colmap(msg['values']) + _keymap(msg['oldkey'])
+            if _valkeymap is None:
+                raise ReplisomeError(
+                    "update message on table %s.%s has no key" % (s, t))
+            return _colmap(msg['values']) + _valkeymap(msg['values'])
 
         cols = colmap(msg_cols)
-        keycols = keymap(msg_keys)
 
         bits = [sql.SQL('update ')]
-        if 'schema' in msg:
-            bits.append(sql.Identifier(msg['schema']))
+        if s is not None:
+            bits.append(sql.Identifier(s))
             bits.append(sql.SQL('.'))
-        bits.append(sql.Identifier(msg['table']))
+        bits.append(sql.Identifier(t))
         bits.append(sql.SQL(' set ('))
         bits.append(sql.SQL(',').join(map(sql.Identifier, cols)))
         bits.append(sql.SQL(') = ('))
@@ -343,8 +632,7 @@ class DataUpdater(object):
         """
         Return the query and message-to-argument function to perform a delete.
         """
-        s = msg.get('schema')
-        t = msg['table']
+        s, t = self.table_names(msg)
         local_cols = self.get_table_columns(cnn, s, t)
         if local_cols is None:
             if not self.skip_missing_tables:
@@ -375,10 +663,10 @@ class DataUpdater(object):
         keycols = keymap(msg_keys)
 
         bits = [sql.SQL('delete from ')]
-        if 'schema' in msg:
-            bits.append(sql.Identifier(msg['schema']))
+        if s is not None:
+            bits.append(sql.Identifier(s))
             bits.append(sql.SQL('.'))
-        bits.append(sql.Identifier(msg['table']))
+        bits.append(sql.Identifier(t))
         bits.append(sql.SQL(' where ('))
         bits.append(sql.SQL(',').join(map(sql.Identifier, keycols)))
         bits.append(sql.SQL(') = ('))
@@ -466,4 +754,17 @@ class DataUpdater(object):
 
     def key(self, msg):
         """Return a key to identify a table from a message."""
+        if 'relid' in msg:
+            return msg['relid']
         return (msg.get('schema'), msg['table'])
+
+    def table_names(self, msg):
+        """Return the (schema, table) names of the table of a message."""
+        if 'table' in msg:
+            return (msg.get('schema'), msg['table'])
+
+        try:
+            return self._relnames[msg['relid']]
+        except KeyError:
+            raise ReplisomeError(
+                "received message about unknown relation %s" % msg['relid'])
@@ -5,7 +5,14 @@ import json
 class Printer(object):
     """
     Print the data received on stdout.
+
+    The messages received undecoded are printed as they are.
     """
+    accepts_raw = True
+
     def __call__(self, msg):
-        json.dump(msg, sys.stdout)
+        if isinstance(msg, bytes):
+            sys.stdout.write(msg.decode('ascii'))
+        else:
+            json.dump(msg, sys.stdout)
         sys.stdout.write('\n')
@@ -36,6 +36,10 @@ class TableRenamer(object):
 
     def process_message(self, msg):
         for ch in msg['tx']:
+            # With the 'relation-ids' plugin option the names are only in
+            # the first change of a relation: the others refer to it by id.
+            if 'table' not in ch:
+                continue
             if self.from_table is not None:
                 if self.from_table != ch['table']:
                     continue
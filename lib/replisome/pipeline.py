@@ -3,6 +3,19 @@ import psycopg2
 from .errors import ReplisomeError
 from .version import check_version
 
+import logging
+logger = logging.getLogger('replisome.pipeline')
+
+
+def accepts_raw(filters, consumer):
+    """
+    Return True if filters and consumer accept the messages undecoded.
+
+    Filters and consumers declare it with a true `accepts_raw` attribute.
+    """
+    return getattr(consumer, 'accepts_raw', False) \
+        and all(getattr(f, 'accepts_raw', False) for f in filters)
+
 
 class Pipeline(object):
     """A chain of operations on a stream of changes"""
@@ -26,8 +39,19 @@ class Pipeline(object):
         if not self.consumer:
             raise ValueError("can't start: no consumer")
 
-        self.verify_version()
+        if getattr(self.receiver, 'requires_connection', True):
+            self.verify_version()
+
+        # The consumer may know where it has stopped
+        if lsn is None and hasattr(self.consumer, 'start_lsn'):
+            lsn = self.consumer.start_lsn()
+
         self.receiver.message_cb = self.process_message
+        if hasattr(self.receiver, 'raw'):
+            self.receiver.raw = accepts_raw(self.filters, self.consumer) \
+                and self.receiver.can_pass_raw()
+            if self.receiver.raw:
+                logger.info("passing the messages undecoded to the consumer")
         cnn = self.receiver.create_connection()
 
         self.state = self.RUNNING
@@ -48,6 +72,24 @@ class Pipeline(object):
 
         self.consumer(msg)
 
+    def process_bulk(self, msg):
+        """
+        Process a message of rows copied by the initial data sync.
+
+        The message goes through the filters as any other, then to the
+        consumer bulk_load() method, if it has one.
+        """
+        for f in self.filters:
+            msg = f(msg)
+            if msg is None:
+                return
+
+        bulk_load = getattr(self.consumer, 'bulk_load', None)
+        if bulk_load is not None:
+            bulk_load(msg)
+        else:
+            self.consumer(msg)
+
     def verify_version(self):
         cnn = psycopg2.connect(self.receiver.dsn)
         cur = cnn.cursor()
@@ -1,20 +1,32 @@
 import os
+import re
 import json
+import zlib
+import struct
+import binascii
 from select import select
 
 import psycopg2
 from psycopg2.extras import LogicalReplicationConnection, wait_select
 from psycopg2 import sql
 
-from replisome.errors import ConfigError
+from replisome.errors import ConfigError, ReplisomeError
 
 import logging
 logger = logging.getLogger('replisome.JsonReceiver')
 
+# The keys of the messages to process even when passing them raw. A key
+# followed by a colon can't be found in the data: quotes in the values are
+# escaped.
+SPECIAL_KEYS_RE = re.compile(br'"(?:heartbeat|stats|stream)":')
+
 
 class JsonReceiver(object):
+    # False if the receiver doesn't read from a database
+    requires_connection = True
+
     def __init__(self, slot=None, dsn=None, message_cb=None,
-            plugin="replisome", options=None):
+            plugin="replisome", options=None, decode_bytea=False):
         self.slot = slot
         self.dsn = dsn
         self.plugin = plugin
@@ -26,17 +38,59 @@ class JsonReceiver(object):
 
         self._chunks = []
 
+        # In ndjson every message is a record: the transaction being received
+        opts = dict(self.options)
+        self._ndjson = 'ndjson' in opts \
+            and opts['ndjson'] in (None, 't', 'true', 'on', '1')
+        self._tx = None
+
+        # Transactions in progress may be streamed and assembled here
+        self._stream_changes = 'stream-changes' in opts \
+            and opts['stream-changes'] in (None, 't', 'true', 'on', '1')
+
+        # Changes of the transactions streamed while in progress, by xid
+        self._streams = {}
+
+        # Convert the bytea values received to bytes
+        self.decode_bytea = decode_bytea
+        self._bytea_a2b = dict(self.options).get('bytea-format') == 'base64' \
+            and binascii.a2b_base64 or binascii.a2b_hex
+
+        # Positions of the bytea columns and key columns, by table
+        self._bytea_cols = {}
+        self._bytea_keys = {}
+
+        # If set, a RecordWriter saving the messages received
+        self.recorder = None
+
+        # If true pass the messages to message_cb() undecoded, as received
+        # (only if can_pass_raw())
+        self.raw = False
+
     @classmethod
     def from_config(cls, config):
         opts = []
         # TODO: make them the same (parse the underscore version in the plugin)
         for k in ('pretty_print', 'include_xids', 'include_lsn',
                   'include_timestamp', 'include_schemas', 'include_types',
-                  'include_empty_xacts'):
+                  'include_empty_xacts', 'update_changed_only',
+                  'omit_unchanged_key', 'stream_changes', 'relation_ids',
+                  'only_local', 'ndjson'):
             if k in config:
                 v = config.pop(k)
                 opts.append((k.replace('_', '-'), (v and 't' or 'f')))
 
+        for k in ('chunk_size', 'compression', 'compression_level',
+                  'compression_threshold', 'heartbeat_xacts',
+                  'heartbeat_interval', 'bytea_format', 'stats_interval'):
+            if k in config:
+                opts.append((k.replace('_', '-'), str(config.pop(k))))
+
+        decode_bytea = config.pop('decode_bytea', False)
+        if decode_bytea and ('include-types', 'f') in opts:
+            raise ConfigError(
+                "decode_bytea needs the types: include_types can't be false")
+
         incs = config.pop('includes', [])
         if not isinstance(incs, list):
             raise ConfigError('includes should be a list, got %s' % (incs,))
@@ -51,7 +105,17 @@ class JsonReceiver(object):
                 "unknown %s option entries: %s" %
                 (cls.__name__, ', '.join(sorted(config))))
 
-        return cls(options=opts)
+        return cls(options=opts, decode_bytea=decode_bytea)
+
+    def can_pass_raw(self):
+        """
+        Return True if the messages can be passed undecoded to message_cb().
+
+        The ndjson records and the streamed transactions are assembled in
+        new messages, and decoding the bytea values changes them: in these
+        cases the messages are always decoded.
+        """
+        return not (self._ndjson or self._stream_changes or self.decode_bytea)
 
     def __del__(self):
         self.stop()
@@ -136,22 +200,199 @@ class JsonReceiver(object):
                 logger.debug("server: %s", n.rstrip())
             del cnn.notices[:]
 
-        chunk = msg.payload.decode('ascii')
+        if self.recorder is not None:
+            self.recorder.write_message(msg)
+
+        chunk = self.decompress(msg.payload)
         logger.debug(
             "message received:\n\t%s%s",
-            chunk[:70], len(chunk) > 70 and '...' or '')
-        self._chunks.append(chunk)
+            chunk[:70].decode('ascii'), len(chunk) > 70 and '...' or '')
+        if self._ndjson:
+            self.consume_record(json.loads(chunk.decode('ascii')))
+        else:
+            self._chunks.append(chunk)
+            if chunk == b']}' or chunk == b'\t]\n}':
+                data = b''.join(self._chunks)
+                header = self._chunks[0]
+                del self._chunks[:]
+                if self.raw and not self.decode_bytea \
+                        and not SPECIAL_KEYS_RE.search(header):
+                    self.message_cb(data)
+                else:
+                    self.consume_message(json.loads(data.decode('ascii')))
+
+        msg.cursor.send_feedback(flush_lsn=msg.data_start)
 
-        if chunk == u']}' or chunk == u'\t]\n}':
-            obj = json.loads(''.join(self._chunks))
-            del self._chunks[:]
+    def consume_message(self, obj):
+        """
+        Process a complete message received from the plugin.
+        """
+        if obj.get('heartbeat'):
+            # Nothing to process: only confirm the position reached
+            logger.debug("heartbeat received at %s", obj['nextlsn'])
+        elif obj.get('stats'):
+            self.stats_cb(obj)
+        else:
+            if self.decode_bytea:
+                self.decode_bytea_values(obj)
+            if 'stream' in obj:
+                self.consume_stream(obj)
+            else:
+                self.message_cb(obj)
+
+    def consume_record(self, obj):
+        """
+        Process a record received in ndjson format.
+
+        Accumulate the changes between a begin and a commit record, then
+        pass a message containing all of them to message_cb(), as if the
+        transaction had been received in one go.
+        """
+        if obj.get('begin'):
+            del obj['begin']
+            obj['tx'] = []
+            self._tx = obj
+
+        elif 'op' in obj:
+            if self._tx is None:
+                raise ReplisomeError(
+                    "change received outside a transaction: %s" % obj)
+            self._tx['tx'].append(obj)
+
+        elif obj.get('commit'):
+            if self._tx is None:
+                raise ReplisomeError(
+                    "commit received outside a transaction: %s" % obj)
+            tx, self._tx = self._tx, None
+            self.consume_message(tx)
+
+        else:
+            self.consume_message(obj)
+
+    def decompress(self, payload):
+        """
+        Return the uncompressed content of a message received.
+
+        A compressed message starts with a nul byte, the compression method
+        and the size of the uncompressed data. Other messages are returned
+        unchanged.
+        """
+        if payload[:1] != b'\0':
+            return payload
+
+        method = payload[1:2]
+        size, = struct.unpack('!I', payload[2:6])
+        data = payload[6:]
+        if method == b'z':
+            rv = zlib.decompress(data)
+        elif method == b'l':
+            try:
+                import lz4.block
+            except ImportError:
+                raise ReplisomeError(
+                    "lz4 module needed to decompress the data received")
+            rv = lz4.block.decompress(data, uncompressed_size=size)
+        elif method == b's':
+            try:
+                import zstandard
+            except ImportError:
+                raise ReplisomeError(
+                    "zstandard module needed to decompress the data received")
+            rv = zstandard.ZstdDecompressor().decompress(
+                data, max_output_size=size)
+        else:
+            raise ReplisomeError(
+                "unknown compression method received: %r" % method)
+
+        if len(rv) != size:
+            raise ReplisomeError(
+                "bad compressed message: expected %d bytes, got %d"
+                % (size, len(rv)))
+
+        return rv
+
+    def decode_bytea_values(self, obj):
+        """
+        Convert in place the bytea values of the changes in a message to bytes.
+
+        The bytea columns are found in the ``coltypes`` and ``keytypes``,
+        which are only received the first time a table is seen, so their
+        position is remembered for the following changes.
+        """
+        for ch in obj['tx']:
+            key = ch.get('relid') or (ch.get('schema'), ch.get('table'))
+            if 'coltypes' in ch:
+                self._bytea_cols[key] = [
+                    i for i, t in enumerate(ch['coltypes']) if t == 'bytea']
+            if 'keytypes' in ch:
+                self._bytea_keys[key] = [
+                    i for i, t in enumerate(ch['keytypes']) if t == 'bytea']
+
+            cols = self._bytea_cols.get(key)
+            if cols and 'values' in ch:
+                if 'colidxs' in ch:
+                    cols = [n for n, i in enumerate(ch['colidxs'])
+                        if i in cols]
+                self._decode_values(ch['values'], cols)
+
+            cols = self._bytea_keys.get(key)
+            if cols and 'oldkey' in ch:
+                self._decode_values(ch['oldkey'], cols)
+
+    def _decode_values(self, values, cols):
+        a2b = self._bytea_a2b
+        for i in cols:
+            v = values[i]
+            # null or unchanged toast values are left alone
+            if isinstance(v, type(u'')):
+                values[i] = a2b(v)
+
+    def consume_stream(self, obj):
+        """
+        Process a message about a transaction streamed while in progress.
+
+        Accumulate the changes received until the transaction is committed,
+        then pass a message containing all of them to message_cb(), as if the
+        transaction had been received in one go.
+        """
+        xid = obj['xid']
+        kind = obj['stream']
+        if kind == 'block':
+            self._streams.setdefault(xid, []).extend(obj['tx'])
+
+        elif kind == 'abort':
+            subxid = obj.get('subxid')
+            if subxid is None:
+                logger.debug("discarding streamed transaction %s", xid)
+                self._streams.pop(xid, None)
+            elif xid in self._streams:
+                logger.debug(
+                    "discarding streamed subtransaction %s of %s", subxid, xid)
+                self._streams[xid] = [
+                    ch for ch in self._streams[xid] if ch['xid'] != subxid]
+
+        elif kind == 'commit':
+            changes = self._streams.pop(xid, None)
+            if not changes:
+                return
+
+            for ch in changes:
+                del ch['xid']
+
+            del obj['stream']
+            obj['tx'] = changes
             self.message_cb(obj)
 
-        msg.cursor.send_feedback(flush_lsn=msg.data_start)
+        else:
+            raise ReplisomeError(
+                "unknown stream message received: %s" % kind)
 
     def message_cb(self, obj):
         logger.info("message received: %s", obj)
 
+    def stats_cb(self, obj):
+        logger.info("stats received: %s", obj['tables'])
+
     def create_connection(self, async_=True):
         logger.info('connecting to source database at "%s"', self.dsn)
         cnn = psycopg2.connect(
@@ -0,0 +1,143 @@
+import time
+
+from replisome.errors import ConfigError
+from replisome.recording import RecordReader, parse_lsn
+from replisome.receivers.JsonReceiver import JsonReceiver
+
+import logging
+logger = logging.getLogger('replisome.ReplayReceiver')
+
+# The receiver attributes replaced skipping the messages before a position
+SKIP_ATTRS = ('message_cb', 'stats_cb', 'raw')
+
+
+class ReplayReceiver(JsonReceiver):
+    """
+    Receive the messages saved by ``replisome record`` from a file.
+
+    The options are the same of the `JsonReceiver`, and should match the
+    ones used to record the file, plus the `filename` to read and the
+    `speed` to replay it: ``max`` to replay as fast as possible, or a factor
+    of the recorded speed (1 to respect the recorded arrival times).
+    """
+    requires_connection = False
+
+    def __init__(self, filename=None, speed='max', **kwargs):
+        super(ReplayReceiver, self).__init__(**kwargs)
+        self.filename = filename
+        self.speed = speed
+        self._stopped = False
+
+    @classmethod
+    def from_config(cls, config):
+        filename = config.pop('filename', None)
+        if not filename:
+            raise ConfigError("no filename to replay specified")
+
+        speed = config.pop('speed', 'max')
+        if speed != 'max':
+            try:
+                speed = float(speed)
+                if speed <= 0:
+                    raise ValueError
+            except ValueError:
+                raise ConfigError(
+                    "speed should be 'max' or a positive number, got %r"
+                    % (speed,))
+
+        rv = super(ReplayReceiver, cls).from_config(config)
+        rv.filename = filename
+        rv.speed = speed
+        return rv
+
+    def create_connection(self, async_=True):
+        return None
+
+    def start(self, connection=None, create=False, lsn=None):
+        start_lsn = lsn and parse_lsn(lsn) or 0
+        cursor = ReplayCursor()
+        self._stopped = False
+
+        logger.info('replaying messages from "%s"', self.filename)
+        skipped = None
+        if start_lsn:
+            skipped = self._start_skipping()
+
+        try:
+            with open(self.filename, 'rb') as f:
+                wall0 = ts0 = None
+                for msg_lsn, timestamp, payload in RecordReader(f):
+                    if skipped is not None and msg_lsn >= start_lsn:
+                        self._stop_skipping(skipped)
+                        skipped = None
+
+                    if self.speed != 'max' and skipped is None:
+                        if ts0 is None:
+                            wall0, ts0 = time.time(), timestamp
+                        delay = wall0 + (timestamp - ts0) / self.speed \
+                            - time.time()
+                        if delay > 0:
+                            time.sleep(delay)
+
+                    self.consume(ReplayMessage(payload, cursor, msg_lsn))
+                    if self._stopped:
+                        break
+        finally:
+            if skipped is not None:
+                self._stop_skipping(skipped)
+
+        logger.info('replay of "%s" finished', self.filename)
+
+    def stop(self):
+        self._stopped = True
+
+    def _start_skipping(self):
+        """
+        Discard the messages completed until _stop_skipping() is called.
+
+        A message is recorded in several chunks (a transaction in several
+        records in ndjson, or in several messages if streamed): the records
+        are consumed as usual, so that a message completed after the
+        position is received whole, as the server does resuming replication.
+        The messages discarded are passed raw, if possible, to avoid parsing
+        them.
+
+        Return the callbacks to restore.
+        """
+        rv = dict((k, self.__dict__[k]) for k in SKIP_ATTRS
+                  if k in self.__dict__)
+        self.message_cb = self.stats_cb = self._discard
+        self.raw = True
+        return rv
+
+    def _stop_skipping(self, saved):
+        for k in SKIP_ATTRS:
+            if k in saved:
+                setattr(self, k, saved[k])
+            else:
+                delattr(self, k)
+
+    def _discard(self, obj):
+        pass
+
+
+class ReplayConnection(object):
+    def __init__(self):
+        self.notices = []
+
+
+class ReplayCursor(object):
+    """The bits of a replication cursor used by JsonReceiver.consume()."""
+    def __init__(self):
+        self.connection = ReplayConnection()
+
+    def send_feedback(self, **kwargs):
+        pass
+
+
+class ReplayMessage(object):
+    """The bits of a replication message used by JsonReceiver.consume()."""
+    def __init__(self, payload, cursor, data_start=0):
+        self.payload = payload
+        self.cursor = cursor
+        self.data_start = data_start
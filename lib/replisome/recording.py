@@ -0,0 +1,212 @@
+"""Record the data of a replication slot to a file, replay it.
+
+``replisome record`` saves the messages received from a slot, as sent by the
+plugin, to a file. ``replisome replay`` feeds a recording through a pipeline
+configuration, without connecting to the source database.
+"""
+
+import time
+import struct
+
+from .errors import ReplisomeError
+from .config import parse_yaml, make_pipeline, make_receiver
+from .pipeline import Pipeline
+
+import logging
+logger = logging.getLogger('replisome.recording')
+
+# The start of a recording file
+MAGIC = b'RSREC\x00\x01\n'
+
+# The header of every message: wal start, arrival timestamp, payload size
+HEADER = struct.Struct('!QdI')
+
+
+class RecordWriter(object):
+    """
+    Append the messages received from a slot to a recording file.
+
+    The file must be open in binary append mode. The messages are flushed
+    after every write, before their position is confirmed to the server.
+    """
+    def __init__(self, f):
+        self.f = f
+        f.seek(0, 2)
+        if f.tell() == 0:
+            f.write(MAGIC)
+
+    def write(self, lsn, timestamp, payload):
+        self.f.write(HEADER.pack(lsn, timestamp, len(payload)))
+        self.f.write(payload)
+        self.f.flush()
+
+    def write_message(self, msg):
+        """Write a message received by a replication cursor."""
+        self.write(msg.data_start, time.time(), msg.payload)
+
+
+class RecordReader(object):
+    """
+    Read the messages saved in a recording file.
+
+    Iterate on the (lsn, timestamp, payload) of the messages. A message
+    truncated at the end of the file (e.g. because the recording was
+    interrupted while writing it) is ignored.
+    """
+    def __init__(self, f):
+        self.f = f
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ReplisomeError(
+                "%s is not a replisome recording" % getattr(f, 'name', f))
+
+    def __iter__(self):
+        while 1:
+            header = self.f.read(HEADER.size)
+            if not header:
+                break
+            if len(header) == HEADER.size:
+                lsn, timestamp, size = HEADER.unpack(header)
+                payload = self.f.read(size)
+                if len(payload) == size:
+                    yield lsn, timestamp, payload
+                    continue
+
+            logger.warning("ignoring the truncated message at the end of %s",
+                getattr(self.f, 'name', self.f))
+            break
+
+
+def parse_lsn(s):
+    """Convert a LSN in the format XXX/XXX to an integer."""
+    try:
+        hi, lo = s.split('/')
+        return (int(hi, 16) << 32) + int(lo, 16)
+    except ValueError:
+        raise ReplisomeError("bad LSN: %r" % s)
+
+
+def record_main(args=None):
+    opt = parse_record_cmdline(args)
+    setup_logging(opt)
+
+    if opt.configfile:
+        conf = parse_yaml(opt.configfile)
+    else:
+        conf = {'receiver': {'class': 'JsonReceiver'}}
+
+    pl = Pipeline()
+    pl.receiver = make_receiver(
+        conf.get('receiver'), dsn=opt.dsn, slot=opt.slot)
+    pl.consumer = discard
+
+    with open(opt.output, 'ab') as f:
+        pl.receiver.recorder = RecordWriter(f)
+        logger.info("recording to %s", opt.output)
+        pl.start(lsn=opt.lsn)
+
+
+def discard(msg):
+    pass
+
+
+def replay_main(args=None):
+    opt = parse_replay_cmdline(args)
+    setup_logging(opt)
+
+    if opt.configfile:
+        conf = parse_yaml(opt.configfile)
+    else:
+        conf = {
+            'receiver': {'class': 'JsonReceiver'},
+            'consumer': {'class': 'Printer'}}
+
+    # Read from the file using the receiver options of the configuration
+    rconf = conf.get('receiver') or {'class': 'JsonReceiver'}
+    if rconf.get('class') not in ('JsonReceiver', 'ReplayReceiver'):
+        raise ReplisomeError(
+            "can only replay through a JsonReceiver, not %s"
+            % rconf.get('class'))
+
+    rconf['class'] = 'ReplayReceiver'
+    for k in ('dsn', 'slot', 'plugin'):
+        rconf.pop(k, None)
+    options = rconf.setdefault('options', {})
+    options['filename'] = opt.recording
+    options['speed'] = opt.speed
+    conf['receiver'] = rconf
+
+    pl = make_pipeline(conf)
+    pl.start(lsn=opt.lsn)
+
+
+def setup_logging(opt):
+    logging.basicConfig(
+        level=opt.loglevel,
+        format='%(asctime)s %(levelname)s %(message)s')
+
+
+def parse_record_cmdline(args=None):
+    from argparse import ArgumentParser
+    parser = ArgumentParser(prog='replisome record',
+        description="Save the data received from a replication slot to a "
+            "file, to replay it later.")
+    parser.add_argument('configfile', nargs='?',
+        help="configuration file whose receiver to use; the filters and "
+            "consumer are ignored")
+    parser.add_argument('-o', '--output', metavar='FILE', required=True,
+        help="the file to record to (appended if it exists)")
+
+    parser.add_argument('--dsn',
+        help="database to read from (override config file)")
+    parser.add_argument('--slot',
+        help="the replication slot to connect to (override config file)")
+    parser.add_argument('--lsn',
+        help="the replication starting point [default: where the slot has "
+            "stopped]")
+
+    add_logging_args(parser)
+    return parser.parse_args(args)
+
+
+def parse_replay_cmdline(args=None):
+    from argparse import ArgumentParser
+    parser = ArgumentParser(prog='replisome replay',
+        description="Feed the data saved by 'replisome record' to a "
+            "pipeline.")
+    parser.add_argument('recording',
+        help="the file to replay")
+    parser.add_argument('configfile', nargs='?',
+        help="configuration file of the pipeline; the receiver options "
+            "should match the ones used to record; if not specified print "
+            "on stdout")
+
+    parser.add_argument('--speed', default='max',
+        help="'max' to replay as fast as possible, or a factor of the "
+            "recorded speed (e.g. 1 to replay at the recorded pace, 2 twice "
+            "as fast) [default: %(default)s]")
+    parser.add_argument('--lsn',
+        help="skip the messages before this position [default: where the "
+            "consumer has stopped, if it keeps track of it]")
+
+    add_logging_args(parser)
+    opt = parser.parse_args(args)
+
+    if opt.speed != 'max':
+        try:
+            opt.speed = float(opt.speed)
+            if opt.speed <= 0:
+                raise ValueError
+        except ValueError:
+            parser.error("speed should be 'max' or a positive number")
+
+    return opt
+
+
+def add_logging_args(parser):
+    g = parser.add_mutually_exclusive_group()
+    g.add_argument('-v', '--verbose', dest='loglevel',
+        action='store_const', const=logging.DEBUG, default=logging.INFO,
+        help="print debugging information to stderr")
+    g.add_argument('-q', '--quiet', dest='loglevel',
+        action='store_const', const=logging.WARN,
+        help="minimal output on stderr")
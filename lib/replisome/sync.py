@@ -0,0 +1,770 @@
+"""Copy the data of the source database, then stream the following changes.
+
+``replisome sync`` creates the replication slot exporting its snapshot,
+copies the tables included by the receiver configuration, as seen by the
+snapshot, in parallel, then streams the changes from the point where the
+slot becomes consistent, so that no change is lost or applied twice.
+"""
+
+import re
+import copy
+import json
+import binascii
+import threading
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2 import extensions as ext
+from six.moves.queue import Queue, Empty
+
+from .errors import ConfigError, ReplisomeError
+from .config import parse_yaml, make_pipeline, make_consumer, make_filters
+from .pipeline import Pipeline
+from .recording import add_logging_args, setup_logging
+
+import logging
+logger = logging.getLogger('replisome.sync')
+
+# Types emitted by the plugin as JSON numbers and booleans, by oid
+INT_TYPES = (20, 21, 23, 26)        # int8, int2, int4, oid
+FLOAT_TYPES = (700, 701)            # float4, float8
+BOOL_TYPE = 16
+BYTEA_TYPE = 17
+
+# Integer types whose key ranges can be split
+SPLIT_TYPES = (20, 21, 23)
+
+# The standard hash function of a type, used by the plugin to partition keys
+HASH_PROC_SQL = """
+select ap.amproc::regproc::text
+from pg_opclass oc
+join pg_am am on am.oid = oc.opcmethod
+join pg_amproc ap on ap.amprocfamily = oc.opcfamily
+    and ap.amproclefttype = oc.opcintype
+    and ap.amprocrighttype = oc.opcintype
+    and ap.amprocnum = 1
+where am.amname = 'hash' and oc.opcdefault
+and (oc.opcintype = %(typid)s or exists (
+    select 1 from pg_cast
+    where castsource = %(typid)s and casttarget = oc.opcintype
+    and castmethod = 'b'))
+order by oc.opcintype = %(typid)s desc
+limit 1
+"""
+
+
+class SyncTable(object):
+    """
+    A table to copy, with the columns and the rows chosen by its include.
+    """
+    def __init__(self, oid, schema, table, root=False):
+        self.oid = oid
+        self.schema = schema
+        self.table = table
+        self.root = root
+
+        # The (name, type oid, type name) of the columns to copy
+        self.columns = []
+
+        # The (name, type oid) of the key columns, if any
+        self.key = []
+
+        # The row filter of the include, if any
+        self.where = None
+
+        # The condition choosing the rows of the key partition, if any
+        self.partition = None
+
+        # The estimated number of rows
+        self.rows = 0
+
+    def __repr__(self):
+        return "%s.%s" % (self.schema, self.table)
+
+
+class Syncer(object):
+    """
+    Copy in parallel the tables of a receiver configuration to pipelines.
+
+    The slot of the `receiver` is created exporting its snapshot, which is
+    then imported by `jobs` connections, each copying tables (or key ranges
+    of tables with more than `chunk_rows` rows) to a pipeline returned by
+    `make_job_pipeline`. The rows are passed to the pipeline process_bulk()
+    method in messages of `batch_rows` inserts.
+    """
+    def __init__(self, receiver, make_job_pipeline, jobs=4,
+                 chunk_rows=1000000, batch_rows=1000):
+        if jobs < 1 or chunk_rows < 1 or batch_rows < 1:
+            raise ConfigError("bad sync parameters")
+
+        self.receiver = receiver
+        self.make_job_pipeline = make_job_pipeline
+        self.jobs = jobs
+        self.chunk_rows = chunk_rows
+        self.batch_rows = batch_rows
+
+        opts = dict(receiver.options)
+        self.commands = parse_commands(receiver.options)
+        self.include_schemas = opts.get('include-schemas', 't') == 't'
+        self.include_types = opts.get('include-types', 't') == 't'
+        self.bytea_format = opts.get('bytea-format', 'hex')
+
+        # Consumers without a bulk load path are called one at a time
+        self._consumer_lock = threading.Lock()
+
+        self._connections = []
+        self._errors = []
+
+    def run(self):
+        """
+        Create the slot and copy the data. Return the slot consistent point.
+
+        If the copy fails the slot is dropped.
+        """
+        rcnn = self.receiver.create_connection(async_=False)
+        try:
+            lsn, snapshot = self.create_slot(rcnn)
+        except BaseException:
+            rcnn.close()
+            raise
+
+        # The snapshot is valid as long as the connection is open and idle
+        try:
+            self.copy_snapshot(snapshot)
+        except BaseException:
+            rcnn.close()
+            self.receiver.drop_slot()
+            raise
+
+        rcnn.close()
+        return lsn
+
+    def create_slot(self, rcnn):
+        """
+        Create the replication slot. Return its consistent point and snapshot.
+        """
+        logger.info(
+            'creating replication slot "%s" exporting its snapshot',
+            self.receiver.slot)
+        cur = rcnn.cursor()
+        cur.create_replication_slot(
+            self.receiver.slot, output_plugin=self.receiver.plugin)
+        slot, lsn, snapshot, plugin = cur.fetchone()
+        if not snapshot:
+            raise ReplisomeError("the slot has not exported a snapshot")
+
+        logger.info("slot consistent at %s, snapshot %s", lsn, snapshot)
+        return lsn, snapshot
+
+    def copy_snapshot(self, snapshot):
+        """Copy the tables included, as seen by a snapshot."""
+        cnn = self.connect(snapshot)
+        try:
+            tasks = self.plan(cnn)
+        finally:
+            cnn.close()
+
+        queue = Queue()
+        for task in tasks:
+            queue.put(task)
+
+        logger.info(
+            "copying %d tables in %d chunks using %d jobs",
+            len(set(t[0].oid for t in tasks)), len(tasks), self.jobs)
+
+        threads = []
+        for i in range(min(self.jobs, len(tasks))):
+            t = threading.Thread(
+                target=self._worker, args=(queue, snapshot))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+
+        for t in threads:
+            t.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+        logger.info("copy completed")
+
+    def connect(self, snapshot):
+        """Return a connection to the source database in a snapshot."""
+        cnn = psycopg2.connect(self.receiver.dsn)
+        cnn.set_client_encoding('UTF8')
+        cnn.set_session(
+            isolation_level=ext.ISOLATION_LEVEL_REPEATABLE_READ,
+            readonly=True)
+        cur = cnn.cursor()
+        cur.execute("set transaction snapshot %s", [snapshot])
+
+        # parse_bytea() expects the hex format, whatever the server default
+        cur.execute("set bytea_output = 'hex'")
+        return cnn
+
+    def _worker(self, queue, snapshot):
+        cnn = None
+        try:
+            cnn = self.connect(snapshot)
+            self._connections.append(cnn)
+            try:
+                pipeline = self.make_job_pipeline()
+                while not self._errors:
+                    try:
+                        table, cond = queue.get_nowait()
+                    except Empty:
+                        break
+                    self.copy_chunk(cnn, table, cond, pipeline)
+            finally:
+                cnn.close()
+
+        except Exception as e:
+            if not self._errors:
+                logger.error("error copying data: %s", e)
+            self._errors.append(e)
+
+            # Interrupt the other copies
+            for c in self._connections:
+                if c is not cnn and not c.closed:
+                    c.cancel()
+
+    def plan(self, cnn):
+        """
+        Return the chunks of the tables to copy.
+
+        Every chunk is a pair (table, condition), the condition choosing a
+        range of the key, or None. The biggest tables come first.
+        """
+        tables = self.get_tables(cnn)
+        tables.sort(key=lambda t: -t.rows)
+        tasks = []
+        for table in tables:
+            for cond in self.split_table(cnn, table):
+                tasks.append((table, cond))
+
+        return tasks
+
+    def get_tables(self, cnn):
+        """
+        Return the tables matched by the include and exclude commands.
+
+        The commands are evaluated as the plugin does: the last one matching
+        a table decides. The partitions of a table included ``via_root`` are
+        copied together with it.
+        """
+        matches = []
+        for kind, cmd in self.commands:
+            bits = []
+            if 'table' in cmd:
+                bits.append(sql.SQL("c.relname = {}").format(
+                    sql.Literal(cmd['table'])))
+            elif 'tables' in cmd:
+                bits.append(sql.SQL("c.relname ~ {}").format(
+                    sql.Literal(cmd['tables'])))
+            if 'schema' in cmd:
+                bits.append(sql.SQL("n.nspname = {}").format(
+                    sql.Literal(cmd['schema'])))
+            elif 'schemas' in cmd:
+                bits.append(sql.SQL("n.nspname ~ {}").format(
+                    sql.Literal(cmd['schemas'])))
+            if not bits:
+                raise ConfigError(
+                    "include command without table or schema: %s" % cmd)
+            matches.append(sql.SQL(' and ').join(bits))
+
+        if cnn.server_version >= 100000:
+            relkinds = "'r', 'p'"
+            root = sql.SQL("""
+                (with recursive tree (relid, root) as (
+                    select oid, oid from pg_class
+                    where relkind = 'p' and not relispartition
+                    union all
+                    select i.inhrelid, t.root
+                    from pg_inherits i join tree t on i.inhparent = t.relid)
+                select root from tree where relid = c.oid and relid <> root)
+                """)
+        else:
+            relkinds = "'r'"
+            root = sql.SQL("null::oid")
+
+        stmt = sql.SQL("""
+            select c.oid, n.nspname, c.relname, c.relkind, {root},
+                c.reltuples::bigint{matches}
+            from pg_class c
+            join pg_namespace n on n.oid = c.relnamespace
+            where c.relkind in ({relkinds}) and c.relpersistence = 'p'
+            and n.nspname not in ('pg_catalog', 'information_schema')
+            and n.nspname !~ '^pg_toast'
+            order by n.nspname, c.relname
+            """).format(
+                root=root, relkinds=sql.SQL(relkinds),
+                matches=sql.SQL('').join(
+                    sql.SQL(', ') + m for m in matches))
+
+        cur = cnn.cursor()
+        cur.execute(stmt)
+
+        # The include command chosen for every relation included
+        chosen = {}
+        rels = cur.fetchall()
+        for rel in rels:
+            cmd = self.choose_command(rel[6:])
+            if cmd is not None:
+                chosen[rel[0]] = cmd
+
+        rv = []
+        for oid, schema, table, relkind, rootid, rows in \
+                (rel[:6] for rel in rels):
+            if rootid is not None:
+                cmd = chosen.get(rootid)
+                if cmd is not None and cmd.get('via_root'):
+                    # copied with the root
+                    continue
+
+            cmd = chosen.get(oid)
+            if cmd is None:
+                continue
+            if relkind == 'p' and (rootid is not None
+                    or not cmd.get('via_root')):
+                # the partitions will be matched on their own
+                continue
+            if 'ops' in cmd and 'I' not in cmd['ops']:
+                logger.info(
+                    "table %s.%s not copied: inserts not in its ops",
+                    schema, table)
+                continue
+
+            t = SyncTable(oid, schema, table, root=(relkind == 'p'))
+            t.rows = rows
+            self.setup_table(cnn, t, cmd)
+            rv.append(t)
+
+        return rv
+
+    def choose_command(self, matches):
+        """
+        Return the include command choosing a table, None if excluded.
+
+        `matches` are the results of matching the table with the commands.
+        As in the plugin, if the first command is an exclude all the tables
+        are included before it.
+        """
+        if not self.commands:
+            return {}
+
+        rv = {} if self.commands[0][0] == 'exclude' else None
+        for (kind, cmd), match in zip(self.commands, matches):
+            if match:
+                rv = cmd if kind == 'include' else None
+
+        return rv
+
+    def setup_table(self, cnn, table, cmd):
+        """Choose the columns and the rows of a table to copy."""
+        cur = cnn.cursor()
+        cur.execute("""
+            select a.attnum, a.attname, a.atttypid, t.typname
+            from pg_attribute a join pg_type t on t.oid = a.atttypid
+            where a.attrelid = %s and a.attnum > 0 and not a.attisdropped
+            order by a.attnum
+            """, [table.oid])
+        atts = cur.fetchall()
+
+        # The replica identity index if set, else the primary key
+        cur.execute("""
+            select indkey::int2[] from pg_index
+            where indrelid = %s and (indisreplident or indisprimary)
+            order by indisreplident desc limit 1
+            """, [table.oid])
+        rec = cur.fetchone()
+        if rec is not None:
+            byattnum = dict((a[0], a) for a in atts)
+            table.key = [byattnum[n][1:3] for n in rec[0]]
+
+        if cmd.get('keys_only'):
+            if not table.key:
+                raise ReplisomeError(
+                    "table %s has keys_only but no key" % table)
+            keynames = [k[0] for k in table.key]
+            atts = [a for a in atts if a[1] in keynames]
+        if 'columns' in cmd:
+            atts = [a for a in atts if a[1] in cmd['columns']]
+        if 'skip_columns' in cmd:
+            atts = [a for a in atts if a[1] not in cmd['skip_columns']]
+
+        table.columns = [a[1:] for a in atts]
+        table.where = cmd.get('where')
+        if 'partition' in cmd:
+            table.partition = self.partition_cond(
+                cnn, table, cmd['partition'])
+
+    def partition_cond(self, cnn, table, partition):
+        """
+        Return the condition choosing the rows of a key hash partition.
+
+        The key is hashed as the plugin does: the hash of every column is
+        combined with the ones before, rotated left by one bit, by xor.
+        """
+        if not isinstance(partition, dict) or partition.get('by') != 'key':
+            raise ConfigError(
+                "bad partition for table %s: %s" % (table, partition))
+        modulus = partition.get('modulus')
+        remainder = partition.get('remainder')
+        if not isinstance(modulus, int) or not isinstance(remainder, int) \
+                or not 0 <= remainder < modulus:
+            raise ConfigError(
+                "bad partition for table %s: %s" % (table, partition))
+
+        if not table.key:
+            raise ReplisomeError(
+                "can't partition table %s: no key column" % table)
+
+        # Rotating the combined hash is the same as rotating each hash
+        # by the number of columns following it
+        cur = cnn.cursor()
+        terms = []
+        for i, (name, typid) in enumerate(table.key):
+            cur.execute(HASH_PROC_SQL, {'typid': typid})
+            rec = cur.fetchone()
+            if rec is None:
+                raise ReplisomeError(
+                    "can't partition table %s: no hash function for"
+                    " column %s" % (table, name))
+
+            h = sql.SQL("({}({})::bigint & 4294967295)").format(
+                sql.SQL(rec[0]), sql.Identifier(name))
+            shift = len(table.key) - 1 - i
+            if shift:
+                h = sql.SQL(
+                    "((({h} << {l}) | ({h} >> {r})) & 4294967295)").format(
+                    h=h, l=sql.Literal(shift), r=sql.Literal(32 - shift))
+            terms.append(h)
+
+        return sql.SQL("({}) % {} = {}").format(
+            sql.SQL(' # ').join(terms),
+            sql.Literal(modulus), sql.Literal(remainder))
+
+    def split_table(self, cnn, table):
+        """
+        Return the conditions splitting a table in chunks of about chunk_rows.
+
+        Only tables with a single integer key column can be split.
+        """
+        nchunks = (table.rows + self.chunk_rows - 1) // self.chunk_rows
+        if nchunks < 2 or len(table.key) != 1 \
+                or table.key[0][1] not in SPLIT_TYPES:
+            return [None]
+
+        key = sql.Identifier(table.key[0][0])
+        cur = cnn.cursor()
+        cur.execute(sql.SQL("select min({}), max({}) from {}").format(
+            key, key, self.table_name(table)))
+        lo, hi = cur.fetchone()
+        if lo is None:
+            return [None]
+
+        step = max((hi - lo + 1 + nchunks - 1) // nchunks, 1)
+        bounds = list(range(lo + step, hi + 1, step))
+        if not bounds:
+            return [None]
+
+        rv = [sql.SQL("{} < {}").format(key, sql.Literal(bounds[0]))]
+        for b0, b1 in zip(bounds, bounds[1:]):
+            rv.append(sql.SQL("{} >= {} and {} < {}").format(
+                key, sql.Literal(b0), key, sql.Literal(b1)))
+        rv.append(sql.SQL("{} >= {}").format(key, sql.Literal(bounds[-1])))
+
+        logger.debug("table %s split in %d chunks", table, len(rv))
+        return rv
+
+    def table_name(self, table):
+        return sql.SQL("{}.{}").format(
+            sql.Identifier(table.schema), sql.Identifier(table.table))
+
+    def copy_stmt(self, table, cond):
+        """
+        Return the COPY statement to read a chunk of a table.
+
+        The values are converted to text as the plugin does.
+        """
+        exprs = []
+        for name, typid, typname in table.columns:
+            col = sql.Identifier(name)
+            if typid == BYTEA_TYPE:
+                if self.receiver.decode_bytea:
+                    exprs.append(col)
+                elif self.bytea_format == 'base64':
+                    exprs.append(sql.SQL(
+                        "translate(encode({}, 'base64'), E'\\n', '')"
+                        ).format(col))
+                else:
+                    exprs.append(sql.SQL("encode({}, 'hex')").format(col))
+            else:
+                exprs.append(col)
+
+        conds = []
+        if table.where:
+            conds.append(sql.SQL('(%s)' % table.where))
+        if table.partition is not None:
+            conds.append(table.partition)
+        if cond is not None:
+            conds.append(cond)
+
+        bits = [
+            sql.SQL("copy (select "),
+            sql.SQL(', ').join(exprs),
+            sql.SQL(" from "),
+            sql.SQL(table.root and '' or 'only '),
+            self.table_name(table)]
+        if conds:
+            bits.append(sql.SQL(" where "))
+            bits.append(sql.SQL(' and ').join(conds))
+        bits.append(sql.SQL(") to stdout"))
+
+        return sql.Composed(bits)
+
+    def copy_chunk(self, cnn, table, cond, pipeline):
+        """Copy a chunk of a table to a pipeline."""
+        stmt = self.copy_stmt(table, cond).as_string(cnn)
+        logger.debug("copying: %s", stmt)
+
+        batch = ChangesBatch(
+            table, self.batch_rows, self.include_schemas, self.include_types,
+            lambda msg: self.process_bulk(pipeline, msg))
+        reader = CopyReader(
+            self.value_parsers(table), batch.add)
+
+        cur = cnn.cursor()
+        cur.copy_expert(stmt, reader)
+        reader.close()
+        batch.flush()
+
+        logger.info(
+            "copied %d rows from %s%s", batch.count, table,
+            cond is not None and " (%s)" % cond.as_string(cnn) or '')
+
+    def process_bulk(self, pipeline, msg):
+        if hasattr(pipeline.consumer, 'bulk_load'):
+            pipeline.process_bulk(msg)
+        else:
+            with self._consumer_lock:
+                pipeline.process_bulk(msg)
+
+    def value_parsers(self, table):
+        """Return the functions to convert the text of the values copied."""
+        rv = []
+        for name, typid, typname in table.columns:
+            if typid in INT_TYPES:
+                rv.append(int)
+            elif typid in FLOAT_TYPES:
+                rv.append(parse_float)
+            elif typid == BOOL_TYPE:
+                rv.append(parse_bool)
+            elif typid == BYTEA_TYPE and self.receiver.decode_bytea:
+                rv.append(parse_bytea)
+            else:
+                rv.append(None)
+
+        return rv
+
+
+class ChangesBatch(object):
+    """
+    Accumulate the rows of a table in messages of insert changes.
+
+    The first change of every message contains the column names (and types),
+    as the first change about a table emitted by the plugin.
+    """
+    def __init__(self, table, size, include_schemas, include_types, cb):
+        self.size = size
+        self.cb = cb
+        self.count = 0
+        self._changes = []
+
+        self._change = {'op': 'I', 'table': table.table}
+        if include_schemas:
+            self._change['schema'] = table.schema
+
+        self._first = dict(self._change)
+        self._first['colnames'] = [c[0] for c in table.columns]
+        if include_types:
+            self._first['coltypes'] = [c[2] for c in table.columns]
+
+    def add(self, values):
+        ch = dict(self._changes and self._change or self._first)
+        ch['values'] = values
+        self._changes.append(ch)
+        self.count += 1
+        if len(self._changes) >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self._changes:
+            msg = {'tx': self._changes}
+            self._changes = []
+            self.cb(msg)
+
+
+class CopyReader(object):
+    """
+    A file-like object receiving the output of ``COPY ... TO STDOUT``.
+
+    Parse the records received in text format and pass the list of their
+    values to `cb`, converted by the functions in `parsers` (None to leave
+    the value a string).
+    """
+    def __init__(self, parsers, cb):
+        self.parsers = [(i, f) for i, f in enumerate(parsers) if f]
+        self.cb = cb
+        self._buf = None
+
+    def write(self, data):
+        # Received as bytes unless psycopg decodes it (for text files)
+        if self._buf:
+            data = self._buf + data
+        lines = data.split(isinstance(data, bytes) and b'\n' or u'\n')
+        self._buf = lines.pop()
+        for line in lines:
+            if isinstance(line, bytes):
+                line = line.decode('utf8')
+            self.cb(self.parse_line(line))
+
+    def close(self):
+        if self._buf:
+            raise ReplisomeError("incomplete copy record received")
+
+    def parse_line(self, line):
+        rv = [parse_copy_field(f) for f in line.split(u'\t')]
+        for i, f in self.parsers:
+            if rv[i] is not None:
+                rv[i] = f(rv[i])
+        return rv
+
+
+_copy_escapes = {
+    u'b': u'\b', u'f': u'\f', u'n': u'\n', u'r': u'\r', u't': u'\t',
+    u'v': u'\v'}
+_copy_escape_re = re.compile(r'\\(.)')
+
+
+def _copy_unescape(m):
+    return _copy_escapes.get(m.group(1), m.group(1))
+
+
+def parse_copy_field(s):
+    """Convert a field in COPY text format to a string or None."""
+    if s == u'\\N':
+        return None
+    if u'\\' in s:
+        return _copy_escape_re.sub(_copy_unescape, s)
+    return s
+
+
+def parse_float(s):
+    # NaN and Infinity are not valid JSON: the plugin emits them as null
+    rv = float(s)
+    if rv != rv or rv in (float('inf'), float('-inf')):
+        return None
+    return rv
+
+
+def parse_bool(s):
+    return s == u't'
+
+
+def parse_bytea(s):
+    # bytea output in hex format: \x0123...
+    return binascii.a2b_hex(s[2:])
+
+
+def parse_commands(options):
+    """
+    Return the include and exclude commands in the receiver options.
+
+    Return a list of pairs (kind, command) with kind 'include' or 'exclude'.
+    """
+    rv = []
+    for k, v in options:
+        if k in ('include', 'exclude'):
+            rv.append((k, json.loads(v)))
+
+    return rv
+
+
+def main(args=None):
+    opt = parse_cmdline(args)
+    setup_logging(opt)
+
+    if opt.configfile:
+        conf = parse_yaml(opt.configfile)
+    else:
+        conf = {
+            'receiver': {'class': 'JsonReceiver'},
+            'consumer': {'class': 'Printer'}}
+
+    # Every job has its own filters and consumer: make them before the
+    # configuration is consumed by the stream pipeline.
+    def make_job_pipeline(_conf=copy.deepcopy(conf)):
+        pl = Pipeline()
+        pl.consumer = make_consumer(copy.deepcopy(_conf.get('consumer')))
+        for f in make_filters(copy.deepcopy(_conf.get('filters'))):
+            pl.filters.append(f)
+        return pl
+
+    pl = make_pipeline(conf, dsn=opt.dsn, slot=opt.slot)
+    pl.verify_version()
+
+    syncer = Syncer(
+        pl.receiver, make_job_pipeline, jobs=opt.jobs,
+        chunk_rows=opt.chunk_rows, batch_rows=opt.batch_rows)
+    lsn = syncer.run()
+
+    # The data copied is the state at the slot consistent point: record it
+    # as the position applied once all the jobs are done.
+    set_progress = getattr(pl.consumer, 'set_progress', None)
+    if set_progress is not None:
+        set_progress(lsn)
+
+    if opt.no_stream:
+        logger.info(
+            'data copied: start streaming from slot "%s" at %s',
+            pl.receiver.slot, lsn)
+        return
+
+    pl.start(lsn=lsn)
+
+
+def parse_cmdline(args=None):
+    from argparse import ArgumentParser
+    parser = ArgumentParser(prog='replisome sync',
+        description="Create a replication slot, copy the data of the tables "
+            "included by the configuration, then stream the changes.")
+    parser.add_argument('configfile', nargs='?',
+        help="configuration file of the pipeline; if not specified print "
+            "on stdout")
+
+    parser.add_argument('--dsn',
+        help="database to read from (override config file)")
+    parser.add_argument('--slot',
+        help="the replication slot to create (override config file)")
+
+    parser.add_argument('-j', '--jobs', type=int, default=4,
+        help="number of tables or chunks to copy in parallel "
+            "[default: %(default)s]")
+    parser.add_argument('--chunk-rows', type=int, default=1000000,
+        metavar='N',
+        help="split the tables bigger than this number of rows by key "
+            "ranges [default: %(default)s]")
+    parser.add_argument('--batch-rows', type=int, default=1000, metavar='N',
+        help="number of rows to pass to the consumer in every message "
+            "[default: %(default)s]")
+    parser.add_argument('--no-stream', action='store_true',
+        help="only copy the data, don't stream the changes after it")
+
+    add_logging_args(parser)
+    opt = parser.parse_args(args)
+
+    if opt.jobs < 1 or opt.chunk_rows < 1 or opt.batch_rows < 1:
+        parser.error("jobs and rows should be positive numbers")
+
+    return opt
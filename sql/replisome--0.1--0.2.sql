@@ -0,0 +1,10 @@
+\echo Use "ALTER EXTENSION replisome UPDATE TO '0.2'" to load this file. \quit
+
+create function replisome_slot_stats(
+    out slot_name name, out changes bigint, out excluded bigint,
+    out filtered bigint, out skipped_ops bigint, out bytes bigint,
+    out filter_time float8, out format_time float8,
+    out updated timestamptz)
+returns setof record
+as 'MODULE_PATHNAME'
+language c strict;
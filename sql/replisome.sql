@@ -1,3 +1,12 @@
 create function replisome_version() returns text
 as 'MODULE_PATHNAME'
 language c immutable strict;
+
+create function replisome_slot_stats(
+    out slot_name name, out changes bigint, out excluded bigint,
+    out filtered bigint, out skipped_ops bigint, out bytes bigint,
+    out filter_time float8, out format_time float8,
+    out updated timestamptz)
+returns setof record
+as 'MODULE_PATHNAME'
+language c strict;
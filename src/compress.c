@@ -0,0 +1,189 @@
+#include "compress.h"
+
+#ifdef HAVE_LIBZ
+#include <zlib.h>
+#endif
+
+#ifdef USE_LZ4
+#include <lz4.h>
+#endif
+
+#ifdef USE_ZSTD
+#include <zstd.h>
+#endif
+
+static void not_built_with(const char *name);
+
+
+/*
+ * Parse the name of a compression method
+ *
+ * Return false if the name is unknown. Raise an error if the method is known
+ * but the library was not available when building.
+ */
+bool
+cmp_parse_method(const char *name, CompressMethod *method)
+{
+	if (strcmp(name, "none") == 0)
+		*method = CMP_NONE;
+	else if (strcmp(name, "zlib") == 0)
+	{
+#ifndef HAVE_LIBZ
+		not_built_with(name);
+#endif
+		*method = CMP_ZLIB;
+	}
+	else if (strcmp(name, "lz4") == 0)
+	{
+#ifndef USE_LZ4
+		not_built_with(name);
+#endif
+		*method = CMP_LZ4;
+	}
+	else if (strcmp(name, "zstd") == 0)
+	{
+#ifndef USE_ZSTD
+		not_built_with(name);
+#endif
+		*method = CMP_ZSTD;
+	}
+	else
+		return false;
+
+	return true;
+}
+
+static void
+not_built_with(const char *name)
+{
+	ereport(ERROR,
+			(errcode(ERRCODE_FEATURE_NOT_SUPPORTED),
+			 errmsg("compression method \"%s\" not supported by this build",
+				 name)));
+}
+
+/*
+ * Raise an error if a compression level is not valid for a method
+ *
+ * Level 0 means the default level for the method. For lz4 the level is the
+ * "acceleration" factor: higher is faster and compresses less.
+ */
+void
+cmp_check_level(CompressMethod method, int level)
+{
+	int min = 0, max = 0;
+
+	switch (method)
+	{
+		case CMP_ZLIB:
+			min = 0;
+			max = 9;
+			break;
+		case CMP_LZ4:
+			min = 0;
+			max = 65537;
+			break;
+		case CMP_ZSTD:
+			min = 0;
+#ifdef USE_ZSTD
+			max = ZSTD_maxCLevel();
+#endif
+			break;
+		case CMP_NONE:
+			break;
+	}
+
+	if (level < min || level > max)
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+				 errmsg("compression level %d out of range, it should be between %d and %d",
+					 level, min, max)));
+}
+
+/*
+ * Compress the content of a buffer starting from a certain offset
+ *
+ * The content from 'start' onwards is replaced with a compressed message.
+ * Leave the buffer untouched and return false if compressing would make the
+ * data bigger.
+ */
+bool
+cmp_compress(StringInfo buf, int start, CompressMethod method, int level)
+{
+	const char *src = buf->data + start;
+	uint32		srclen = buf->len - start;
+	char	   *dest = NULL;
+	size_t		destlen = 0;
+	char		header[CMP_HEADER_SIZE];
+
+	switch (method)
+	{
+#ifdef HAVE_LIBZ
+		case CMP_ZLIB:
+		{
+			uLongf		zlen = compressBound(srclen);
+			int			rv;
+
+			dest = palloc(zlen);
+			rv = compress2((Bytef *) dest, &zlen, (const Bytef *) src, srclen,
+				level ? level : Z_DEFAULT_COMPRESSION);
+			if (rv != Z_OK)
+				elog(ERROR, "zlib compression failed: %d", rv);
+			destlen = zlen;
+			break;
+		}
+#endif
+#ifdef USE_LZ4
+		case CMP_LZ4:
+		{
+			int			lzlen = LZ4_compressBound(srclen);
+
+			dest = palloc(lzlen);
+			lzlen = LZ4_compress_fast(src, dest, srclen, lzlen,
+				level ? level : 1);
+			if (lzlen <= 0)
+				elog(ERROR, "lz4 compression failed");
+			destlen = lzlen;
+			break;
+		}
+#endif
+#ifdef USE_ZSTD
+		case CMP_ZSTD:
+		{
+			size_t		zslen = ZSTD_compressBound(srclen);
+
+			dest = palloc(zslen);
+			zslen = ZSTD_compress(dest, zslen, src, srclen,
+				level ? level : ZSTD_CLEVEL_DEFAULT);
+			if (ZSTD_isError(zslen))
+				elog(ERROR, "zstd compression failed: %s",
+					ZSTD_getErrorName(zslen));
+			destlen = zslen;
+			break;
+		}
+#endif
+		default:
+			elog(ERROR, "unexpected compression method: %d", (int) method);
+	}
+
+	if (destlen + CMP_HEADER_SIZE >= srclen)
+	{
+		pfree(dest);
+		return false;
+	}
+
+	header[0] = '\0';
+	header[1] = (char) method;
+	header[2] = (srclen >> 24) & 0xFF;
+	header[3] = (srclen >> 16) & 0xFF;
+	header[4] = (srclen >> 8) & 0xFF;
+	header[5] = srclen & 0xFF;
+
+	buf->len = start;
+	buf->data[buf->len] = '\0';
+	appendBinaryStringInfo(buf, header, CMP_HEADER_SIZE);
+	appendBinaryStringInfo(buf, dest, destlen);
+	pfree(dest);
+
+	return true;
+}
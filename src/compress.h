@@ -0,0 +1,27 @@
+#ifndef _COMPRESS_H_
+#define _COMPRESS_H_
+
+#include "postgres.h"
+
+#include "lib/stringinfo.h"
+
+/*
+ * A compressed message starts with a nul byte (which can't be found in the
+ * JSON output), the method char, the size of the uncompressed data as 4
+ * bytes in network order, then the compressed data.
+ */
+#define CMP_HEADER_SIZE 6
+
+typedef enum CompressMethod
+{
+	CMP_NONE = 0,
+	CMP_ZLIB = 'z',
+	CMP_LZ4 = 'l',
+	CMP_ZSTD = 's'
+} CompressMethod;
+
+bool cmp_parse_method(const char *name, CompressMethod *method);
+void cmp_check_level(CompressMethod method, int level);
+bool cmp_compress(StringInfo buf, int start, CompressMethod method, int level);
+
+#endif
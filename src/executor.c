@@ -83,6 +83,14 @@ create_estate_for_relation(Relation rel, bool hasTriggers)
 	return estate;
 }
 
+/*
+ * Prepare an expression context to evaluate expressions on a relation tuples.
+ *
+ * The context and its scan slot are meant to be reused for every tuple: the
+ * slot keeps a private copy of the tuple descriptor, so that it doesn't pin
+ * the relcache entry across transactions. Reset the context and clear the
+ * slot after each evaluation.
+ */
 ExprContext *
 prepare_per_tuple_econtext(EState *estate, TupleDesc tupdesc)
 {
@@ -93,19 +101,28 @@ prepare_per_tuple_econtext(EState *estate, TupleDesc tupdesc)
 
 	oldContext = MemoryContextSwitchTo(estate->es_query_cxt);
 	econtext->ecxt_scantuple = ExecInitExtraTupleSlot(estate);
+	ExecSetSlotDescriptor(econtext->ecxt_scantuple,
+		CreateTupleDescCopy(tupdesc));
 	MemoryContextSwitchTo(oldContext);
 
-	ExecSetSlotDescriptor(econtext->ecxt_scantuple, tupdesc);
-
 	return econtext;
 }
 
+/*
+ * Compile a row filter into an expression state.
+ *
+ * The state is allocated in the executor state memory, so it is compiled
+ * only once and released together with it.
+ */
 ExprState *
-prepare_row_filter(Node *row_filter)
+prepare_row_filter(Node *row_filter, EState *estate)
 {
 	ExprState  *exprstate;
 	Expr	   *expr;
 	Oid			exprtype;
+	MemoryContext	oldContext;
+
+	oldContext = MemoryContextSwitchTo(estate->es_query_cxt);
 
 	exprtype = exprType(row_filter);
 	expr = (Expr *) coerce_to_target_type(NULL,	/* no UNKNOWN params here */
@@ -125,6 +142,8 @@ prepare_row_filter(Node *row_filter)
 	expr = expression_planner(expr);
 	exprstate = ExecInitExpr(expr, NULL);
 
+	MemoryContextSwitchTo(oldContext);
+
 	return exprstate;
 }
 
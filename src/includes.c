@@ -6,6 +6,7 @@
 #include "executor.h"
 
 #include "catalog/pg_collation.h"
+#include "utils/builtins.h"
 #include "utils/lsyscache.h"
 #include "utils/rel.h"
 
@@ -19,6 +20,9 @@ static void cmds_push(InclusionCommands *cmds, InclusionCommand *cmd);
 static InclusionCommand *cmds_tail(InclusionCommands *cmds);
 static InclusionCommand *cmd_at_tail(InclusionCommands *cmds, CommandType type);
 
+static void parse_partition(DefElem *elem, Datum o, InclusionCommand *cmd);
+static void parse_ops(DefElem *elem, Datum o, InclusionCommand *cmd);
+
 static regex_t *re_compile(const char *p);
 static bool re_match(regex_t *re, const char *s);
 
@@ -121,6 +125,59 @@ inc_parse_include(DefElem *elem, InclusionCommands **cmds)
 		cmd->row_filter = s;
 		elog(DEBUG1, "command %d specifies a row filter \"%s\"", cmd->num, s);
 	}
+	if ((o = jbu_getattr_obj(jsonb, "partition"))) {
+		parse_partition(elem, o, cmd);
+	}
+	if ((o = jbu_getattr_obj(jsonb, "ops"))) {
+		parse_ops(elem, o, cmd);
+	}
+	if ((s = jbu_getattr_str(jsonb, "keys_only"))) {
+		if (!parse_bool(s, &cmd->keys_only)) {
+			ereport(ERROR,
+					(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+					 errmsg("member \"keys_only\" must be a boolean, in \"%s\"",
+						strVal(elem->arg))));
+		}
+		elog(DEBUG1, "command %d emits keys only: %d", cmd->num, cmd->keys_only);
+		pfree(s);
+	}
+	if ((s = jbu_getattr_str(jsonb, "via_root"))) {
+		if (!parse_bool(s, &cmd->via_root)) {
+			ereport(ERROR,
+					(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+					 errmsg("member \"via_root\" must be a boolean, in \"%s\"",
+						strVal(elem->arg))));
+		}
+#if PG_VERSION_NUM < 100000
+		if (cmd->via_root) {
+			ereport(ERROR,
+					(errcode(ERRCODE_FEATURE_NOT_SUPPORTED),
+					 errmsg("emitting partitions via their root requires PostgreSQL 10")));
+		}
+#endif
+		elog(DEBUG1, "command %d emits via root: %d", cmd->num, cmd->via_root);
+		pfree(s);
+	}
+	if (jbu_getattr_int(jsonb, "max_value_bytes", &cmd->max_value_bytes)) {
+		if (cmd->max_value_bytes <= 0) {
+			ereport(ERROR,
+					(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+					 errmsg("member \"max_value_bytes\" must be a positive integer, in \"%s\"",
+						strVal(elem->arg))));
+		}
+		elog(DEBUG1, "command %d truncates values longer than %d bytes",
+			cmd->num, cmd->max_value_bytes);
+	}
+	if ((o = jbu_getattr_obj(jsonb, "hash_columns"))) {
+		if (!jbu_is_type(o, "array")) {
+			ereport(ERROR,
+					(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+					 errmsg("member \"hash_columns\" must be a json array, in \"%s\"",
+						strVal(elem->arg))));
+		}
+		elog(DEBUG1, "command %d specifies columns to hash", cmd->num);
+		cmd->hash_columns = o;
+	}
 	pfree(DatumGetPointer(jsonb));
 }
 
@@ -153,6 +210,41 @@ inc_parse_exclude(DefElem *elem, InclusionCommands **cmds)
 					elem->defname, strVal(elem->arg))));
 	}
 
+	if (cmd->partition_modulus) {
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+				 errmsg("command \"%s\" cannot specify a partition, in \"%s\"",
+					elem->defname, strVal(elem->arg))));
+	}
+
+	if (cmd->keys_only) {
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+				 errmsg("command \"%s\" cannot specify keys_only, in \"%s\"",
+					elem->defname, strVal(elem->arg))));
+	}
+
+	if (cmd->via_root) {
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+				 errmsg("command \"%s\" cannot specify via_root, in \"%s\"",
+					elem->defname, strVal(elem->arg))));
+	}
+
+	if (cmd->max_value_bytes || cmd->hash_columns) {
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+				 errmsg("command \"%s\" cannot specify max_value_bytes or hash_columns, in \"%s\"",
+					elem->defname, strVal(elem->arg))));
+	}
+
+	if (cmd->ops) {
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+				 errmsg("command \"%s\" cannot specify operations, in \"%s\"",
+					elem->defname, strVal(elem->arg))));
+	}
+
 	switch (cmd->type)
 	{
 		case CMD_INCLUDE_TABLES:
@@ -170,6 +262,85 @@ inc_parse_exclude(DefElem *elem, InclusionCommands **cmds)
 			}
 }
 
+/* Parse the "partition" member of an include command */
+static void
+parse_partition(DefElem *elem, Datum o, InclusionCommand *cmd)
+{
+	char *s;
+
+	if (!jbu_is_type(o, "object")) {
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+				 errmsg("member \"partition\" must be a json object, in \"%s\"",
+					strVal(elem->arg))));
+	}
+
+	/* Only partitioning by key is currently supported */
+	s = jbu_getattr_str(o, "by");
+	if (s == NULL || strcmp(s, "key") != 0) {
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+				 errmsg("partition member \"by\" must be \"key\", in \"%s\"",
+					strVal(elem->arg))));
+	}
+	pfree(s);
+
+	if (!jbu_getattr_int(o, "modulus", &cmd->partition_modulus)
+			|| cmd->partition_modulus <= 0) {
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+				 errmsg("partition member \"modulus\" must be a positive integer, in \"%s\"",
+					strVal(elem->arg))));
+	}
+
+	if (!jbu_getattr_int(o, "remainder", &cmd->partition_remainder)
+			|| cmd->partition_remainder < 0
+			|| cmd->partition_remainder >= cmd->partition_modulus) {
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+				 errmsg("partition member \"remainder\" must be an integer between 0 and modulus - 1, in \"%s\"",
+					strVal(elem->arg))));
+	}
+
+	elog(DEBUG1, "command %d emits partition %d of %d", cmd->num,
+		cmd->partition_remainder, cmd->partition_modulus);
+}
+
+/* Parse the "ops" member of an include command */
+static void
+parse_ops(DefElem *elem, Datum o, InclusionCommand *cmd)
+{
+	int nops;
+	int i;
+
+	if (!jbu_is_type(o, "array") || (nops = jbu_array_len(o)) == 0) {
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+				 errmsg("member \"ops\" must be a non-empty json array, in \"%s\"",
+					strVal(elem->arg))));
+	}
+
+	for (i = 0; i < nops; i++) {
+		char *op = jbu_getitem_str(o, i);
+
+		if (op && strcmp(op, "I") == 0)
+			cmd->ops |= INC_OP_INSERT;
+		else if (op && strcmp(op, "U") == 0)
+			cmd->ops |= INC_OP_UPDATE;
+		else if (op && strcmp(op, "D") == 0)
+			cmd->ops |= INC_OP_DELETE;
+		else
+			ereport(ERROR,
+					(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+					 errmsg("member \"ops\" can only contain \"I\", \"U\", \"D\", in \"%s\"",
+						strVal(elem->arg))));
+
+		pfree(op);
+	}
+
+	elog(DEBUG1, "command %d emits operations %d", cmd->num, cmd->ops);
+}
+
 /* Return True if a table should be included in the output */
 bool
 inc_should_emit(InclusionCommands *cmds, Relation relation,
@@ -402,3 +573,24 @@ inc_include_column(InclusionCommand *cmd, const char *name)
 
 	return true;
 }
+
+bool
+inc_hash_column(InclusionCommand *cmd, const char *name)
+{
+	int i, ncols;
+
+	if (cmd == NULL || !cmd->hash_columns)
+		return false;
+
+	ncols = jbu_array_len(cmd->hash_columns);
+	for (i = 0; i < ncols; i ++) {
+		bool eq;
+		char *want = jbu_getitem_str(cmd->hash_columns, i);
+		eq = strcmp(name, want) == 0;
+		pfree(want);
+		if (eq)
+			return true;
+	}
+
+	return false;
+}
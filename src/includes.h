@@ -15,6 +15,11 @@ typedef enum
 } CommandType;
 
 
+/* Operations to emit, as bit flags */
+#define INC_OP_INSERT	(1 << 0)
+#define INC_OP_UPDATE	(1 << 1)
+#define INC_OP_DELETE	(1 << 2)
+
 typedef struct InclusionCommand
 {
 	int			num;				/* number of the command (for debug) */
@@ -28,6 +33,13 @@ typedef struct InclusionCommand
 	Datum		columns;			/* columns to include as jsonb list */
 	Datum		skip_columns;		/* columns to ignore as jsonb list */
 	char		*row_filter;		/* only emit records matching this check */
+	int			ops;				/* INC_OP_* to emit; 0 for all of them */
+	bool		keys_only;			/* only emit the key columns */
+	bool		via_root;			/* emit partitions as their root table */
+	int			max_value_bytes;	/* if > 0 truncate longer values */
+	Datum		hash_columns;		/* columns to emit as digest as jsonb list */
+	int			partition_modulus;	/* if > 0 only emit records whose key */
+	int			partition_remainder;	/* hash % modulus == remainder */
 } InclusionCommand;
 
 
@@ -42,6 +54,7 @@ void inc_parse_exclude(DefElem *elem, InclusionCommands **cmds);
 bool inc_should_emit(InclusionCommands *cmds, Relation relation,
 		InclusionCommand **chosen_by);
 bool inc_include_column(InclusionCommand *cmd, const char *name);
+bool inc_hash_column(InclusionCommand *cmd, const char *name);
 
 
 #endif
@@ -50,6 +50,32 @@ jbu_getattr_str(Datum jsonb, const char *attr)
 }
 
 
+/* Read an integer attribute into value. Return false if not found.
+ * Raise an error if the attribute is not an integer. */
+bool
+jbu_getattr_int(Datum jsonb, const char *attr, int *value)
+{
+	char *s;
+	char *end;
+	long l;
+
+	if ((s = jbu_getattr_str(jsonb, attr)) == NULL)
+		return false;
+
+	errno = 0;
+	l = strtol(s, &end, 10);
+	if (*s == '\0' || *end != '\0' || errno != 0 || l != (int)l)
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+				 errmsg("member \"%s\" must be an integer, got \"%s\"",
+					attr, s)));
+
+	pfree(s);
+	*value = (int)l;
+	return true;
+}
+
+
 Datum
 jbu_getattr_obj(Datum jsonb, const char *attr)
 {
@@ -7,6 +7,7 @@ Datum jbu_create(const char *s);
 bool jbu_is_type(Datum jsonb, const char *type);
 int jbu_array_len(Datum jsonb);
 char *jbu_getattr_str(Datum jsonb, const char *attr);
+bool jbu_getattr_int(Datum jsonb, const char *attr, int *value);
 Datum jbu_getattr_obj(Datum jsonb, const char *attr);
 char *jbu_getitem_str(Datum jsonb, int item);
 
@@ -6,8 +6,11 @@
 
 #include "catalog/pg_type.h"
 #include "lib/stringinfo.h"
+#include "utils/builtins.h"
 #include "utils/syscache.h"
+#include "utils/typcache.h"
 #include "access/htup_details.h"
+#include "access/tupconvert.h"
 
 
 HTAB *
@@ -99,6 +102,8 @@ reldata_free(JsonRelationEntry *entry)
 		pfree(entry->colidxs);
 	if (entry->keyidxs)
 		pfree(entry->keyidxs);
+	if (entry->hashed)
+		pfree(entry->hashed);
 
 	if (entry->keynames)
 		pfree(entry->keynames);
@@ -109,8 +114,17 @@ reldata_free(JsonRelationEntry *entry)
 	if (entry->coltypes)
 		pfree(entry->coltypes);
 
+	if (entry->keytypes_hash)
+		pfree(entry->keytypes_hash);
+
+	if (entry->root_map)
+		free_conversion_map(entry->root_map);
+
 	if (entry->estate)
+	{
+		ExecResetTupleTable(entry->estate->es_tupleTable, false);
 		FreeExecutorState(entry->estate);
+	}
 }
 
 
@@ -139,18 +153,35 @@ reldata_to_invalidate(HTAB *reldata)
 }
 
 
-/* Remove a table from the reldata to invalidate.
+/* Mark a table in the reldata to invalidate as stale.
  * This function is a callback to register with CacheRegisterRelcacheCallback
- * to receive invalidation information.
+ * to receive invalidation information. InvalidOid means all the tables.
+ *
+ * We cannot look at the catalog here: the entry is checked again by
+ * reldata_revalidate() when the next change to the table is decoded.
  */
 void
 reldata_invalidate(Datum arg, Oid relid)
 {
+	HASH_SEQ_STATUS status;
+	JsonRelationEntry *entry;
+
 	if (to_invalidate == NULL)
 		return;
 
-	if (reldata_remove(to_invalidate, relid)) {
-		elog(DEBUG1, "entry for relation %u removed", relid);
+	if (relid != InvalidOid)
+	{
+		entry = reldata_find(to_invalidate, relid);
+		if (entry) {
+			elog(DEBUG1, "entry for relation %u invalidated", relid);
+			entry->stale = true;
+		}
+		return;
+	}
+
+	hash_seq_init(&status, to_invalidate);
+	while ((entry = hash_seq_search(&status)) != NULL) {
+		entry->stale = true;
 	}
 }
 
@@ -159,6 +190,15 @@ static void find_columns_to_emit(JsonRelationEntry *entry,
 	TupleDesc tupdesc, TupleDesc indexdesc, int **dest);
 static void fill_output_fields(JsonRelationEntry *entry, TupleDesc tupdesc,
 	bool replident, bool pretty_print);
+static bool find_key_in_values(JsonRelationEntry *entry);
+static void find_hashed_columns(JsonRelationEntry *entry, TupleDesc tupdesc);
+static void prepare_key_hash(JsonRelationEntry *entry, Relation relation);
+static void find_output_columns(JsonRelationEntry *entry, Relation relation,
+	bool pretty_print);
+static void prepare_entry_row_filter(JsonRelationEntry *entry,
+	Relation relation);
+static bool strings_equal(const char *s1, const char *s2);
+static bool idxs_equal(const int *idxs1, const int *idxs2);
 
 
 /* Complete the configuration of a relation description.
@@ -166,30 +206,169 @@ static void fill_output_fields(JsonRelationEntry *entry, TupleDesc tupdesc,
 void
 reldata_complete(JsonRelationEntry *entry, Relation relation,
 	bool pretty_print)
+{
+	find_output_columns(entry, relation, pretty_print);
+
+	if (entry->chosen_by && entry->chosen_by->partition_modulus) {
+		prepare_key_hash(entry, relation);
+	}
+
+	prepare_entry_row_filter(entry, relation);
+}
+
+/* Check if a relation invalidated is still described by its entry.
+ * Invalidations are received for many reasons (ANALYZE, VACUUM, GRANT, index
+ * creation...) which don't change what we emit: if the table is still chosen
+ * by the same command, has the same name and the columns and key emitted are
+ * the same, keep the entry, so that the names are not emitted again.
+ * Otherwise reset the entry and return false: it will be completed again as
+ * if seen for the first time.
+ */
+bool
+reldata_revalidate(JsonRelationEntry *entry, Relation relation,
+	bool include, struct InclusionCommand *chosen_by, bool pretty_print)
+{
+	JsonRelationEntry fresh;
+	bool same;
+
+	entry->stale = false;
+
+	if (OidIsValid(entry->root_relid))
+		same = false;		/* cheap to route to the root again */
+	else if (entry->exclude)
+		same = !include;
+	else if (!entry->include)
+		same = true;		/* nothing decided yet */
+	else if (!include || entry->chosen_by != chosen_by)
+		same = false;
+	else
+	{
+		memset(&fresh, '\0', sizeof(JsonRelationEntry));
+		fresh.relid = entry->relid;
+		fresh.chosen_by = chosen_by;
+		find_output_columns(&fresh, relation, pretty_print);
+
+		same = (entry->relnamespace == fresh.relnamespace
+			&& strcmp(NameStr(entry->relname), NameStr(fresh.relname)) == 0
+			&& strings_equal(entry->colnames, fresh.colnames)
+			&& strings_equal(entry->coltypes, fresh.coltypes)
+			&& strings_equal(entry->keynames, fresh.keynames)
+			&& strings_equal(entry->keytypes, fresh.keytypes)
+			&& idxs_equal(entry->colidxs, fresh.colidxs)
+			&& idxs_equal(entry->keyidxs, fresh.keyidxs));
+
+		reldata_free(&fresh);
+	}
+
+	if (same)
+	{
+		elog(DEBUG1, "entry for relation %u still valid", entry->relid);
+
+		/* The executor state refers to the relation descriptor */
+		if (entry->estate)
+		{
+			ExecResetTupleTable(entry->estate->es_tupleTable, false);
+			FreeExecutorState(entry->estate);
+			entry->estate = NULL;
+			prepare_entry_row_filter(entry, relation);
+		}
+	}
+	else
+	{
+		elog(DEBUG1, "entry for relation %u reset", entry->relid);
+		reldata_free(entry);
+		memset(entry, '\0', sizeof(JsonRelationEntry));
+		entry->relid = RelationGetRelid(relation);
+	}
+
+	return same;
+}
+
+/* Find the columns to emit and prepare their names and types */
+static void
+find_output_columns(JsonRelationEntry *entry, Relation relation,
+	bool pretty_print)
 {
 	Relation indexrel;
 	TupleDesc tupdesc;
+	TupleDesc indexdesc = NULL;
 
-	tupdesc = RelationGetDescr(relation);
-	find_columns_to_emit(entry, tupdesc, NULL, &entry->colidxs);
-	fill_output_fields(entry, tupdesc, false, pretty_print);
+	namestrcpy(&entry->relname, RelationGetRelationName(relation));
+	entry->relnamespace = RelationGetNamespace(relation);
 
+	tupdesc = RelationGetDescr(relation);
 	indexrel = RelationIdGetRelation(relation->rd_replidindex);
 	if (indexrel != NULL)
+		indexdesc = RelationGetDescr(indexrel);
+
+	if (entry->chosen_by && entry->chosen_by->keys_only)
 	{
-		TupleDesc indexdesc = RelationGetDescr(indexrel);
+		if (indexrel == NULL)
+			ereport(ERROR,
+					(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+					 errmsg("can't emit only the key of table \"%s\": no replica identity index",
+						RelationGetRelationName(relation))));
+
+		/* The values only contain the key columns too */
+		find_columns_to_emit(entry, tupdesc, indexdesc, &entry->colidxs);
+	}
+	else
+		find_columns_to_emit(entry, tupdesc, NULL, &entry->colidxs);
+
+	if (indexrel != NULL)
 		find_columns_to_emit(
 			entry, tupdesc, indexdesc, &entry->keyidxs);
+
+	/* The digests are emitted as text: find them before the types */
+	find_hashed_columns(entry, tupdesc);
+
+	fill_output_fields(entry, tupdesc, false, pretty_print);
+
+	if (indexrel != NULL)
+	{
 		fill_output_fields(entry, tupdesc, true, pretty_print);
+		entry->key_in_values = find_key_in_values(entry);
 		RelationClose(indexrel);
 	}
+}
 
+/* Compile the row filter of the command that chose the table, if any */
+static void
+prepare_entry_row_filter(JsonRelationEntry *entry, Relation relation)
+{
 	if (entry->chosen_by && entry->chosen_by->row_filter) {
 		entry->row_filter = parse_row_filter(
 			relation, entry->chosen_by->row_filter);
-		entry->exprstate = prepare_row_filter(entry->row_filter);
 		entry->estate = create_estate_for_relation(relation, false);
+		entry->exprstate = prepare_row_filter(
+			entry->row_filter, entry->estate);
+		entry->econtext = prepare_per_tuple_econtext(
+			entry->estate, RelationGetDescr(relation));
+	}
+}
+
+static bool
+strings_equal(const char *s1, const char *s2)
+{
+	if (s1 == NULL || s2 == NULL)
+		return s1 == s2;
+
+	return strcmp(s1, s2) == 0;
+}
+
+static bool
+idxs_equal(const int *idxs1, const int *idxs2)
+{
+	if (idxs1 == NULL || idxs2 == NULL)
+		return idxs1 == idxs2;
+
+	for (; *idxs1 >= 0; idxs1++, idxs2++)
+	{
+		if (*idxs1 != *idxs2)
+			return false;
 	}
+
+	return *idxs2 < 0;
 }
 
 static void
@@ -229,7 +408,10 @@ fill_output_fields(JsonRelationEntry *entry, TupleDesc tupdesc,
 
 		/* Accumulate each column info */
 		appendStringInfo(&colnames, "%s\"%s\"", comma, NameStr(attr->attname));
-		appendStringInfo(&coltypes, "%s\"%s\"", comma, NameStr(type_form->typname));
+		if (!replident && entry->hashed && entry->hashed[natt])
+			appendStringInfo(&coltypes, "%s\"text\"", comma);
+		else
+			appendStringInfo(&coltypes, "%s\"%s\"", comma, NameStr(type_form->typname));
 
 		ReleaseSysCache(type_tuple);
 
@@ -302,3 +484,101 @@ find_columns_to_emit(JsonRelationEntry *entry,
 
 	*pdest = -1;     /* sentinel */
 }
+
+/* Return true if all the key columns are emitted in the values too */
+static bool
+find_key_in_values(JsonRelationEntry *entry)
+{
+	int *pkey;
+	int *pcol;
+
+	/* No key column emitted at all */
+	if (entry->keyidxs[0] < 0)
+		return false;
+
+	for (pkey = entry->keyidxs; *pkey >= 0; pkey++)
+	{
+		for (pcol = entry->colidxs; *pcol >= 0; pcol++)
+		{
+			if (*pcol == *pkey)
+				break;
+		}
+
+		if (*pcol < 0)
+			return false;
+	}
+
+	return true;
+}
+
+/* Mark the columns to emit as a digest of their value.
+ * The key columns are always emitted in full, to identify the records. */
+static void
+find_hashed_columns(JsonRelationEntry *entry, TupleDesc tupdesc)
+{
+	int *pcol;
+	int *pkey;
+
+	if (!(entry->chosen_by && entry->chosen_by->hash_columns))
+		return;
+
+	for (pcol = entry->colidxs; *pcol >= 0; pcol++)
+	{
+		Form_pg_attribute attr = tupdesc->attrs[*pcol];
+
+		if (!inc_hash_column(entry->chosen_by, NameStr(attr->attname)))
+			continue;
+
+		for (pkey = entry->keyidxs; pkey && *pkey >= 0; pkey++)
+		{
+			if (*pkey == *pcol)
+				break;
+		}
+
+		if (pkey && *pkey >= 0) {
+			elog(DEBUG1,
+				"key attribute \"%s\" not hashed", NameStr(attr->attname));
+			continue;
+		}
+
+		if (entry->hashed == NULL)
+			entry->hashed = palloc0(sizeof(bool) * tupdesc->natts);
+		entry->hashed[*pcol] = true;
+	}
+}
+
+/* Look up the hash functions of the key columns, used to partition records */
+static void
+prepare_key_hash(JsonRelationEntry *entry, Relation relation)
+{
+	TupleDesc tupdesc = RelationGetDescr(relation);
+	int nkeys;
+	int i;
+
+	if (entry->keyidxs == NULL || entry->keyidxs[0] < 0)
+		ereport(ERROR,
+				(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+				 errmsg("can't partition table \"%s\": no key column emitted",
+					RelationGetRelationName(relation))));
+
+	for (nkeys = 0; entry->keyidxs[nkeys] >= 0; nkeys++)
+		;
+
+	entry->keytypes_hash = palloc(sizeof(TypeCacheEntry *) * nkeys);
+
+	for (i = 0; i < nkeys; i++)
+	{
+		Form_pg_attribute attr = tupdesc->attrs[entry->keyidxs[i]];
+		TypeCacheEntry *typentry;
+
+		typentry = lookup_type_cache(attr->atttypid,
+			TYPECACHE_HASH_PROC_FINFO);
+		if (!OidIsValid(typentry->hash_proc_finfo.fn_oid))
+			ereport(ERROR,
+					(errcode(ERRCODE_UNDEFINED_FUNCTION),
+					 errmsg("could not identify a hash function for type %s",
+						format_type_be(attr->atttypid))));
+
+		entry->keytypes_hash[i] = typentry;
+	}
+}
@@ -9,6 +9,8 @@
 
 /* forward declarations */
 struct InclusionCommand;
+struct TupleConversionMap;
+struct RelStats;
 
 
 typedef struct JsonRelationEntry
@@ -19,12 +21,28 @@ typedef struct JsonRelationEntry
 	bool include;
 	bool exclude;
 
+	/* set on relcache invalidation: check again before using it */
+	bool stale;
+
 	/* who chose to include this table?
 	 * Can be NULL if configuration is pretty much empty. */
 	struct InclusionCommand *chosen_by;
 
 	int *colidxs;               /* indexes of columns to emit into tupdesc */
 	int *keyidxs;               /* indexes of attributes to emit into tupdesc */
+	bool *hashed;               /* by attribute: emit a digest of the value */
+
+	bool key_in_values;         /* true if all the key columns are emitted */
+
+	/* partition emitted as its root table, if valid */
+	Oid root_relid;
+	struct TupleConversionMap *root_map;	/* NULL if the layout is the same */
+
+	NameData relname;           /* name of the table emitted */
+	Oid relnamespace;           /* schema of the table emitted */
+
+	uint32 relnum;              /* id of the relation in the session */
+	bool relname_emitted;       /* true if schema/table have been emitted */
 
 	bool names_emitted;         /* true if table names have been emitted */
 	bool key_emitted;           /* true if table key names have been emitted */
@@ -35,10 +53,17 @@ typedef struct JsonRelationEntry
 	char *colnames;
 	char *coltypes;
 
+	/* Hash functions of the key columns, to partition records */
+	struct TypeCacheEntry **keytypes_hash;
+
+	/* Counters of the relation, kept across resets of the entry */
+	struct RelStats *stats;
+
 	/* Compiled structures to filter records */
 	Node *row_filter;
 	struct ExprState *exprstate;
 	struct EState *estate;
+	struct ExprContext *econtext;	/* reused for every row evaluated */
 
 } JsonRelationEntry;
 
@@ -55,5 +80,7 @@ void reldata_invalidate(Datum arg, Oid relid);
 
 void reldata_complete(JsonRelationEntry *entry, Relation relation,
 	bool pretty_print);
+bool reldata_revalidate(JsonRelationEntry *entry, Relation relation,
+	bool include, struct InclusionCommand *chosen_by, bool pretty_print);
 
 #endif
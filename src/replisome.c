@@ -19,17 +19,31 @@
 #include "executor.h"
 
 #include "access/sysattr.h"
+#include "access/tupconvert.h"
+#include "access/tuptoaster.h"
 
 #include "catalog/pg_class.h"
 #include "catalog/pg_type.h"
 #include "catalog/index.h"
+#if PG_VERSION_NUM >= 100000
+#include "catalog/partition.h"
+#endif
+
+#include "libpq/md5.h"
+
+#include "mb/pg_wchar.h"
 
 #include "nodes/parsenodes.h"
 
 #include "replication/output_plugin.h"
 #include "replication/logical.h"
+#include "replication/slot.h"
+#if PG_VERSION_NUM >= 90500
+#include "replication/origin.h"
+#endif
 
 #include "utils/builtins.h"
+#include "utils/datum.h"
 #include "utils/lsyscache.h"
 #include "utils/memutils.h"
 #include "utils/pg_lsn.h"
@@ -56,14 +70,43 @@ static void rs_decode_change(LogicalDecodingContext *ctx,
 				 ReorderBufferTXN *txn, Relation rel,
 				 ReorderBufferChange *change);
 
+#if PG_VERSION_NUM >= 90500
+static bool rs_filter_by_origin(LogicalDecodingContext *ctx,
+					RepOriginId origin_id);
+#endif
+
 static void output_begin(LogicalDecodingContext *ctx, JsonDecodingData *data,
 		ReorderBufferTXN *txn, bool last_write);
+static void output_end(LogicalDecodingContext *ctx, JsonDecodingData *data);
+static bool heartbeat_due(JsonDecodingData *data);
+static void output_heartbeat(LogicalDecodingContext *ctx,
+		JsonDecodingData *data, ReorderBufferTXN *txn);
+static void output_stats(LogicalDecodingContext *ctx,
+		JsonDecodingData *data, ReorderBufferTXN *txn);
+static void output_commit(LogicalDecodingContext *ctx,
+		JsonDecodingData *data, ReorderBufferTXN *txn);
+static void output_prepare_write(LogicalDecodingContext *ctx,
+		bool last_write);
+static void output_write(LogicalDecodingContext *ctx, bool last_write);
+static void output_flush(LogicalDecodingContext *ctx, bool last_write);
+
+static int parse_int_option(DefElem *elem);
+static void bytea_to_stringinfo(StringInfo buf, bytea *val,
+		ByteaFormat format);
+static void value_hash_to_stringinfo(StringInfo buf, Datum val, Oid typid,
+		Oid typoutput, bool typisvarlena);
+static void clipped_to_stringinfo(StringInfo buf, const char *val, int len,
+		int max_bytes);
+static void truncated_to_stringinfo(JsonDecodingData *data, int nvalue);
 
 void
 _PG_init(void)
 {
 	/* Register the callback to receive schema changes */
 	CacheRegisterRelcacheCallback(reldata_invalidate, (Datum)0);
+
+	/* Reserve the shared memory to publish stats, if preloaded */
+	stats_init();
 }
 
 /* Specify output plugin callbacks */
@@ -77,6 +120,11 @@ _PG_output_plugin_init(OutputPluginCallbacks *cb)
 	cb->change_cb = rs_decode_change;
 	cb->commit_cb = rs_decode_commit_txn;
 	cb->shutdown_cb = rs_decode_shutdown;
+
+#if PG_VERSION_NUM >= 90500
+	cb->filter_by_origin_cb = rs_filter_by_origin;
+#endif
+
 }
 
 /* Return the interal version as a string */
@@ -115,19 +163,40 @@ rs_decode_startup(LogicalDecodingContext *ctx, OutputPluginOptions *opt, bool is
 	data->include_types = true;
 	data->pretty_print = false;
 	data->write_in_chunks = false;
+	data->chunk_size = 0;
+	data->write_pending = false;
+	data->ndjson = false;
 	data->include_lsn = false;
 	data->include_empty_xacts = false;
+	data->update_changed_only = false;
+	data->omit_unchanged_key = false;
+	data->only_local = false;
+	data->bytea_format = BYTEA_HEX;
+	data->truncated = makeStringInfo();
+	data->relation_ids = false;
+	data->last_relnum = 0;
+	data->stream_changes = false;
+	data->heartbeat_xacts = 0;
+	data->heartbeat_interval = 0;
+	data->nr_skipped_xacts = 0;
+	data->last_write_time = GetCurrentTimestamp();
+	data->stats_interval = 0;
+	data->last_stats_time = 0;
+	data->last_publish_time = 0;
+	data->compression = CMP_NONE;
+	data->compression_level = 0;
+	data->compression_threshold = 1024;
 	data->commands = NULL;
 
 	data->nr_changes = 0;
+	data->nr_noop_updates = 0;
 
 	data->reldata = reldata_create(ctx->context);
 	elog(DEBUG1, "reldata created at %p", data->reldata);
+	data->stats = stats_create(ctx->context);
 
 	ctx->output_plugin_private = data;
 
-	opt->output_type = OUTPUT_PLUGIN_TEXTUAL_OUTPUT;
-
 	foreach(option, ctx->output_plugin_options)
 	{
 		DefElem *elem = lfirst(option);
@@ -213,6 +282,15 @@ rs_decode_startup(LogicalDecodingContext *ctx, OutputPluginOptions *opt, bool is
 						 errmsg("could not parse value \"%s\" for parameter \"%s\"",
 							 strVal(elem->arg), elem->defname)));
 		}
+		else if (strcmp(elem->defname, "chunk-size") == 0)
+		{
+			data->chunk_size = parse_int_option(elem);
+			if (data->chunk_size < 0)
+				ereport(ERROR,
+						(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+						 errmsg("parameter \"%s\" cannot be negative",
+						 elem->defname)));
+		}
 		else if (strcmp(elem->defname, "include-lsn") == 0)
 		{
 			if (elem->arg == NULL)
@@ -240,6 +318,145 @@ rs_decode_startup(LogicalDecodingContext *ctx, OutputPluginOptions *opt, bool is
 						 errmsg("could not parse value \"%s\" for parameter \"%s\"",
 						 strVal(elem->arg), elem->defname)));
 		}
+		else if (strcmp(elem->defname, "update-changed-only") == 0)
+		{
+			if (elem->arg == NULL)
+			{
+				elog(LOG, "update-changed-only argument is null");
+				data->update_changed_only = true;
+			}
+			else if (!parse_bool(strVal(elem->arg), &data->update_changed_only))
+				ereport(ERROR,
+						(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+						 errmsg("could not parse value \"%s\" for parameter \"%s\"",
+						 strVal(elem->arg), elem->defname)));
+		}
+		else if (strcmp(elem->defname, "omit-unchanged-key") == 0)
+		{
+			if (elem->arg == NULL)
+			{
+				elog(LOG, "omit-unchanged-key argument is null");
+				data->omit_unchanged_key = true;
+			}
+			else if (!parse_bool(strVal(elem->arg), &data->omit_unchanged_key))
+				ereport(ERROR,
+						(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+						 errmsg("could not parse value \"%s\" for parameter \"%s\"",
+						 strVal(elem->arg), elem->defname)));
+		}
+		else if (strcmp(elem->defname, "only-local") == 0)
+		{
+			if (elem->arg == NULL)
+			{
+				elog(LOG, "only-local argument is null");
+				data->only_local = true;
+			}
+			else if (!parse_bool(strVal(elem->arg), &data->only_local))
+				ereport(ERROR,
+						(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+						 errmsg("could not parse value \"%s\" for parameter \"%s\"",
+						 strVal(elem->arg), elem->defname)));
+		}
+		else if (strcmp(elem->defname, "bytea-format") == 0)
+		{
+			if (elem->arg != NULL && strcmp(strVal(elem->arg), "hex") == 0)
+				data->bytea_format = BYTEA_HEX;
+			else if (elem->arg != NULL && strcmp(strVal(elem->arg), "base64") == 0)
+				data->bytea_format = BYTEA_BASE64;
+			else
+				ereport(ERROR,
+						(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+						 errmsg("could not parse value \"%s\" for parameter \"%s\"",
+						 elem->arg ? strVal(elem->arg) : "(null)", elem->defname)));
+		}
+		else if (strcmp(elem->defname, "relation-ids") == 0)
+		{
+			if (elem->arg == NULL)
+			{
+				elog(LOG, "relation-ids argument is null");
+				data->relation_ids = true;
+			}
+			else if (!parse_bool(strVal(elem->arg), &data->relation_ids))
+				ereport(ERROR,
+						(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+						 errmsg("could not parse value \"%s\" for parameter \"%s\"",
+						 strVal(elem->arg), elem->defname)));
+		}
+		else if (strcmp(elem->defname, "ndjson") == 0)
+		{
+			if (elem->arg == NULL)
+			{
+				elog(LOG, "ndjson argument is null");
+				data->ndjson = true;
+			}
+			else if (!parse_bool(strVal(elem->arg), &data->ndjson))
+				ereport(ERROR,
+						(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+						 errmsg("could not parse value \"%s\" for parameter \"%s\"",
+							 strVal(elem->arg), elem->defname)));
+		}
+		else if (strcmp(elem->defname, "stream-changes") == 0)
+		{
+			if (elem->arg == NULL)
+			{
+				elog(LOG, "stream-changes argument is null");
+				data->stream_changes = true;
+			}
+			else if (!parse_bool(strVal(elem->arg), &data->stream_changes))
+				ereport(ERROR,
+						(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+						 errmsg("could not parse value \"%s\" for parameter \"%s\"",
+						 strVal(elem->arg), elem->defname)));
+		}
+		else if (strcmp(elem->defname, "heartbeat-xacts") == 0)
+		{
+			data->heartbeat_xacts = parse_int_option(elem);
+			if (data->heartbeat_xacts < 0)
+				ereport(ERROR,
+						(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+						 errmsg("parameter \"%s\" cannot be negative",
+						 elem->defname)));
+		}
+		else if (strcmp(elem->defname, "stats-interval") == 0)
+		{
+			data->stats_interval = parse_int_option(elem);
+			if (data->stats_interval < 0)
+				ereport(ERROR,
+						(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+						 errmsg("parameter \"%s\" cannot be negative",
+						 elem->defname)));
+		}
+		else if (strcmp(elem->defname, "heartbeat-interval") == 0)
+		{
+			data->heartbeat_interval = parse_int_option(elem);
+			if (data->heartbeat_interval < 0)
+				ereport(ERROR,
+						(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+						 errmsg("parameter \"%s\" cannot be negative",
+						 elem->defname)));
+		}
+		else if (strcmp(elem->defname, "compression") == 0)
+		{
+			if (elem->arg == NULL
+					|| !cmp_parse_method(strVal(elem->arg), &data->compression))
+				ereport(ERROR,
+						(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+						 errmsg("could not parse value \"%s\" for parameter \"%s\"",
+						 elem->arg ? strVal(elem->arg) : "(null)", elem->defname)));
+		}
+		else if (strcmp(elem->defname, "compression-level") == 0)
+		{
+			data->compression_level = parse_int_option(elem);
+		}
+		else if (strcmp(elem->defname, "compression-threshold") == 0)
+		{
+			data->compression_threshold = parse_int_option(elem);
+			if (data->compression_threshold < 0)
+				ereport(ERROR,
+						(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+						 errmsg("parameter \"%s\" cannot be negative",
+						 elem->defname)));
+		}
 		else if (strcmp(elem->defname, "include") == 0)
 		{
 			inc_parse_include(elem, &data->commands);
@@ -257,6 +474,117 @@ rs_decode_startup(LogicalDecodingContext *ctx, OutputPluginOptions *opt, bool is
 						elem->arg ? strVal(elem->arg) : "(null)")));
 		}
 	}
+
+	/* Every record is written on its own, on a single line */
+	if (data->ndjson)
+	{
+		if (data->pretty_print)
+			ereport(ERROR,
+					(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+					 errmsg("ndjson cannot be used with pretty-print")));
+		if (data->stream_changes)
+			ereport(ERROR,
+					(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+					 errmsg("ndjson cannot be used with stream-changes")));
+
+		data->write_in_chunks = true;
+		data->chunk_size = 0;
+	}
+
+	/* Only measure the time if somebody can see it */
+	data->track_timing = data->stats_interval > 0 || stats_shared();
+
+	/* Compressed data is not text anymore */
+	cmp_check_level(data->compression, data->compression_level);
+	opt->output_type = data->compression != CMP_NONE ?
+		OUTPUT_PLUGIN_BINARY_OUTPUT : OUTPUT_PLUGIN_TEXTUAL_OUTPUT;
+
+#if PG_VERSION_NUM < 90500
+	if (data->only_local)
+		ereport(ERROR,
+				(errcode(ERRCODE_FEATURE_NOT_SUPPORTED),
+				 errmsg("filtering by replication origin requires PostgreSQL 9.5")));
+#endif
+
+	/*
+	 * Streaming the transactions in progress needs the PostgreSQL 14
+	 * decoding API: the plugin doesn't build on PostgreSQL 10 and later yet.
+	 */
+	if (data->stream_changes)
+		ereport(ERROR,
+				(errcode(ERRCODE_FEATURE_NOT_SUPPORTED),
+				 errmsg("streaming of transactions in progress is not supported")));
+}
+
+/* Parse the integer value of an option */
+static int
+parse_int_option(DefElem *elem)
+{
+	char *end;
+	long rv;
+
+	if (elem->arg != NULL)
+	{
+		errno = 0;
+		rv = strtol(strVal(elem->arg), &end, 10);
+		if (*strVal(elem->arg) != '\0' && *end == '\0' && errno == 0
+				&& rv == (int) rv)
+			return (int) rv;
+	}
+
+	ereport(ERROR,
+			(errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+			 errmsg("could not parse value \"%s\" for parameter \"%s\"",
+			 elem->arg ? strVal(elem->arg) : "(null)", elem->defname)));
+	return 0;	/* keep compiler quiet */
+}
+
+/*
+ * Start writing a message: remember where our data starts
+ *
+ * If a chunk is being filled, keep on appending to it instead.
+ */
+static void
+output_prepare_write(LogicalDecodingContext *ctx, bool last_write)
+{
+	JsonDecodingData *data = ctx->output_plugin_private;
+
+	if (data->write_pending)
+		return;
+
+	OutputPluginPrepareWrite(ctx, last_write);
+	data->write_start = ctx->out->len;
+	data->write_pending = true;
+}
+
+/* Write a message, unless it is smaller than the chunk size requested */
+static void
+output_write(LogicalDecodingContext *ctx, bool last_write)
+{
+	JsonDecodingData *data = ctx->output_plugin_private;
+
+	if (ctx->out->len - data->write_start < data->chunk_size)
+		return;
+
+	output_flush(ctx, last_write);
+}
+
+/* Write the pending message, compressing it if requested and big enough */
+static void
+output_flush(LogicalDecodingContext *ctx, bool last_write)
+{
+	JsonDecodingData *data = ctx->output_plugin_private;
+
+	if (!data->write_pending)
+		return;
+
+	if (data->compression != CMP_NONE
+			&& ctx->out->len - data->write_start >= data->compression_threshold)
+		cmp_compress(ctx->out, data->write_start,
+			data->compression, data->compression_level);
+
+	OutputPluginWrite(ctx, last_write);
+	data->write_pending = false;
 }
 
 /* cleanup this plugin's resources */
@@ -265,6 +593,10 @@ rs_decode_shutdown(LogicalDecodingContext *ctx)
 {
 	JsonDecodingData *data = ctx->output_plugin_private;
 
+	/* Publish the final state of the counters */
+	if (stats_shared() && MyReplicationSlot)
+		stats_publish(NameStr(MyReplicationSlot->data.name), data->stats);
+
 	elog(DEBUG1, "destroying reldata at %p", data->reldata);
 	reldata_to_invalidate(NULL);
 	reldata_destroy(data->reldata);
@@ -297,14 +629,14 @@ output_begin(LogicalDecodingContext *ctx, JsonDecodingData *data,
 		ReorderBufferTXN *txn, bool last_write)
 {
 	/* Transaction starts */
-	OutputPluginPrepareWrite(ctx, last_write);
+	output_prepare_write(ctx, last_write);
 
 	if (data->pretty_print)
 		appendStringInfoString(ctx->out, "{\n");
 	else
 		appendStringInfoChar(ctx->out, '{');
 
-	if (data->include_xids)
+	if (data->include_xids || data->ndjson)
 	{
 		if (data->pretty_print)
 			appendStringInfo(ctx->out, "\t\"xid\": %u,\n", txn->xid);
@@ -334,11 +666,13 @@ output_begin(LogicalDecodingContext *ctx, JsonDecodingData *data,
 
 	if (data->pretty_print)
 		appendStringInfoString(ctx->out, "\t\"tx\": [");
+	else if (data->ndjson)
+		appendStringInfoString(ctx->out, "\"begin\":true}\n");
 	else
 		appendStringInfoString(ctx->out, "\"tx\":[");
 
 	if (data->write_in_chunks)
-		OutputPluginWrite(ctx, last_write);
+		output_write(ctx, last_write);
 }
 
 /* COMMIT callback */
@@ -356,99 +690,628 @@ rs_decode_commit_txn(LogicalDecodingContext *ctx, ReorderBufferTXN *txn,
 		elog(DEBUG1, "txn has catalog changes: no");
 	elog(DEBUG1, "my change counter: %lu ; # of changes: %lu ; # of changes in memory: %lu", data->nr_changes, txn->nentries, txn->nentries_mem);
 	elog(DEBUG1, "# of subxacts: %d", txn->nsubtxns);
+	elog(DEBUG1, "no-op updates dropped in the session: " UINT64_FORMAT, data->nr_noop_updates);
 
 	if (!data->include_empty_xacts && data->nr_changes == 0)
+	{
+		data->nr_skipped_xacts++;
+		if (heartbeat_due(data))
+			output_heartbeat(ctx, data, txn);
+	}
+	else if (data->ndjson)
+		output_commit(ctx, data, txn);
+	else
+		output_end(ctx, data);
+
+	output_stats(ctx, data, txn);
+}
+
+/*
+ * Return true if it's time to emit a heartbeat
+ *
+ * A heartbeat is emitted after a number of transactions skipped (because
+ * they contain no change to emit) or after a number of seconds without
+ * writing anything, so that the client can confirm the position reached and
+ * the server can recycle the WAL.
+ */
+static bool
+heartbeat_due(JsonDecodingData *data)
+{
+	if (data->heartbeat_xacts
+			&& data->nr_skipped_xacts >= data->heartbeat_xacts)
+		return true;
+
+	if (data->heartbeat_interval
+			&& TimestampDifferenceExceeds(data->last_write_time,
+				GetCurrentTimestamp(), data->heartbeat_interval * 1000))
+		return true;
+
+	return false;
+}
+
+/*
+ * Emit a heartbeat: a message with the position of a transaction skipped
+ *
+ * The message is {"heartbeat": true, "nextlsn": LSN, "tx": []}.
+ */
+static void
+output_heartbeat(LogicalDecodingContext *ctx, JsonDecodingData *data,
+		ReorderBufferTXN *txn)
+{
+	char *lsn_str = DatumGetCString(DirectFunctionCall1(pg_lsn_out, txn->end_lsn));
+
+	output_prepare_write(ctx, false);
+
+	if (data->pretty_print)
+		appendStringInfo(ctx->out,
+			"{\n\t\"heartbeat\": true,\n\t\"nextlsn\": \"%s\",\n\t\"tx\": [",
+			lsn_str);
+	else if (data->ndjson)
+		appendStringInfo(ctx->out,
+			"{\"heartbeat\":true,\"nextlsn\":\"%s\"", lsn_str);
+	else
+		appendStringInfo(ctx->out,
+			"{\"heartbeat\":true,\"nextlsn\":\"%s\",\"tx\":[", lsn_str);
+
+	pfree(lsn_str);
+
+	if (data->write_in_chunks && !data->ndjson)
+		output_write(ctx, false);
+
+	output_end(ctx, data);
+}
+
+/*
+ * Emit the commit record of a transaction in ndjson format
+ *
+ * The record is {"commit": true, "xid": XID, "nextlsn": LSN}.
+ */
+static void
+output_commit(LogicalDecodingContext *ctx, JsonDecodingData *data,
+		ReorderBufferTXN *txn)
+{
+	char *lsn_str = DatumGetCString(DirectFunctionCall1(pg_lsn_out, txn->end_lsn));
+
+	output_prepare_write(ctx, true);
+	appendStringInfo(ctx->out,
+		"{\"commit\":true,\"xid\":%u,\"nextlsn\":\"%s\"", txn->xid, lsn_str);
+	pfree(lsn_str);
+
+	output_end(ctx, data);
+}
+
+/*
+ * Publish the stats in shared memory and emit them in the stream, if due
+ *
+ * The stats are published at most once a second, and emitted after the
+ * first transaction, then every stats-interval seconds.
+ */
+static void
+output_stats(LogicalDecodingContext *ctx, JsonDecodingData *data,
+		ReorderBufferTXN *txn)
+{
+	TimestampTz	now;
+	char		*lsn_str;
+
+	if (!data->stats_interval && !stats_shared())
+		return;
+
+	now = GetCurrentTimestamp();
+
+	if (stats_shared()
+			&& TimestampDifferenceExceeds(data->last_publish_time, now, 1000))
+	{
+		stats_publish(NameStr(MyReplicationSlot->data.name), data->stats);
+		data->last_publish_time = now;
+	}
+
+	if (!data->stats_interval
+			|| !TimestampDifferenceExceeds(data->last_stats_time, now,
+				data->stats_interval * 1000))
 		return;
 
-	/* Transaction ends */
-	if (data->write_in_chunks)
-		OutputPluginPrepareWrite(ctx, true);
+	data->last_stats_time = now;
+
+	lsn_str = DatumGetCString(DirectFunctionCall1(pg_lsn_out, txn->end_lsn));
+
+	output_prepare_write(ctx, false);
+
+	if (data->pretty_print)
+		appendStringInfo(ctx->out,
+			"{\n\t\"stats\": true,\n\t\"nextlsn\": \"%s\",\n\t\"tables\": [",
+			lsn_str);
+	else
+		appendStringInfo(ctx->out,
+			"{\"stats\":true,\"nextlsn\":\"%s\",\"tables\":[", lsn_str);
+
+	stats_to_stringinfo(ctx->out, data->stats, data->pretty_print);
+
+	if (data->pretty_print)
+		appendStringInfoString(ctx->out, "\n\t],\n\t\"tx\": [");
+	else if (data->ndjson)
+		appendStringInfoChar(ctx->out, ']');
+	else
+		appendStringInfoString(ctx->out, "],\"tx\":[");
+
+	pfree(lsn_str);
+
+	if (data->write_in_chunks && !data->ndjson)
+		output_write(ctx, false);
+
+	output_end(ctx, data);
+}
+
+#if PG_VERSION_NUM >= 90500
+
+/*
+ * Return true if the changes with a replication origin should be skipped
+ *
+ * The changes applied by a replication process having set up an origin for
+ * its session (e.g. a DataUpdater with an origin) are not decoded at all.
+ */
+static bool
+rs_filter_by_origin(LogicalDecodingContext *ctx, RepOriginId origin_id)
+{
+	JsonDecodingData *data = ctx->output_plugin_private;
+
+	return data->only_local && origin_id != InvalidRepOriginId;
+}
+
+#endif
+
+/* Close a message opened by output_begin() */
+static void
+output_end(LogicalDecodingContext *ctx, JsonDecodingData *data)
+{
+	/*
+	 * Transaction ends. The end is always written in its own chunk: the
+	 * receiver relies on it to know the message is complete. In ndjson
+	 * every record is complete already: only close the current one.
+	 */
+	if (data->write_in_chunks && !data->ndjson)
+	{
+		output_flush(ctx, false);
+		output_prepare_write(ctx, true);
+	}
+
+	if (data->ndjson)
+	{
+		appendStringInfoString(ctx->out, "}\n");
+	}
+	else if (data->pretty_print)
+	{
+		/* if we don't write in chunks, we need a newline here */
+		if (!data->write_in_chunks)
+			appendStringInfoChar(ctx->out, '\n');
+
+		appendStringInfoString(ctx->out, "\t]\n}");
+	}
+	else
+	{
+		appendStringInfoString(ctx->out, "]}");
+	}
+
+	output_flush(ctx, true);
+
+	/* Something was written: no heartbeat needed for a while */
+	data->nr_skipped_xacts = 0;
+	data->last_write_time = GetCurrentTimestamp();
+}
+
+/*
+ * Format a string as a JSON literal
+ * XXX it doesn't do a sanity check for invalid input, does it?
+ * FIXME it doesn't handle \uxxxx
+ */
+static void
+quote_escape_json(StringInfo buf, const char *val)
+{
+	const char *valptr;
+
+	appendStringInfoChar(buf, '"');
+	for (valptr = val; *valptr; valptr++)
+	{
+		char		ch = *valptr;
+
+		switch (ch)
+		{
+			case '"':
+			case '\\':
+			case '/':
+				appendStringInfo(buf, "\\%c", ch);
+				break;
+			case '\b':
+				appendStringInfoString(buf, "\\b");
+				break;
+			case '\f':
+				appendStringInfoString(buf, "\\f");
+				break;
+			case '\n':
+				appendStringInfoString(buf, "\\n");
+				break;
+			case '\r':
+				appendStringInfoString(buf, "\\r");
+				break;
+			case '\t':
+				appendStringInfoString(buf, "\\t");
+				break;
+			default:
+				appendStringInfoChar(buf, ch);
+				break;
+		}
+	}
+	appendStringInfoChar(buf, '"');
+}
+
+/*
+ * Print the positions of a list of attributes in the columns emitted
+ *
+ * attrlist must be a subsequence of entry->colidxs.
+ */
+static void
+colidxs_to_stringinfo(LogicalDecodingContext *ctx, JsonRelationEntry *entry, int *attrlist)
+{
+	JsonDecodingData	*data;
+	char				*comma = "";
+	int					*pattr;
+	int					i;
+
+	data = ctx->output_plugin_private;
+
+	for (pattr = attrlist, i = 0; *pattr >= 0; pattr++)
+	{
+		while (entry->colidxs[i] != *pattr)
+		{
+			Assert(entry->colidxs[i] >= 0);
+			i++;
+		}
+
+		appendStringInfo(ctx->out, "%s%d", comma, i);
+
+		/* The first column does not have comma */
+		if (comma[0] == '\0')
+			comma = data->pretty_print ? ", " : ",";
+	}
+}
+
+/* Return true if an attribute is part of the key emitted for a relation */
+static bool
+is_key_column(JsonRelationEntry *entry, int natt)
+{
+	int					*pattr;
+
+	if (entry->keyidxs == NULL)
+		return false;
+
+	for (pattr = entry->keyidxs; *pattr >= 0; pattr++)
+	{
+		if (*pattr == natt)
+			return true;
+	}
+
+	return false;
+}
+
+/* Return true if an attribute has a different value in two tuples */
+static bool
+column_changed(TupleDesc tupdesc, int natt, HeapTuple oldtuple, HeapTuple newtuple)
+{
+	Form_pg_attribute	attr;
+	Datum				oldval;
+	Datum				newval;
+	bool				oldnull;
+	bool				newnull;
+
+	attr = tupdesc->attrs[natt];
+
+	oldval = heap_getattr(oldtuple, natt + 1, tupdesc, &oldnull);
+	newval = heap_getattr(newtuple, natt + 1, tupdesc, &newnull);
+
+	if (oldnull || newnull)
+		return oldnull != newnull;
+
+	if (attr->attlen == -1)
+	{
+		struct varlena		*oldv;
+		struct varlena		*newv;
+
+		/* Unchanged TOAST Datum: the value is the same by definition */
+		if (VARATT_IS_EXTERNAL_ONDISK(DatumGetPointer(newval)))
+			return false;
+
+		/* Compare the content, not the storage format */
+		oldv = PG_DETOAST_DATUM_PACKED(oldval);
+		newv = PG_DETOAST_DATUM_PACKED(newval);
+
+		return VARSIZE_ANY_EXHDR(oldv) != VARSIZE_ANY_EXHDR(newv)
+			|| memcmp(VARDATA_ANY(oldv), VARDATA_ANY(newv),
+					VARSIZE_ANY_EXHDR(oldv)) != 0;
+	}
+
+	return !datumIsEqual(oldval, newval, attr->attbyval, attr->attlen);
+}
+
+/* Return true if any of the attributes in a list has changed value */
+static bool
+any_column_changed(TupleDesc tupdesc, HeapTuple oldtuple, HeapTuple newtuple, int *attrlist)
+{
+	int					*pattr;
+
+	for (pattr = attrlist; *pattr >= 0; pattr++)
+	{
+		if (column_changed(tupdesc, *pattr, oldtuple, newtuple))
+			return true;
+	}
+
+	return false;
+}
+
+/* Return the INC_OP_* flag of a change */
+static int
+change_op(ReorderBufferChangeType action)
+{
+	switch (action)
+	{
+		case REORDER_BUFFER_CHANGE_INSERT:
+			return INC_OP_INSERT;
+		case REORDER_BUFFER_CHANGE_UPDATE:
+			return INC_OP_UPDATE;
+		case REORDER_BUFFER_CHANGE_DELETE:
+			return INC_OP_DELETE;
+		default:
+			return 0;
+	}
+}
+
+/*
+ * Append a bytea value as a JSON string, in hex (without the \x) or base64
+ */
+static void
+bytea_to_stringinfo(StringInfo buf, bytea *val, ByteaFormat format)
+{
+	static const char hexdigits[] = "0123456789abcdef";
+	static const char b64digits[] =
+		"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/";
+
+	const unsigned char *src = (unsigned char *) VARDATA_ANY(val);
+	int			len = VARSIZE_ANY_EXHDR(val);
+	int			i;
+
+	appendStringInfoChar(buf, '"');
+
+	switch (format)
+	{
+		case BYTEA_HEX:
+			enlargeStringInfo(buf, len * 2);
+			for (i = 0; i < len; i++)
+			{
+				buf->data[buf->len++] = hexdigits[src[i] >> 4];
+				buf->data[buf->len++] = hexdigits[src[i] & 0xF];
+			}
+			break;
+
+		case BYTEA_BASE64:
+			enlargeStringInfo(buf, (len + 2) / 3 * 4);
+			for (i = 0; i + 2 < len; i += 3)
+			{
+				uint32		w = (src[i] << 16) | (src[i + 1] << 8) | src[i + 2];
+
+				buf->data[buf->len++] = b64digits[(w >> 18) & 0x3F];
+				buf->data[buf->len++] = b64digits[(w >> 12) & 0x3F];
+				buf->data[buf->len++] = b64digits[(w >> 6) & 0x3F];
+				buf->data[buf->len++] = b64digits[w & 0x3F];
+			}
+			if (i < len)
+			{
+				uint32		w = src[i] << 16;
+
+				if (i + 1 < len)
+					w |= src[i + 1] << 8;
+
+				buf->data[buf->len++] = b64digits[(w >> 18) & 0x3F];
+				buf->data[buf->len++] = b64digits[(w >> 12) & 0x3F];
+				buf->data[buf->len++] = i + 1 < len ? b64digits[(w >> 6) & 0x3F] : '=';
+				buf->data[buf->len++] = '=';
+			}
+			break;
+	}
+
+	buf->data[buf->len] = '\0';
+	appendStringInfoChar(buf, '"');
+}
+
+/* Return true if the content of a type can be used as its text */
+#define IS_RAW_TEXT_TYPE(typid) \
+	((typid) == TEXTOID || (typid) == VARCHAROID || (typid) == BYTEAOID)
+
+/*
+ * Append the MD5 of a value as a JSON string
+ *
+ * Text and bytea are hashed from their content, without going through the
+ * output function and the escaping, so the result is the same of md5() in
+ * SQL. The other types are hashed from their text representation.
+ */
+static void
+value_hash_to_stringinfo(StringInfo buf, Datum val, Oid typid,
+	Oid typoutput, bool typisvarlena)
+{
+	char		hexsum[33];
+	const char *src;
+	size_t		len;
 
-	if (data->pretty_print)
+	if (IS_RAW_TEXT_TYPE(typid))
 	{
-		/* if we don't write in chunks, we need a newline here */
-		if (!data->write_in_chunks)
-			appendStringInfoChar(ctx->out, '\n');
+		struct varlena *v = PG_DETOAST_DATUM_PACKED(val);
 
-		appendStringInfoString(ctx->out, "\t]\n}");
+		src = VARDATA_ANY(v);
+		len = VARSIZE_ANY_EXHDR(v);
 	}
 	else
 	{
-		appendStringInfoString(ctx->out, "]}");
+		if (typisvarlena)
+			val = PointerGetDatum(PG_DETOAST_DATUM(val));
+		src = OidOutputFunctionCall(typoutput, val);
+		len = strlen(src);
 	}
 
-	OutputPluginWrite(ctx, true);
+	if (!pg_md5_hash(src, len, hexsum))
+		elog(ERROR, "out of memory");
+
+	appendStringInfo(buf, "\"%s\"", hexsum);
 }
 
 /*
- * Format a string as a JSON literal
- * XXX it doesn't do a sanity check for invalid input, does it?
- * FIXME it doesn't handle \uxxxx
+ * Append the first max_bytes of a string as a JSON string
+ *
+ * The string is cut before max_bytes if a multibyte character would be split.
  */
 static void
-quote_escape_json(StringInfo buf, const char *val)
+clipped_to_stringinfo(StringInfo buf, const char *val, int len, int max_bytes)
 {
-	const char *valptr;
+	char	   *clipped;
 
-	appendStringInfoChar(buf, '"');
-	for (valptr = val; *valptr; valptr++)
+	len = pg_mbcliplen(val, len, max_bytes);
+	clipped = pnstrdup(val, len);
+	quote_escape_json(buf, clipped);
+	pfree(clipped);
+}
+
+/* Take note of the position of a value truncated, to emit after the values */
+static void
+truncated_to_stringinfo(JsonDecodingData *data, int nvalue)
+{
+	if (data->truncated->len > 0)
+		appendStringInfoString(data->truncated,
+			data->pretty_print ? ", " : ",");
+	appendStringInfo(data->truncated, "%d", nvalue);
+}
+
+/*
+ * Return the hash of the key of a tuple
+ *
+ * The hashes of the columns are combined as in the hash joins. Nulls hash
+ * to 0.
+ */
+static uint32
+key_hash(TupleDesc tupdesc, HeapTuple tuple, JsonRelationEntry *entry)
+{
+	uint32			rv = 0;
+	int				i;
+
+	for (i = 0; entry->keyidxs[i] >= 0; i++)
 	{
-		char		ch = *valptr;
+		int			natt = entry->keyidxs[i];
+		Datum		val;
+		bool		isnull;
 
-		/* XXX suppress \x in bytea field? */
-		if (ch == '\\' && *(valptr + 1) == 'x')
-		{
-			valptr++;
+		/* rotate hashkey left 1 bit at each step */
+		rv = (rv << 1) | ((rv & 0x80000000) ? 1 : 0);
+
+		val = heap_getattr(tuple, natt + 1, tupdesc, &isnull);
+		if (isnull)
 			continue;
-		}
 
-		switch (ch)
-		{
-			case '"':
-			case '\\':
-			case '/':
-				appendStringInfo(buf, "\\%c", ch);
-				break;
-			case '\b':
-				appendStringInfoString(buf, "\\b");
-				break;
-			case '\f':
-				appendStringInfoString(buf, "\\f");
-				break;
-			case '\n':
-				appendStringInfoString(buf, "\\n");
-				break;
-			case '\r':
-				appendStringInfoString(buf, "\\r");
-				break;
-			case '\t':
-				appendStringInfoString(buf, "\\t");
-				break;
-			default:
-				appendStringInfoChar(buf, ch);
-				break;
-		}
+		rv ^= DatumGetUInt32(FunctionCall1Coll(
+			&entry->keytypes_hash[i]->hash_proc_finfo,
+			tupdesc->attrs[natt]->attcollation, val));
 	}
-	appendStringInfoChar(buf, '"');
+
+	return rv;
+}
+
+/* Return true if the key of a tuple falls in the partition requested */
+static bool
+key_in_partition(TupleDesc tupdesc, HeapTuple tuple, JsonRelationEntry *entry)
+{
+	return key_hash(tupdesc, tuple, entry)
+		% (uint32) entry->chosen_by->partition_modulus
+		== (uint32) entry->chosen_by->partition_remainder;
+}
+
+/*
+ * Return true if a tuple matches the row filter of a relation
+ *
+ * The slot and the context are set up once in reldata_complete().
+ */
+static bool
+row_filter_match(JsonRelationEntry *entry, HeapTuple tuple)
+{
+	Datum			res;
+	bool			isnull;
+	ExprContext	   *econtext;
+
+	Assert(entry->exprstate);
+	Assert(entry->econtext);
+
+	econtext = entry->econtext;
+	ExecStoreTuple(tuple, econtext->ecxt_scantuple, InvalidBuffer, false);
+	res = ExecEvalExpr(entry->exprstate, econtext, &isnull, NULL);
+	ExecClearTuple(econtext->ecxt_scantuple);
+	ResetExprContext(econtext);
+
+	/* NULL is same as false for our use. */
+	return !isnull && DatumGetBool(res);
+}
+
+/*
+ * Return the list of attributes to emit for an update in changed-only mode
+ *
+ * The list contains the columns whose value changed between the old and
+ * the new tuple, plus the key columns, terminated by -1.
+ */
+static int *
+find_changed_columns(TupleDesc tupdesc, HeapTuple oldtuple, HeapTuple newtuple, JsonRelationEntry *entry)
+{
+	int					*rv;
+	int					*pdest;
+	int					*pattr;
+
+	rv = palloc(sizeof(int) * (tupdesc->natts + 1));
+
+	for (pattr = entry->colidxs, pdest = rv; *pattr >= 0; pattr++)
+	{
+		if (is_key_column(entry, *pattr)
+				|| column_changed(tupdesc, *pattr, oldtuple, newtuple))
+			*pdest++ = *pattr;
+	}
+
+	*pdest = -1;     /* sentinel */
+	return rv;
 }
 
+/*
+ * Print the values of a tuple
+ *
+ * attrlist: the attributes to print; if NULL print the columns (or the key,
+ * if replident) configured for the relation.
+ */
 static void
-values_to_stringinfo(LogicalDecodingContext *ctx, TupleDesc tupdesc, HeapTuple tuple, TupleDesc indexdesc, bool replident, JsonRelationEntry *entry)
+values_to_stringinfo(LogicalDecodingContext *ctx, TupleDesc tupdesc, HeapTuple tuple, TupleDesc indexdesc, bool replident, JsonRelationEntry *entry, int *attrlist)
 {
 	JsonDecodingData	*data;
 	int					natt;
+	int					nvalue = 0;	/* position in the values emitted */
+	int					max_bytes = 0;
 
 	char				*comma = "";
 
-	int					*attrlist;
 	int					*pattr;
 
 	data = ctx->output_plugin_private;
 
-	if (replident && entry->keyidxs)
-		attrlist = entry->keyidxs;
-	else
-		attrlist = entry->colidxs;
+	/* The values may be truncated, the old key never */
+	if (!replident && entry->chosen_by)
+		max_bytes = entry->chosen_by->max_value_bytes;
+
+	resetStringInfo(data->truncated);
+
+	if (attrlist == NULL)
+	{
+		if (replident && entry->keyidxs)
+			attrlist = entry->keyidxs;
+		else
+			attrlist = entry->colidxs;
+	}
 
 	/* Print column information (name, type, value) */
 	for (pattr = attrlist; (natt = *pattr) >= 0; pattr++)
@@ -490,6 +1353,34 @@ values_to_stringinfo(LogicalDecodingContext *ctx, TupleDesc tupdesc, HeapTuple t
             /* Unchanged TOAST Datum may not be available */
 			appendStringInfo(ctx->out, "%s{}", comma);
 		}
+		else if (!replident && entry->hashed && entry->hashed[natt])
+		{
+			appendStringInfoString(ctx->out, comma);
+			value_hash_to_stringinfo(ctx->out, origval, typid, typoutput,
+				typisvarlena);
+		}
+		else if (max_bytes > 0 && IS_RAW_TEXT_TYPE(typid)
+				&& toast_raw_datum_size(origval) - VARHDRSZ > (Size) max_bytes
+				&& !is_key_column(entry, natt))
+		{
+			/* Only detoast the part to emit */
+			struct varlena *v = PG_DETOAST_DATUM_SLICE(origval, 0, max_bytes);
+
+			appendStringInfoString(ctx->out, comma);
+			if (typid == BYTEAOID)
+				bytea_to_stringinfo(ctx->out, (bytea *) v, data->bytea_format);
+			else
+				clipped_to_stringinfo(ctx->out,
+					VARDATA_ANY(v), VARSIZE_ANY_EXHDR(v), max_bytes);
+			truncated_to_stringinfo(data, nvalue);
+		}
+		else if (typid == BYTEAOID)
+		{
+			/* Render bytea from the datum, not its output function */
+			appendStringInfoString(ctx->out, comma);
+			bytea_to_stringinfo(ctx->out,
+				DatumGetByteaPP(origval), data->bytea_format);
+		}
 		else
 		{
 			if (typisvarlena)
@@ -535,11 +1426,21 @@ values_to_stringinfo(LogicalDecodingContext *ctx, TupleDesc tupdesc, HeapTuple t
 					break;
 				default:
 					appendStringInfoString(ctx->out, comma);
-					quote_escape_json(ctx->out, outputstr);
+					if (max_bytes > 0 && strlen(outputstr) > (Size) max_bytes
+							&& !is_key_column(entry, natt))
+					{
+						clipped_to_stringinfo(ctx->out,
+							outputstr, strlen(outputstr), max_bytes);
+						truncated_to_stringinfo(data, nvalue);
+					}
+					else
+						quote_escape_json(ctx->out, outputstr);
 					break;
 			}
 		}
 
+		nvalue++;
+
 		/* The first column does not have comma */
 		if (comma[0] == '\0')
 			comma = data->pretty_print ? ", " : ",";
@@ -551,9 +1452,12 @@ values_to_stringinfo(LogicalDecodingContext *ctx, TupleDesc tupdesc, HeapTuple t
  *
  * replident: is this tuple a replica identity?
  * hasreplident: does this tuple has an associated replica identity?
+ * attrlist: if not NULL, only print these attributes and their position
+ *   in the columns emitted (only used if not replident).
+ * include_values: if false only print the names and types, if requested.
  */
 static void
-tuple_to_stringinfo(LogicalDecodingContext *ctx, TupleDesc tupdesc, HeapTuple tuple, TupleDesc indexdesc, bool replident, bool hasreplident, bool include_schema, JsonRelationEntry *entry)
+tuple_to_stringinfo(LogicalDecodingContext *ctx, TupleDesc tupdesc, HeapTuple tuple, TupleDesc indexdesc, bool replident, bool hasreplident, bool include_schema, JsonRelationEntry *entry, int *attrlist, bool include_values)
 {
 	JsonDecodingData	*data;
 	bool				include_types;
@@ -576,8 +1480,12 @@ tuple_to_stringinfo(LogicalDecodingContext *ctx, TupleDesc tupdesc, HeapTuple tu
 					? "\t\t\t\"colnames\": [" : "\"colnames\":[");
 			appendStringInfoString(ctx->out, entry->colnames);
 		}
-		appendStringInfoString(ctx->out,
-			data->pretty_print ? "],\n" : "],");
+		if (include_types || include_values)
+			appendStringInfoString(ctx->out,
+				data->pretty_print ? "],\n" : "],");
+		else
+			appendStringInfoString(ctx->out,
+				data->pretty_print ? "]\n" : "]");
 	}
 
 	if (include_types) {
@@ -594,6 +1502,22 @@ tuple_to_stringinfo(LogicalDecodingContext *ctx, TupleDesc tupdesc, HeapTuple tu
 					? "\t\t\t\"coltypes\": [" : "\"coltypes\":[");
 			appendStringInfoString(ctx->out, entry->coltypes);
 		}
+		if (include_values)
+			appendStringInfoString(ctx->out,
+				data->pretty_print ? "],\n" : "],");
+		else
+			appendStringInfoString(ctx->out,
+				data->pretty_print ? "]\n" : "]");
+	}
+
+	if (!include_values)
+		return;
+
+	/* Print the position of the values in the columns, if partial */
+	if (attrlist && !replident) {
+		appendStringInfoString(ctx->out,
+			data->pretty_print ? "\t\t\t\"colidxs\": [" : "\"colidxs\":[");
+		colidxs_to_stringinfo(ctx, entry, attrlist);
 		appendStringInfoString(ctx->out,
 			data->pretty_print ? "],\n" : "],");
 	}
@@ -610,23 +1534,33 @@ tuple_to_stringinfo(LogicalDecodingContext *ctx, TupleDesc tupdesc, HeapTuple tu
 		appendStringInfoString(ctx->out,
 			data->pretty_print ? "\t\t\t\"values\": [" : "\"values\":[");
 
-	values_to_stringinfo(ctx, tupdesc, tuple, indexdesc, replident, entry);
+	values_to_stringinfo(ctx, tupdesc, tuple, indexdesc, replident, entry, attrlist);
+	appendStringInfoChar(ctx->out, ']');
+
+	/* Print the position of the values truncated by max_value_bytes */
+	if (data->truncated->len > 0) {
+		appendStringInfoString(ctx->out,
+			data->pretty_print
+				? ",\n\t\t\t\"truncated\": [" : ",\"truncated\":[");
+		appendStringInfoString(ctx->out, data->truncated->data);
+		appendStringInfoChar(ctx->out, ']');
+	}
 
 	/* Column info ends */
 	if (replident || !hasreplident)
 		appendStringInfoString(ctx->out,
-			data->pretty_print ? "]\n" : "]");
+			data->pretty_print ? "\n" : "");
 	else
 		appendStringInfoString(ctx->out,
-			data->pretty_print ? "],\n" : "],");
+			data->pretty_print ? ",\n" : ",");
 }
 
 /* Print columns information */
 static void
-columns_to_stringinfo(LogicalDecodingContext *ctx, TupleDesc tupdesc, HeapTuple tuple, bool hasreplident, JsonRelationEntry *entry)
+columns_to_stringinfo(LogicalDecodingContext *ctx, TupleDesc tupdesc, HeapTuple tuple, bool hasreplident, JsonRelationEntry *entry, int *attrlist)
 {
 	bool include_schema = !entry->names_emitted;
-	tuple_to_stringinfo(ctx, tupdesc, tuple, NULL, false, hasreplident, include_schema, entry);
+	tuple_to_stringinfo(ctx, tupdesc, tuple, NULL, false, hasreplident, include_schema, entry, attrlist, true);
 }
 
 /* Print replica identity information */
@@ -636,8 +1570,118 @@ identity_to_stringinfo(LogicalDecodingContext *ctx, TupleDesc tupdesc, HeapTuple
 	bool include_schema = !entry->key_emitted;
 
 	/* hasreplident=false parameter does not matter */
-	tuple_to_stringinfo(ctx, tupdesc, tuple, indexdesc, true, false, include_schema, entry);
+	tuple_to_stringinfo(ctx, tupdesc, tuple, indexdesc, true, false, include_schema, entry, NULL, true);
+}
+
+/* Print replica identity names and types, if not emitted yet, but no value */
+static void
+keynames_to_stringinfo(LogicalDecodingContext *ctx, TupleDesc tupdesc, JsonRelationEntry *entry)
+{
+	Assert(!entry->key_emitted);
+	tuple_to_stringinfo(ctx, tupdesc, NULL, NULL, true, false, true, entry, NULL, false);
+}
+
+#if PG_VERSION_NUM >= 100000
+/* Return the root of the partitions tree of a partition */
+static Oid
+partition_root(Oid relid)
+{
+#if PG_VERSION_NUM >= 110000
+	return llast_oid(get_partition_ancestors(relid));
+#else
+	Relation	rel;
+	bool		ispartition = true;
+
+	while (ispartition)
+	{
+		relid = get_partition_parent(relid);
+		rel = RelationIdGetRelation(relid);
+		ispartition = rel->rd_rel->relispartition;
+		RelationClose(rel);
+	}
+
+	return relid;
+#endif
+}
+
+/*
+ * Emit a partition as its root table if the root is included via_root.
+ *
+ * If the root is not included this way, leave the entry undecided: the
+ * partition is then matched against the commands as any other table.
+ */
+static void
+route_to_root(JsonDecodingData *data, JsonRelationEntry *entry,
+		Relation relation)
+{
+	InclusionCommand *chosen_by = NULL;
+	Relation	rootrel;
+	Oid			rootid;
+
+	rootid = partition_root(RelationGetRelid(relation));
+	rootrel = RelationIdGetRelation(rootid);
+
+	if (inc_should_emit(data->commands, rootrel, &chosen_by)
+			&& chosen_by && chosen_by->via_root)
+	{
+		elog(DEBUG1, "relation %u emitted as its root %u",
+			RelationGetRelid(relation), rootid);
+		entry->include = true;
+		entry->chosen_by = chosen_by;
+		entry->root_relid = rootid;
+
+		/* NULL if the partition has the same layout of the root */
+#if PG_VERSION_NUM >= 130000
+		entry->root_map = convert_tuples_by_name(
+			RelationGetDescr(relation), RelationGetDescr(rootrel));
+#else
+		entry->root_map = convert_tuples_by_name(
+			RelationGetDescr(relation), RelationGetDescr(rootrel),
+			gettext_noop("could not convert row type"));
+#endif
+	}
+
+	RelationClose(rootrel);
+}
+
+/* Return the entry of a root table, shared by all its partitions */
+static JsonRelationEntry *
+root_entry(JsonDecodingData *data, Relation rootrel,
+		InclusionCommand *chosen_by)
+{
+	JsonRelationEntry *entry;
+
+	entry = reldata_enter(data->reldata, RelationGetRelid(rootrel));
+
+	/* Make sure rd_replidindex is set */
+	RelationGetIndexList(rootrel);
+
+	if (entry->stale)
+		reldata_revalidate(
+			entry, rootrel, true, chosen_by, data->pretty_print);
+
+	if (!entry->include)
+	{
+		entry->include = true;
+		entry->chosen_by = chosen_by;
+		reldata_complete(entry, rootrel, data->pretty_print);
+		entry->relnum = ++data->last_relnum;
+	}
+
+	return entry;
+}
+
+/* Convert a tuple of a partition to the layout of its root */
+static HeapTuple
+convert_tuple(HeapTuple tuple, TupleConversionMap *map)
+{
+#if PG_VERSION_NUM >= 120000
+	return execute_attr_map_tuple(tuple, map);
+#else
+	return do_convert_tuple(tuple, map);
+#endif
 }
+#endif
 
 /* Callback for individual changed tuples */
 void
@@ -652,6 +1696,17 @@ rs_decode_change(LogicalDecodingContext *ctx, ReorderBufferTXN *txn,
 	Relation	indexrel;
 	TupleDesc	indexdesc;
 	JsonRelationEntry *entry;
+	int			*changed;
+	HeapTuple	newtuple;
+	HeapTuple	oldtuple;
+	RelStats   *relstats;
+	instr_time	start_time;
+	int			start_len;
+	enum ReorderBufferChangeType action;
+#if PG_VERSION_NUM >= 100000
+	Relation	rootrel = NULL;
+	TupleConversionMap *root_map = NULL;
+#endif
 
 	/* Stop receiving schema changes here too
 	 * If there is an error in the record decoding, the pointer to the
@@ -672,8 +1727,33 @@ rs_decode_change(LogicalDecodingContext *ctx, ReorderBufferTXN *txn,
 	/* Look up or insert a new entry in the cache */
 	entry = reldata_enter(data->reldata, relation->rd_id);
 
+	/* Check if a schema change requires to emit the table again */
+	if (entry->stale) {
+		InclusionCommand *chosen_by = NULL;
+		bool include = inc_should_emit(data->commands, relation, &chosen_by);
+
+		/* Make sure rd_replidindex is set */
+		RelationGetIndexList(relation);
+		reldata_revalidate(
+			entry, relation, include, chosen_by, data->pretty_print);
+	}
+
+#if PG_VERSION_NUM >= 100000
+	/* A partition may be emitted as its root table */
+	if (!entry->include && !entry->exclude
+			&& relation->rd_rel->relispartition)
+		route_to_root(data, entry, relation);
+#endif
+
+	/* The counters survive the entry being reset */
+	if (!entry->stats)
+		entry->stats = stats_enter(data->stats, entry->relid);
+	relstats = entry->stats;
+	relstats->changes++;
+
 	/* check if we have to emit this table */
 	if (entry->exclude) {
+		relstats->excluded++;
 		goto reset_ctx;
 	}
 	else if (!entry->include) {
@@ -681,17 +1761,52 @@ rs_decode_change(LogicalDecodingContext *ctx, ReorderBufferTXN *txn,
 			data->commands, relation, &entry->chosen_by);
 		if (!entry->include) {
 			entry->exclude = true;
+			relstats->excluded++;
 			goto reset_ctx;
 		}
 		else {
 			/* Make sure rd_replidindex is set */
 			RelationGetIndexList(relation);
 			reldata_complete(entry, relation, data->pretty_print);
+
+			/* A new id for every version of the relation seen */
+			entry->relnum = ++data->last_relnum;
 		}
 	}
 
+#if PG_VERSION_NUM >= 100000
+	/* From here on, use the entry and the layout of the root table */
+	if (OidIsValid(entry->root_relid))
+	{
+		rootrel = RelationIdGetRelation(entry->root_relid);
+		root_map = entry->root_map;
+		entry = root_entry(data, rootrel, entry->chosen_by);
+	}
+#endif
+
+	/*
+	 * Skip the operations not requested before doing any work. An update
+	 * of a partitioned stream may be emitted as an insert or a delete: it
+	 * is only checked once the operation to emit is chosen.
+	 */
+	if (entry->chosen_by && entry->chosen_by->ops
+			&& !(entry->keytypes_hash
+				&& change->action == REORDER_BUFFER_CHANGE_UPDATE)
+			&& !(entry->chosen_by->ops & change_op(change->action)))
+	{
+		relstats->skipped_ops++;
+		goto reset_ctx;
+	}
+
 	class_form = RelationGetForm(relation);
 	tupdesc = RelationGetDescr(relation);
+#if PG_VERSION_NUM >= 100000
+	if (rootrel)
+	{
+		class_form = RelationGetForm(rootrel);
+		tupdesc = RelationGetDescr(rootrel);
+	}
+#endif
 
 	/* Avoid leaking memory by using and resetting our own context */
 	MemoryContextSwitchTo(data->context);
@@ -752,36 +1867,110 @@ rs_decode_change(LogicalDecodingContext *ctx, ReorderBufferTXN *txn,
 			Assert(false);
 	}
 
+	/* The tuples to emit, in the layout of the table emitted */
+	newtuple = change->data.tp.newtuple ?
+		&change->data.tp.newtuple->tuple : NULL;
+	oldtuple = change->data.tp.oldtuple ?
+		&change->data.tp.oldtuple->tuple : NULL;
+
+#if PG_VERSION_NUM >= 100000
+	if (root_map)
+	{
+		if (newtuple)
+			newtuple = convert_tuple(newtuple, root_map);
+		if (oldtuple)
+			oldtuple = convert_tuple(oldtuple, root_map);
+	}
+#endif
+
+	/* The operation to emit: a partition may see an update as another one */
+	action = change->action;
+
+	/*
+	 * Only emit the records in our partition, if asked. The old tuple of an
+	 * update is available if the key changes: if the record moves to another
+	 * partition, emit a delete from the old one and an insert into the new.
+	 */
+	if (entry->keytypes_hash)
+	{
+		bool		new_in = key_in_partition(
+			tupdesc, newtuple ? newtuple : oldtuple, entry);
+		bool		old_in = new_in;
+
+		if (action == REORDER_BUFFER_CHANGE_UPDATE && oldtuple != NULL)
+			old_in = key_in_partition(tupdesc, oldtuple, entry);
+
+		if (!new_in && !old_in)
+		{
+			relstats->filtered++;
+			goto reset_ctx;
+		}
+		else if (!old_in)
+			action = REORDER_BUFFER_CHANGE_INSERT;
+		else if (!new_in)
+			action = REORDER_BUFFER_CHANGE_DELETE;
+
+		if (entry->chosen_by->ops
+				&& !(entry->chosen_by->ops & change_op(action)))
+		{
+			relstats->skipped_ops++;
+			goto reset_ctx;
+		}
+	}
+
 	if (entry->row_filter)
 	{
-		Datum			res;
-		bool			isnull;
-		ExprContext	   *econtext;
+		bool		match;
 
-		HeapTuple		oldtup = change->data.tp.oldtuple ?
-			&change->data.tp.oldtuple->tuple : NULL;
-		HeapTuple		newtup = change->data.tp.newtuple ?
-			&change->data.tp.newtuple->tuple : NULL;
+		if (data->track_timing)
+			INSTR_TIME_SET_CURRENT(start_time);
 
-		Assert(entry->exprstate);
-		Assert(entry->estate);
+		match = row_filter_match(entry, newtuple ? newtuple : oldtuple);
 
-		econtext = prepare_per_tuple_econtext(entry->estate, tupdesc);
-		ExecStoreTuple(newtup ? newtup : oldtup, econtext->ecxt_scantuple,
-			InvalidBuffer, false);
-		res = ExecEvalExpr(entry->exprstate, econtext, &isnull, NULL);
-		ExecDropSingleTupleTableSlot(econtext->ecxt_scantuple);
+		if (data->track_timing)
+			STATS_ADD_ELAPSED(relstats->filter_time, start_time);
 
-		/* NULL is same as false for our use. */
-		if (isnull || !DatumGetBool(res))
+		if (!match)
+		{
+			relstats->filtered++;
 			goto reset_ctx;
+		}
 	}
 
-	if (!data->include_empty_xacts && data->nr_changes == 0)
-		output_begin(ctx, data, txn, false);
+	/*
+	 * Drop the updates not changing any of the columns emitted, if the user
+	 * has chosen what columns to receive. The old values can be compared
+	 * only if the replica identity is full: in other cases the old tuple, if
+	 * present, only contains the key, which has changed.
+	 *
+	 * If the old record wasn't matching the row filter the update is
+	 * emitted anyway, as it is the first time the consumer sees the record.
+	 */
+	if (action == REORDER_BUFFER_CHANGE_UPDATE
+			&& entry->chosen_by
+			&& (entry->chosen_by->columns || entry->chosen_by->skip_columns)
+			&& oldtuple != NULL
+			&& relation->rd_rel->relreplident == REPLICA_IDENTITY_FULL)
+	{
+		if (!any_column_changed(tupdesc, oldtuple, newtuple, entry->colidxs)
+				&& (!entry->row_filter || row_filter_match(entry, oldtuple)))
+		{
+			data->nr_noop_updates++;
+			relstats->filtered++;
+			goto reset_ctx;
+		}
+	}
+
+	if (data->nr_changes == 0)
+	{
+		if (!data->include_empty_xacts)
+			output_begin(ctx, data, txn, false);
+	}
 
 	if (data->write_in_chunks)
-		OutputPluginPrepareWrite(ctx, true);
+		output_prepare_write(ctx, true);
+
+	start_len = ctx->out->len;
 
 	/* Change counter */
 	data->nr_changes++;
@@ -802,14 +1991,14 @@ rs_decode_change(LogicalDecodingContext *ctx, ReorderBufferTXN *txn,
 	}
 	else
 	{
-		if (data->nr_changes > 1)
+		if (data->nr_changes > 1 && !data->ndjson)
 			appendStringInfoString(ctx->out, ",{");
 		else
 			appendStringInfoChar(ctx->out, '{');
 	}
 
 	/* Print change kind */
-	switch (change->action)
+	switch (action)
 	{
 		case REORDER_BUFFER_CHANGE_INSERT:
 			if (data->pretty_print)
@@ -833,30 +2022,93 @@ rs_decode_change(LogicalDecodingContext *ctx, ReorderBufferTXN *txn,
 			Assert(false);
 	}
 
-	/* Print table name (possibly) qualified */
-	if (data->pretty_print)
+	/* In ndjson every change is a record on its own: print where it belongs */
+	if (data->ndjson)
 	{
-		if (data->include_schemas)
-			appendStringInfo(ctx->out, "\t\t\t\"schema\": \"%s\",\n", get_namespace_name(class_form->relnamespace));
-		appendStringInfo(ctx->out, "\t\t\t\"table\": \"%s\",\n", NameStr(class_form->relname));
+		char *lsn_str = DatumGetCString(DirectFunctionCall1(pg_lsn_out, change->lsn));
+
+		appendStringInfo(ctx->out, "\"xid\":%u,\"lsn\":\"%s\",", txn->xid, lsn_str);
+		pfree(lsn_str);
 	}
-	else
+
+	/* Print the relation id, if requested */
+	if (data->relation_ids)
+	{
+		if (data->pretty_print)
+			appendStringInfo(ctx->out, "\t\t\t\"relid\": %u,\n", entry->relnum);
+		else
+			appendStringInfo(ctx->out, "\"relid\":%u,", entry->relnum);
+	}
+
+	/*
+	 * Print table name (possibly) qualified. If using relation ids, only
+	 * the first time the relation is seen.
+	 */
+	if (!data->relation_ids || !entry->relname_emitted)
 	{
-		if (data->include_schemas)
-			appendStringInfo(ctx->out, "\"schema\":\"%s\",", get_namespace_name(class_form->relnamespace));
-		appendStringInfo(ctx->out, "\"table\":\"%s\",", NameStr(class_form->relname));
+		if (data->pretty_print)
+		{
+			if (data->include_schemas)
+				appendStringInfo(ctx->out, "\t\t\t\"schema\": \"%s\",\n", get_namespace_name(class_form->relnamespace));
+			appendStringInfo(ctx->out, "\t\t\t\"table\": \"%s\",\n", NameStr(class_form->relname));
+		}
+		else
+		{
+			if (data->include_schemas)
+				appendStringInfo(ctx->out, "\"schema\":\"%s\",", get_namespace_name(class_form->relnamespace));
+			appendStringInfo(ctx->out, "\"table\":\"%s\",", NameStr(class_form->relname));
+		}
+		entry->relname_emitted = true;
 	}
 
-	switch (change->action)
+	/* Formatting the values may include detoasting them */
+	if (data->track_timing)
+		INSTR_TIME_SET_CURRENT(start_time);
+
+	switch (action)
 	{
 		case REORDER_BUFFER_CHANGE_INSERT:
 			/* Print the new tuple */
-			columns_to_stringinfo(ctx, tupdesc, &change->data.tp.newtuple->tuple, false, entry);
+			columns_to_stringinfo(ctx, tupdesc, newtuple, false, entry, NULL);
 			entry->names_emitted = true;
 			break;
 		case REORDER_BUFFER_CHANGE_UPDATE:
+			/*
+			 * Only print the changed columns if asked to. The old values
+			 * can be compared only if the replica identity is full: in other
+			 * cases the old tuple, if present, only contains the key.
+			 */
+			changed = NULL;
+			if (data->update_changed_only
+					&& oldtuple != NULL
+					&& relation->rd_rel->relreplident == REPLICA_IDENTITY_FULL)
+			{
+				changed = find_changed_columns(tupdesc,
+					oldtuple,
+					newtuple, entry);
+			}
+
+			/*
+			 * If the key hasn't changed and it can be found in the values,
+			 * omit it if asked to. Only emit its names the first time.
+			 */
+			if (data->omit_unchanged_key
+					&& oldtuple == NULL
+					&& entry->key_in_values)
+			{
+				columns_to_stringinfo(ctx, tupdesc, newtuple, !entry->key_emitted, entry, changed);
+				entry->names_emitted = true;
+
+				if (!entry->key_emitted)
+				{
+					keynames_to_stringinfo(ctx, tupdesc, entry);
+					entry->key_emitted = true;
+				}
+				break;
+			}
+
 			/* Print the new tuple */
-			columns_to_stringinfo(ctx, tupdesc, &change->data.tp.newtuple->tuple, true, entry);
+			columns_to_stringinfo(ctx, tupdesc, newtuple, true, entry, changed);
 			entry->names_emitted = true;
 
 			/*
@@ -868,7 +2120,7 @@ rs_decode_change(LogicalDecodingContext *ctx, ReorderBufferTXN *txn,
 			 * FIXME if old tuple is not available we must get only the indexed
 			 * columns (the whole tuple is printed).
 			 */
-			if (change->data.tp.oldtuple == NULL)
+			if (oldtuple == NULL)
 			{
 				elog(DEBUG1, "old tuple is null");
 
@@ -876,18 +2128,18 @@ rs_decode_change(LogicalDecodingContext *ctx, ReorderBufferTXN *txn,
 				if (indexrel != NULL)
 				{
 					indexdesc = RelationGetDescr(indexrel);
-					identity_to_stringinfo(ctx, tupdesc, &change->data.tp.newtuple->tuple, indexdesc, entry);
+					identity_to_stringinfo(ctx, tupdesc, newtuple, indexdesc, entry);
 					RelationClose(indexrel);
 				}
 				else
 				{
-					identity_to_stringinfo(ctx, tupdesc, &change->data.tp.newtuple->tuple, NULL, entry);
+					identity_to_stringinfo(ctx, tupdesc, newtuple, NULL, entry);
 				}
 			}
 			else
 			{
 				elog(DEBUG1, "old tuple is not null");
-				identity_to_stringinfo(ctx, tupdesc, &change->data.tp.oldtuple->tuple, NULL, entry);
+				identity_to_stringinfo(ctx, tupdesc, oldtuple, NULL, entry);
 			}
 			entry->key_emitted = true;
 			break;
@@ -898,16 +2150,16 @@ rs_decode_change(LogicalDecodingContext *ctx, ReorderBufferTXN *txn,
 			if (indexrel != NULL)
 			{
 				indexdesc = RelationGetDescr(indexrel);
-				identity_to_stringinfo(ctx, tupdesc, &change->data.tp.oldtuple->tuple, indexdesc, entry);
+				identity_to_stringinfo(ctx, tupdesc, oldtuple, indexdesc, entry);
 				RelationClose(indexrel);
 			}
 			else
 			{
-				identity_to_stringinfo(ctx, tupdesc, &change->data.tp.oldtuple->tuple, NULL, entry);
+				identity_to_stringinfo(ctx, tupdesc, oldtuple, NULL, entry);
 			}
 			entry->key_emitted = true;
 
-			if (change->data.tp.oldtuple == NULL)
+			if (oldtuple == NULL)
 				elog(DEBUG1, "old tuple is null");
 			else
 				elog(DEBUG1, "old tuple is not null");
@@ -917,15 +2169,27 @@ rs_decode_change(LogicalDecodingContext *ctx, ReorderBufferTXN *txn,
 			Assert(false);
 	}
 
+	if (data->track_timing)
+		STATS_ADD_ELAPSED(relstats->format_time, start_time);
+
 	if (data->pretty_print)
 		appendStringInfoString(ctx->out, "\t\t}");
+	else if (data->ndjson)
+		appendStringInfoString(ctx->out, "}\n");
 	else
 		appendStringInfoChar(ctx->out, '}');
 
+	relstats->bytes += ctx->out->len - start_len;
+
 	if (data->write_in_chunks)
-		OutputPluginWrite(ctx, true);
+		output_write(ctx, true);
 
 reset_ctx:
+#if PG_VERSION_NUM >= 100000
+	if (rootrel)
+		RelationClose(rootrel);
+#endif
+
 	MemoryContextSwitchTo(old);
 	MemoryContextReset(data->context);
 
@@ -3,14 +3,25 @@
 
 #include "postgres.h"
 
+#include "lib/stringinfo.h"
 #include "utils/hsearch.h"
+#include "utils/timestamp.h"
 
 #include "includes.h"
+#include "compress.h"
+#include "stats.h"
 
 #ifndef REPLISOME_VERSION
 #define REPLISOME_VERSION unknown
 #endif
 
+/* How to represent bytea values */
+typedef enum ByteaFormat
+{
+	BYTEA_HEX,
+	BYTEA_BASE64
+} ByteaFormat;
+
 typedef struct JsonDecodingData
 {
 	MemoryContext context;
@@ -21,6 +32,9 @@ typedef struct JsonDecodingData
 
 	bool		pretty_print;		/* pretty-print JSON? */
 	bool		write_in_chunks;	/* write in chunks? */
+	int			chunk_size;			/* min bytes to write a chunk */
+	bool		write_pending;		/* prepared write not written yet */
+	bool		ndjson;				/* a record per line for begin/change/commit */
 
 	/*
 	 * LSN pointing to the end of commit record + 1 (txn->end_lsn)
@@ -29,8 +43,37 @@ typedef struct JsonDecodingData
 	bool		include_lsn;		/* include LSNs */
 	bool		include_empty_xacts;	/* emit empty transactions too */
 
+	bool		update_changed_only;	/* only emit changed columns on update */
+	bool		omit_unchanged_key;	/* no oldkey on update if not changed */
+
+	bool		only_local;			/* skip changes with a replication origin */
+
+	ByteaFormat	bytea_format;		/* how to emit bytea values */
+	StringInfo	truncated;			/* positions of the values truncated */
+	bool		relation_ids;		/* refer to tables by id after the first time */
+	uint32		last_relnum;		/* last relation id assigned */
+
+	bool		stream_changes;		/* stream transactions in progress */
+
+	int			heartbeat_xacts;	/* heartbeat after # skipped xacts */
+	int			heartbeat_interval;	/* heartbeat after # seconds of silence */
+	uint64		nr_skipped_xacts;	/* # of xacts skipped since last write */
+	TimestampTz	last_write_time;	/* when the last xact was written */
+
+	int			stats_interval;		/* seconds between stats messages */
+	bool		track_timing;		/* measure time spent in the stats */
+	TimestampTz	last_stats_time;	/* when stats were last emitted */
+	TimestampTz	last_publish_time;	/* when stats were last published */
+	HTAB	   *stats;				/* RelStats of the tables seen */
+
+	CompressMethod compression;		/* how to compress the data written */
+	int			compression_level;	/* 0 for the method default */
+	int			compression_threshold;	/* don't compress smaller writes */
+	int			write_start;		/* offset of our data in ctx->out */
+
 	uint64		nr_changes;			/* # of passes in pg_decode_change() */
 									/* FIXME replace with txn->nentries */
+	uint64		nr_noop_updates;	/* # of updates dropped as no-op */
 
 	InclusionCommands *commands;	/* tables to include/exclude */
 	HTAB *reldata;					/* details about tables processed */
@@ -0,0 +1,339 @@
+#include "stats.h"
+
+#include "funcapi.h"
+#include "miscadmin.h"
+
+#include "replication/slot.h"
+#include "storage/ipc.h"
+#include "storage/lwlock.h"
+#include "storage/shmem.h"
+#include "utils/builtins.h"
+#include "utils/json.h"
+#include "utils/lsyscache.h"
+#include "utils/timestamp.h"
+#include "utils/tuplestore.h"
+
+
+/* The counters of a slot, in shared memory */
+typedef struct SlotStats
+{
+	NameData	slot_name;		/* empty if the entry is free */
+	TimestampTz	updated;		/* last time the counters were published */
+	RelStats	totals;			/* sum of the counters of all the relations */
+} SlotStats;
+
+typedef struct SharedStats
+{
+	LWLock	   *lock;
+	int			nslots;
+	SlotStats	slots[FLEXIBLE_ARRAY_MEMBER];
+} SharedStats;
+
+/* NULL unless the library was loaded in shared_preload_libraries */
+static SharedStats *shared_stats = NULL;
+
+static shmem_startup_hook_type prev_shmem_startup_hook = NULL;
+
+static Size stats_shmem_size(void);
+static void stats_shmem_request(void);
+static void stats_shmem_startup(void);
+static void stats_sum(HTAB *stats, RelStats *total);
+
+
+HTAB *
+stats_create(MemoryContext ctx)
+{
+	HASHCTL		ctl;
+
+	MemSet(&ctl, 0, sizeof(ctl));
+	ctl.keysize = sizeof(Oid);
+	ctl.entrysize = sizeof(RelStats);
+	ctl.hash = oid_hash;
+	ctl.hcxt = ctx;
+
+	return hash_create(
+		"replisome relations stats", 32, &ctl,
+		HASH_ELEM | HASH_FUNCTION | HASH_CONTEXT);
+}
+
+RelStats *
+stats_enter(HTAB *stats, Oid relid)
+{
+	RelStats *entry;
+	bool found;
+
+	entry = (RelStats *)hash_search(
+		stats, (void *)&(relid), HASH_ENTER, &found);
+
+	if (!found)
+	{
+		memset(entry, '\0', sizeof(RelStats));
+		entry->relid = relid;
+	}
+
+	return entry;
+}
+
+/* Sum the counters of all the relations */
+static void
+stats_sum(HTAB *stats, RelStats *total)
+{
+	HASH_SEQ_STATUS status;
+	RelStats *entry;
+
+	memset(total, '\0', sizeof(RelStats));
+
+	hash_seq_init(&status, stats);
+	while ((entry = hash_seq_search(&status)) != NULL) {
+		total->changes += entry->changes;
+		total->excluded += entry->excluded;
+		total->filtered += entry->filtered;
+		total->skipped_ops += entry->skipped_ops;
+		total->bytes += entry->bytes;
+		INSTR_TIME_ADD(total->filter_time, entry->filter_time);
+		INSTR_TIME_ADD(total->format_time, entry->format_time);
+	}
+}
+
+/*
+ * Append the counters of every relation as a list of JSON objects.
+ *
+ * Must be called in a transaction: the names of the relations are looked
+ * up in the catalog. The times are in milliseconds.
+ */
+void
+stats_to_stringinfo(StringInfo buf, HTAB *stats, bool pretty_print)
+{
+	HASH_SEQ_STATUS status;
+	RelStats *entry;
+	char *comma = "";
+	char *relname;
+
+	hash_seq_init(&status, stats);
+	while ((entry = hash_seq_search(&status)) != NULL) {
+		appendStringInfoString(buf, comma);
+		appendStringInfoString(buf, pretty_print ? "\n\t\t{" : "{");
+
+		/* The relation may have been dropped meanwhile */
+		relname = get_rel_name(entry->relid);
+		if (relname)
+		{
+			char *nspname = get_namespace_name(
+				get_rel_namespace(entry->relid));
+
+			appendStringInfoString(buf,
+				pretty_print ? "\"schema\": " : "\"schema\":");
+			escape_json(buf, nspname ? nspname : "");
+			appendStringInfoString(buf,
+				pretty_print ? ", \"table\": " : ",\"table\":");
+			escape_json(buf, relname);
+		}
+		else
+			appendStringInfo(buf,
+				pretty_print ? "\"relid\": %u" : "\"relid\":%u",
+				entry->relid);
+
+		appendStringInfo(buf,
+			pretty_print
+			? ", \"changes\": " UINT64_FORMAT ", \"excluded\": " UINT64_FORMAT
+			  ", \"filtered\": " UINT64_FORMAT ", \"skipped_ops\": " UINT64_FORMAT
+			  ", \"bytes\": " UINT64_FORMAT
+			  ", \"filter_time\": %.3f, \"format_time\": %.3f}"
+			: ",\"changes\":" UINT64_FORMAT ",\"excluded\":" UINT64_FORMAT
+			  ",\"filtered\":" UINT64_FORMAT ",\"skipped_ops\":" UINT64_FORMAT
+			  ",\"bytes\":" UINT64_FORMAT
+			  ",\"filter_time\":%.3f,\"format_time\":%.3f}",
+			entry->changes, entry->excluded, entry->filtered,
+			entry->skipped_ops, entry->bytes,
+			INSTR_TIME_GET_MILLISEC(entry->filter_time),
+			INSTR_TIME_GET_MILLISEC(entry->format_time));
+
+		comma = ",";
+	}
+}
+
+
+/*
+ * Reserve the shared memory to publish the stats of the slots.
+ *
+ * Only possible if the library is in shared_preload_libraries: otherwise
+ * the stats are only available in the stream.
+ */
+void
+stats_init(void)
+{
+	if (!process_shared_preload_libraries_in_progress)
+		return;
+
+	stats_shmem_request();
+
+	prev_shmem_startup_hook = shmem_startup_hook;
+	shmem_startup_hook = stats_shmem_startup;
+}
+
+/* Return true if the stats can be published in shared memory */
+bool
+stats_shared(void)
+{
+	return shared_stats != NULL;
+}
+
+static Size
+stats_shmem_size(void)
+{
+	return add_size(offsetof(SharedStats, slots),
+		mul_size(max_replication_slots, sizeof(SlotStats)));
+}
+
+static void
+stats_shmem_request(void)
+{
+	RequestAddinShmemSpace(stats_shmem_size());
+#if PG_VERSION_NUM >= 90600
+	RequestNamedLWLockTranche("replisome", 1);
+#else
+	RequestAddinLWLocks(1);
+#endif
+}
+
+static void
+stats_shmem_startup(void)
+{
+	bool found;
+
+	if (prev_shmem_startup_hook)
+		prev_shmem_startup_hook();
+
+	LWLockAcquire(AddinShmemInitLock, LW_EXCLUSIVE);
+
+	shared_stats = ShmemInitStruct(
+		"replisome stats", stats_shmem_size(), &found);
+	if (!found)
+	{
+		memset(shared_stats, '\0', stats_shmem_size());
+#if PG_VERSION_NUM >= 90600
+		shared_stats->lock = &(GetNamedLWLockTranche("replisome"))->lock;
+#else
+		shared_stats->lock = LWLockAssign();
+#endif
+		shared_stats->nslots = max_replication_slots;
+	}
+
+	LWLockRelease(AddinShmemInitLock);
+}
+
+/*
+ * Publish the totals of a decoding session in shared memory.
+ *
+ * The entry of the slot is reused by the following sessions; if there is no
+ * free entry, the one updated least recently is taken.
+ */
+void
+stats_publish(const char *slot_name, HTAB *stats)
+{
+	SlotStats *slot = NULL;
+	SlotStats *oldest = NULL;
+	RelStats total;
+	int i;
+
+	if (shared_stats == NULL || shared_stats->nslots == 0)
+		return;
+
+	stats_sum(stats, &total);
+
+	LWLockAcquire(shared_stats->lock, LW_EXCLUSIVE);
+
+	for (i = 0; i < shared_stats->nslots; i++)
+	{
+		SlotStats *s = &shared_stats->slots[i];
+
+		if (strcmp(NameStr(s->slot_name), slot_name) == 0)
+		{
+			slot = s;
+			break;
+		}
+		if (oldest == NULL || s->updated < oldest->updated)
+			oldest = s;
+	}
+
+	if (slot == NULL)
+	{
+		slot = oldest;
+		namestrcpy(&slot->slot_name, slot_name);
+	}
+
+	slot->totals = total;
+	slot->updated = GetCurrentTimestamp();
+
+	LWLockRelease(shared_stats->lock);
+}
+
+
+/* Return the stats published by the slots */
+PG_FUNCTION_INFO_V1(replisome_slot_stats);
+
+Datum
+replisome_slot_stats(PG_FUNCTION_ARGS)
+{
+	ReturnSetInfo *rsinfo = (ReturnSetInfo *) fcinfo->resultinfo;
+	TupleDesc	tupdesc;
+	Tuplestorestate *tupstore;
+	MemoryContext oldcontext;
+	int			i;
+
+	if (shared_stats == NULL)
+		ereport(ERROR,
+				(errcode(ERRCODE_OBJECT_NOT_IN_PREREQUISITE_STATE),
+				 errmsg("replisome must be loaded via shared_preload_libraries to publish stats")));
+
+	if (rsinfo == NULL || !IsA(rsinfo, ReturnSetInfo))
+		ereport(ERROR,
+				(errcode(ERRCODE_FEATURE_NOT_SUPPORTED),
+				 errmsg("set-valued function called in context that cannot accept a set")));
+	if (!(rsinfo->allowedModes & SFRM_Materialize))
+		ereport(ERROR,
+				(errcode(ERRCODE_FEATURE_NOT_SUPPORTED),
+				 errmsg("materialize mode required, but it is not allowed in this context")));
+
+	if (get_call_result_type(fcinfo, NULL, &tupdesc) != TYPEFUNC_COMPOSITE)
+		elog(ERROR, "return type must be a row type");
+
+	oldcontext = MemoryContextSwitchTo(
+		rsinfo->econtext->ecxt_per_query_memory);
+	tupstore = tuplestore_begin_heap(true, false, work_mem);
+	rsinfo->returnMode = SFRM_Materialize;
+	rsinfo->setResult = tupstore;
+	rsinfo->setDesc = tupdesc;
+	MemoryContextSwitchTo(oldcontext);
+
+	LWLockAcquire(shared_stats->lock, LW_SHARED);
+
+	for (i = 0; i < shared_stats->nslots; i++)
+	{
+		SlotStats  *s = &shared_stats->slots[i];
+		Datum		values[9];
+		bool		nulls[9];
+
+		if (NameStr(s->slot_name)[0] == '\0')
+			continue;
+
+		memset(nulls, 0, sizeof(nulls));
+		values[0] = NameGetDatum(&s->slot_name);
+		values[1] = Int64GetDatum(s->totals.changes);
+		values[2] = Int64GetDatum(s->totals.excluded);
+		values[3] = Int64GetDatum(s->totals.filtered);
+		values[4] = Int64GetDatum(s->totals.skipped_ops);
+		values[5] = Int64GetDatum(s->totals.bytes);
+		values[6] = Float8GetDatum(
+			INSTR_TIME_GET_MILLISEC(s->totals.filter_time));
+		values[7] = Float8GetDatum(
+			INSTR_TIME_GET_MILLISEC(s->totals.format_time));
+		values[8] = TimestampTzGetDatum(s->updated);
+
+		tuplestore_putvalues(tupstore, tupdesc, values, nulls);
+	}
+
+	LWLockRelease(shared_stats->lock);
+
+	return (Datum) 0;
+}
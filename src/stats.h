@@ -0,0 +1,44 @@
+#ifndef _STATS_H_
+#define _STATS_H_
+
+#include "postgres.h"
+
+#include "fmgr.h"
+#include "lib/stringinfo.h"
+#include "portability/instr_time.h"
+#include "utils/hsearch.h"
+
+/* Counters about the changes of a relation */
+typedef struct RelStats
+{
+	Oid			relid;
+
+	uint64		changes;		/* changes decoded */
+	uint64		excluded;		/* not emitted because of include/exclude */
+	uint64		filtered;		/* not emitted because of where/partition/noop */
+	uint64		skipped_ops;	/* not emitted because of ops */
+	uint64		bytes;			/* size of the JSON emitted */
+
+	instr_time	filter_time;	/* time spent evaluating the row filter */
+	instr_time	format_time;	/* time spent formatting the values */
+} RelStats;
+
+/* Add the time elapsed since start to a counter */
+#define STATS_ADD_ELAPSED(counter, start) \
+	do { \
+		instr_time	_now; \
+		INSTR_TIME_SET_CURRENT(_now); \
+		INSTR_TIME_ACCUM_DIFF(counter, _now, start); \
+	} while (0)
+
+HTAB *stats_create(MemoryContext ctx);
+RelStats *stats_enter(HTAB *stats, Oid relid);
+void stats_to_stringinfo(StringInfo buf, HTAB *stats, bool pretty_print);
+
+void stats_init(void);
+bool stats_shared(void);
+void stats_publish(const char *slot_name, HTAB *stats);
+
+Datum replisome_slot_stats(PG_FUNCTION_ARGS);
+
+#endif
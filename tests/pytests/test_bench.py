@@ -0,0 +1,120 @@
+import pytest
+
+from replisome import bench
+from replisome.errors import ConfigError
+from replisome.receivers.JsonReceiver import JsonReceiver
+from replisome.filters.TableRenamer import TableRenamer
+from replisome.consumers.Printer import Printer
+
+
+@pytest.mark.parametrize('ndjson', [False, True])
+def test_generated_stream(ndjson):
+    gen = bench.StreamGenerator(
+        ntables=3, ncols=7, value_size=12, ndjson=ndjson, seed=42)
+    opts = [('ndjson', '1')] if ndjson else []
+    jr = JsonReceiver(options=opts)
+
+    stages = bench.run_pipeline(jr, [], None, gen.transactions(50, 4))
+    assert len(stages) == 1
+    assert stages[0].name == 'receiver'
+    assert stages[0].messages == 50
+    assert stages[0].changes == 200
+    assert stages[0].bytes > 0
+
+
+def test_generated_changes_consistent():
+    gen = bench.StreamGenerator(
+        ntables=2, ncols=6, value_size=5, ops={'I': 1, 'U': 1, 'D': 1},
+        seed=1)
+
+    rows = {}
+    seen = set()
+    for i in range(500):
+        ch = gen.change()
+        t = ch['table']
+        if ch['op'] == 'I':
+            if t not in seen:
+                assert ch['colnames'] == ['id', 'c1', 'c2', 'c3', 'c4', 'c5']
+                assert ch['coltypes'] == [
+                    'int4', 'text', 'int4', 'float8', 'bool', 'timestamptz']
+                seen.add(t)
+            else:
+                assert 'colnames' not in ch
+            assert ch['values'][0] not in rows.setdefault(t, set())
+            assert len(ch['values']) == 6
+            assert len(ch['values'][1]) == 5
+            rows[t].add(ch['values'][0])
+        elif ch['op'] == 'U':
+            assert ch['oldkey'][0] in rows[t]
+            assert ch['values'][0] == ch['oldkey'][0]
+        else:
+            assert 'values' not in ch
+            rows[t].remove(ch['oldkey'][0])
+
+
+def test_stages():
+    gen = bench.StreamGenerator(ntables=2, seed=1)
+    received = []
+
+    stages = bench.run_pipeline(
+        JsonReceiver(),
+        [TableRenamer(from_table='bench_0', to_table='foo'),
+            lambda msg: msg if len(msg['tx']) > 1 else None],
+        received.append, gen.transactions(100, 3))
+
+    assert [s.name for s in stages] == [
+        'receiver', 'TableRenamer', '<lambda>', 'append']
+    assert stages[1].messages == 100
+    assert stages[2].messages == stages[3].messages == len(received)
+    assert stages[3].changes == 3 * len(received)
+    for msg in received:
+        assert not [ch for ch in msg['tx'] if ch['table'] == 'bench_0']
+
+
+def test_bench_config():
+    conf = {
+        'receiver': {
+            'class': 'JsonReceiver', 'dsn': 'dbname=foo', 'slot': 'bar',
+            'options': {'ndjson': True}},
+        'filters': [{
+            'class': 'TableRenamer',
+            'options': {'from_table': 'a', 'to_table': 'b'}}]}
+
+    receiver, filters, consumer = bench.make_bench_pipeline(conf)
+    assert isinstance(receiver, JsonReceiver)
+    assert receiver._ndjson
+    assert len(filters) == 1
+    assert consumer is None
+
+
+def test_parse_ops():
+    assert bench.parse_ops('60:30:10') == {'I': 60, 'U': 30, 'D': 10}
+    for s in ('60:30', 'a:b:c', '0:1:1', '1:-1:1'):
+        with pytest.raises(ConfigError):
+            bench.parse_ops(s)
+
+
+def test_raw_stages():
+    gen = bench.StreamGenerator(ntables=2, seed=1)
+    received = []
+
+    class RawConsumer(object):
+        accepts_raw = True
+
+        def __call__(self, msg):
+            received.append(msg)
+
+    stages = bench.run_pipeline(
+        JsonReceiver(), [], RawConsumer(), gen.transactions(10, 3))
+    assert stages[0].messages == 10
+    assert stages[0].changes is None
+    assert all(isinstance(msg, bytes) for msg in received)
+
+    # A filter not accepting raw messages disables them
+    del received[:]
+    stages = bench.run_pipeline(
+        JsonReceiver(), [TableRenamer(from_table='a', to_table='b')],
+        RawConsumer(), gen.transactions(10, 3))
+    assert stages[0].changes == 30
+    assert all(isinstance(msg, dict) for msg in received)
+    assert Printer.accepts_raw
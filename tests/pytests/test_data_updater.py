@@ -1,7 +1,7 @@
 import pytest
 from decimal import Decimal
 
-from replisome.errors import ReplisomeError
+from replisome.errors import ConfigError, ReplisomeError
 from replisome.consumers.DataUpdater import DataUpdater
 from replisome.receivers.JsonReceiver import JsonReceiver
 
@@ -374,6 +374,169 @@ def test_update_missing_col(src_db, tgt_db, called):
     assert rs == [(1, 'hello', None), (2, 'world', 'mama')]
 
 
+def test_update_changed_only(src_db, tgt_db, called):
+    du = DataUpdater(tgt_db.conn.dsn)
+    c = called(du, 'process_message')
+
+    jr = JsonReceiver(slot=src_db.slot, message_cb=du.process_message,
+                      options=[('update-changed-only', 't')])
+    src_db.thread_receive(jr, src_db.make_repl_conn())
+
+    scur = src_db.conn.cursor()
+    tcur = tgt_db.conn.cursor()
+
+    for _c in [scur, tcur]:
+        _c.execute("drop table if exists testup")
+        _c.execute("""
+            create table testup (
+                id integer primary key, data text, more text, n int)
+            """)
+
+    scur.execute("alter table testup replica identity full")
+    scur.execute("insert into testup values (1, 'hello', 'world', 10)")
+    c.get()
+
+    # The target changes a column the source won't send
+    tcur.execute("update testup set more = 'target' where id = 1")
+
+    scur.execute("update testup set data = 'mama' where id = 1")
+    c.get()
+    scur.execute("update testup set n = 20 where id = 1")
+    c.get()
+    scur.execute("update testup set data = 'papa', n = 30 where id = 1")
+    c.get()
+
+    tcur.execute("select * from testup")
+    assert tcur.fetchall() == [(1, 'papa', 'target', 30)]
+
+    assert len(du._partial_stmts[(u'public', u'testup')]) == 3
+
+
+def test_update_omit_unchanged_key(src_db, tgt_db, called):
+    du = DataUpdater(tgt_db.conn.dsn)
+    c = called(du, 'process_message')
+
+    jr = JsonReceiver(slot=src_db.slot, message_cb=du.process_message,
+                      options=[('omit-unchanged-key', 't')])
+    src_db.thread_receive(jr, src_db.make_repl_conn())
+
+    scur = src_db.conn.cursor()
+    tcur = tgt_db.conn.cursor()
+
+    for _c in [scur, tcur]:
+        _c.execute("drop table if exists testup")
+        _c.execute("create table testup (id integer primary key, data text)")
+
+    scur.execute("insert into testup values (1, 'hello'), (2, 'world')")
+    c.get()
+
+    scur.execute("update testup set data = 'mama' where id = 2")
+    c.get()
+    scur.execute("update testup set id = 3 where id = 1")
+    c.get()
+
+    tcur.execute("select * from testup order by id")
+    assert tcur.fetchall() == [(2, 'mama'), (3, 'hello')]
+
+
+def test_relation_ids(src_db, tgt_db, called):
+    du = DataUpdater(tgt_db.conn.dsn)
+    c = called(du, 'process_message')
+
+    jr = JsonReceiver(slot=src_db.slot, message_cb=du.process_message,
+                      options=[('relation-ids', 't')])
+    src_db.thread_receive(jr, src_db.make_repl_conn())
+
+    scur = src_db.conn.cursor()
+    tcur = tgt_db.conn.cursor()
+
+    for _c in [scur, tcur]:
+        _c.execute("drop table if exists testrelid")
+        _c.execute(
+            "create table testrelid (id integer primary key, data text)")
+
+    scur.execute("insert into testrelid values (1, 'hello')")
+    c.get()
+    assert list(du._relnames.values()) == [('public', 'testrelid')]
+
+    scur.execute("insert into testrelid values (2, 'world')")
+    c.get()
+    scur.execute("update testrelid set data = 'mama' where id = 1")
+    c.get()
+    scur.execute("delete from testrelid where id = 2")
+    c.get()
+
+    tcur.execute("select * from testrelid")
+    assert tcur.fetchall() == [(1, 'mama')]
+    assert list(du._stmts['I']) == list(du._relnames)
+
+
+def test_origin(src_db, tgt_db, called):
+    du = DataUpdater(tgt_db.conn.dsn, origin='replisome_test')
+    c = called(du, 'process_message')
+
+    jr = JsonReceiver(slot=src_db.slot, message_cb=du.process_message)
+    src_db.thread_receive(jr, src_db.make_repl_conn())
+
+    scur = src_db.conn.cursor()
+    tcur = tgt_db.conn.cursor()
+
+    for _c in [scur, tcur]:
+        _c.execute("drop table if exists testorig")
+        _c.execute("create table testorig (id integer primary key)")
+
+    scur.execute("insert into testorig values (1)")
+    c.get()
+
+    tcur.execute("select * from testorig")
+    assert tcur.fetchall() == [(1,)]
+
+    cur = du._connection.cursor()
+    cur.execute("select pg_replication_origin_session_is_setup()")
+    assert cur.fetchone()[0]
+
+    du._connection.close()
+    tcur.execute("select pg_replication_origin_drop('replisome_test')")
+
+
+def test_track_progress(src_db, tgt_db, called):
+    with pytest.raises(ConfigError):
+        DataUpdater(tgt_db.conn.dsn, track_progress=True)
+
+    du = DataUpdater(
+        tgt_db.conn.dsn, origin='replisome_test', track_progress=True)
+    c = called(du, 'process_message')
+
+    jr = JsonReceiver(slot=src_db.slot, message_cb=du.process_message,
+                      options=[('include-lsn', 't')])
+    src_db.thread_receive(jr, src_db.make_repl_conn())
+
+    scur = src_db.conn.cursor()
+    tcur = tgt_db.conn.cursor()
+
+    for _c in [scur, tcur]:
+        _c.execute("drop table if exists testprog")
+        _c.execute("create table testprog (id integer primary key)")
+
+    assert du.start_lsn() is None
+
+    scur.execute("insert into testprog values (1)")
+    c.get()
+    scur.execute("select pg_current_wal_lsn()"
+                 if src_db.conn.server_version >= 100000
+                 else "select pg_current_xlog_location()")
+    lsn = scur.fetchone()[0]
+
+    # The position of the commit applied has been recorded
+    start = du.start_lsn()
+    assert start is not None
+    tcur.execute("select %s::pg_lsn <= %s::pg_lsn", [start, lsn])
+    assert tcur.fetchone()[0]
+
+    du._connection.close()
+    tcur.execute("select pg_replication_origin_drop('replisome_test')")
+
+
 def test_delete(src_db, tgt_db, called):
     du = DataUpdater(tgt_db.conn.dsn, skip_missing_columns=True,
                     skip_missing_tables=True)
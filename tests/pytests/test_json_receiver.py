@@ -1,6 +1,7 @@
 import pytest
 from six.moves.queue import Queue, Empty
 
+from replisome.errors import ConfigError, ReplisomeError
 from replisome.receivers.JsonReceiver import JsonReceiver
 
 
@@ -137,6 +138,251 @@ def test_break_half_message(src_db):
     assert c['values'] == [1]
 
 
+def test_stream_messages():
+    r = Receiver()
+    jr = JsonReceiver(message_cb=r.receive)
+
+    def ch(xid, id):
+        return {'xid': xid, 'op': 'I', 'table': 't', 'values': [id]}
+
+    jr.consume_stream({'xid': 10, 'stream': 'block', 'tx': [ch(10, 1)]})
+    jr.consume_stream({'xid': 20, 'stream': 'block', 'tx': [ch(20, 100)]})
+    jr.consume_stream(
+        {'xid': 10, 'stream': 'block', 'tx': [ch(11, 2), ch(10, 3)]})
+    jr.consume_stream(
+        {'xid': 10, 'subxid': 11, 'stream': 'abort', 'tx': []})
+    assert r.received.empty()
+
+    jr.consume_stream({'xid': 20, 'stream': 'abort', 'tx': []})
+    jr.consume_stream({'xid': 20, 'stream': 'commit', 'tx': []})
+    assert r.received.empty()
+
+    jr.consume_stream(
+        {'xid': 10, 'stream': 'commit', 'nextlsn': '0/10', 'tx': []})
+    d = r.received.get(timeout=1)
+    assert d == {
+        'xid': 10, 'nextlsn': '0/10',
+        'tx': [
+            {'op': 'I', 'table': 't', 'values': [1]},
+            {'op': 'I', 'table': 't', 'values': [3]}]}
+    assert not jr._streams
+
+
+def test_ndjson_records():
+    r = Receiver()
+    jr = JsonReceiver(message_cb=r.receive, options=[('ndjson', 't')])
+
+    msgs = [
+        FakeMessage(b'{"xid":10,"begin":true}\n', 0x10),
+        FakeMessage(
+            b'{"op":"I","xid":10,"lsn":"0/11","table":"t","values":[1]}\n',
+            0x11),
+        FakeMessage(
+            b'{"op":"I","xid":10,"lsn":"0/12","table":"t","values":[2]}\n',
+            0x12),
+        FakeMessage(b'{"commit":true,"xid":10,"nextlsn":"0/20"}\n', 0x20),
+        FakeMessage(b'{"heartbeat":true,"nextlsn":"0/30"}\n', 0x30)]
+
+    for msg in msgs[:3]:
+        jr.consume(msg)
+        assert r.received.empty()
+        assert msg.cursor.feedback == [msg.data_start]
+
+    for msg in msgs[3:]:
+        jr.consume(msg)
+
+    d = r.received.get(timeout=1)
+    assert d['xid'] == 10
+    assert [c['values'] for c in d['tx']] == [[1], [2]]
+    assert r.received.empty()
+
+    with pytest.raises(ReplisomeError):
+        jr.consume(msgs[1])
+
+
+def test_decompress():
+    import zlib
+    import struct
+
+    jr = JsonReceiver()
+    data = b'{"tx":[' + b','.join([b'{"op":"I","values":[1]}'] * 100) + b']}'
+
+    # Uncompressed messages are returned unchanged
+    assert jr.decompress(data) == data
+    assert jr.decompress(b']}') == b']}'
+
+    msg = b'\0z' + struct.pack('!I', len(data)) + zlib.compress(data)
+    assert len(msg) < len(data)
+    assert jr.decompress(msg) == data
+
+    with pytest.raises(ReplisomeError):
+        jr.decompress(b'\0z' + struct.pack('!I', 10) + zlib.compress(data))
+
+    with pytest.raises(ReplisomeError):
+        jr.decompress(b'\0x' + struct.pack('!I', len(data)) + data)
+
+
+def test_heartbeat():
+    r = Receiver()
+    jr = JsonReceiver(message_cb=r.receive)
+
+    msgs = [
+        FakeMessage(b'{"heartbeat":true,"nextlsn":"0/20","tx":[', 0x10),
+        FakeMessage(b']}', 0x20)]
+    for msg in msgs:
+        jr.consume(msg)
+
+    assert r.received.empty()
+    assert msgs[-1].cursor.feedback == [0x20]
+
+
+@pytest.mark.parametrize('fmt, ab, xyz', [
+    ('hex', b'"6162"', b'"78797a"'),
+    ('base64', b'"YWI="', b'"eHl6"'),
+])
+def test_decode_bytea(fmt, ab, xyz):
+    r = Receiver()
+    jr = JsonReceiver(
+        message_cb=r.receive, options=[('bytea-format', fmt)],
+        decode_bytea=True)
+
+    msgs = [
+        FakeMessage(
+            b'{"tx":[{"op":"I","schema":"public","table":"t",'
+            b'"colnames":["id","data","blob"],'
+            b'"coltypes":["bytea","text","bytea"],'
+            b'"values":[' + ab + b',"6162",null]},', 0x10),
+        FakeMessage(
+            b'{"op":"U","schema":"public","table":"t",'
+            b'"colidxs":[1,2],"values":["6162",' + xyz + b'],'
+            b'"keynames":["id"],"keytypes":["bytea"],'
+            b'"oldkey":[' + ab + b']}', 0x20),
+        FakeMessage(b']}', 0x30)]
+    for msg in msgs:
+        jr.consume(msg)
+
+    tx = r.received.get(timeout=1)['tx']
+    assert tx[0]['values'] == [b'ab', u'6162', None]
+    assert tx[1]['values'] == [u'6162', b'xyz']
+    assert tx[1]['oldkey'] == [b'ab']
+
+
+def test_decode_bytea_needs_types():
+    with pytest.raises(ConfigError):
+        JsonReceiver.from_config(
+            {'decode_bytea': True, 'include_types': False})
+
+    jr = JsonReceiver.from_config(
+        {'decode_bytea': True, 'include_types': True})
+    assert jr.decode_bytea
+
+
+def test_stats():
+    r = Receiver()
+    stats = []
+    jr = JsonReceiver(message_cb=r.receive)
+    jr.stats_cb = stats.append
+
+    msgs = [
+        FakeMessage(
+            b'{"stats":true,"nextlsn":"0/20","tables":[{"schema":"public",'
+            b'"table":"t","changes":3,"excluded":0,"filtered":1,'
+            b'"skipped_ops":0,"bytes":120,"filter_time":0.010,'
+            b'"format_time":0.020}],"tx":[', 0x10),
+        FakeMessage(b']}', 0x20)]
+    for msg in msgs:
+        jr.consume(msg)
+
+    assert r.received.empty()
+    assert len(stats) == 1
+    assert stats[0]['tables'][0]['changes'] == 3
+    assert msgs[-1].cursor.feedback == [0x20]
+
+
+def test_raw():
+    r = Receiver()
+    jr = JsonReceiver(message_cb=r.receive)
+    jr.raw = True
+
+    msgs = [
+        FakeMessage(b'{"xid":10,"tx":[', 0x10),
+        FakeMessage(
+            b'{"op":"I","table":"t","values":["\\"stats\\":"]}', 0x11),
+        FakeMessage(b']}', 0x20)]
+    for msg in msgs:
+        jr.consume(msg)
+
+    assert r.received.get(timeout=1) == b''.join(m.payload for m in msgs)
+    assert msgs[-1].cursor.feedback == [0x20]
+
+    # Heartbeats and stats are still processed
+    stats = []
+    jr.stats_cb = stats.append
+    for payload in (
+            b'{"heartbeat":true,"nextlsn":"0/20","tx":[',
+            b'{\n\t"stats": true,\n\t"nextlsn": "0/20",\n\t"tables": [\n\t],'
+            b'\n\t"tx": ['):
+        jr.consume(FakeMessage(payload, 0x30))
+        jr.consume(FakeMessage(b']}', 0x40))
+
+    assert r.received.empty()
+    assert len(stats) == 1
+
+    # Streamed transactions are assembled
+    for payload in (
+            b'{"stream":"block","xid":11,"tx":[',
+            b'{"op":"I","xid":11,"table":"t","values":[1]}', b']}',
+            b'{"stream":"commit","xid":11,"tx":[', b']}'):
+        jr.consume(FakeMessage(payload, 0x50))
+
+    assert r.received.get(timeout=1)['tx'] == [
+        {'op': 'I', 'table': 't', 'values': [1]}]
+
+
+def test_raw_ndjson():
+    r = Receiver()
+    jr = JsonReceiver(message_cb=r.receive, options=[('ndjson', 't')])
+    jr.raw = True
+
+    for payload in (
+            b'{"xid":10,"begin":true}\n',
+            b'{"op":"I","xid":10,"table":"t","values":[1]}\n',
+            b'{"commit":true,"xid":10,"nextlsn":"0/20"}\n'):
+        jr.consume(FakeMessage(payload, 0x10))
+
+    assert r.received.get(timeout=1)['tx'][0]['values'] == [1]
+
+
+def test_can_pass_raw():
+    assert JsonReceiver().can_pass_raw()
+    assert JsonReceiver(options=[('ndjson', 'f')]).can_pass_raw()
+    assert not JsonReceiver(options=[('ndjson', 't')]).can_pass_raw()
+    assert not JsonReceiver(
+        options=[('stream-changes', 't')]).can_pass_raw()
+    assert not JsonReceiver(decode_bytea=True).can_pass_raw()
+
+
+class FakeMessage(object):
+    def __init__(self, payload, data_start):
+        self.payload = payload
+        self.data_start = data_start
+        self.cursor = FakeCursor()
+
+
+class FakeCursor(object):
+    def __init__(self):
+        self.connection = FakeConnection()
+        self.feedback = []
+
+    def send_feedback(self, flush_lsn):
+        self.feedback.append(flush_lsn)
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.notices = []
+
+
 class Receiver(object):
     def __init__(self):
         self.received = Queue()
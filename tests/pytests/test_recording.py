@@ -0,0 +1,253 @@
+import json
+import time
+
+import pytest
+
+from replisome.bench import StreamGenerator
+from replisome.config import make_pipeline
+from replisome.errors import ConfigError, ReplisomeError
+from replisome.pipeline import Pipeline
+from replisome.recording import RecordWriter, RecordReader, parse_lsn
+from replisome.receivers.JsonReceiver import JsonReceiver
+from replisome.receivers.ReplayReceiver import (
+    ReplayReceiver, ReplayCursor, ReplayMessage)
+
+
+def test_write_read(tmpdir):
+    fn = str(tmpdir.join('rec'))
+    with open(fn, 'ab') as f:
+        w = RecordWriter(f)
+        w.write(100, 1000.5, b'{"tx":[')
+        w.write(200, 1001.5, b']}')
+
+    # The file is appended to
+    with open(fn, 'ab') as f:
+        w = RecordWriter(f)
+        w.write(300, 1002.5, b'')
+
+    with open(fn, 'rb') as f:
+        assert list(RecordReader(f)) == [
+            (100, 1000.5, b'{"tx":['),
+            (200, 1001.5, b']}'),
+            (300, 1002.5, b'')]
+
+
+def test_read_truncated(tmpdir):
+    fn = str(tmpdir.join('rec'))
+    with open(fn, 'ab') as f:
+        w = RecordWriter(f)
+        w.write(100, 1000.5, b'hello')
+        w.write(200, 1001.5, b'world')
+
+    with open(fn, 'rb+') as f:
+        f.seek(-2, 2)
+        f.truncate()
+
+    with open(fn, 'rb') as f:
+        assert list(RecordReader(f)) == [(100, 1000.5, b'hello')]
+
+
+def test_read_bad_file(tmpdir):
+    fn = str(tmpdir.join('rec'))
+    with open(fn, 'wb') as f:
+        f.write(b'{"tx":[]}')
+
+    with open(fn, 'rb') as f:
+        with pytest.raises(ReplisomeError):
+            RecordReader(f)
+
+
+def test_parse_lsn():
+    assert parse_lsn('0/0') == 0
+    assert parse_lsn('0/1A2B') == 0x1A2B
+    assert parse_lsn('2/10') == (2 << 32) + 16
+    with pytest.raises(ReplisomeError):
+        parse_lsn('10')
+
+
+def test_receiver_records(tmpdir):
+    fn = str(tmpdir.join('rec'))
+    received = []
+    jr = JsonReceiver(message_cb=received.append)
+    cursor = ReplayCursor()
+    with open(fn, 'ab') as f:
+        jr.recorder = RecordWriter(f)
+        for i, chunk in enumerate([b'{"tx":[', b'{"op":"I"}', b']}']):
+            jr.consume(ReplayMessage(chunk, cursor, 100 + i))
+
+    assert received == [{'tx': [{'op': 'I'}]}]
+    with open(fn, 'rb') as f:
+        recs = list(RecordReader(f))
+    assert [r[0] for r in recs] == [100, 101, 102]
+    assert [r[2] for r in recs] == [b'{"tx":[', b'{"op":"I"}', b']}']
+
+
+def record_stream(fn, ndjson=False, ntx=10):
+    gen = StreamGenerator(ntables=2, ncols=4, ndjson=ndjson, seed=1)
+    with open(fn, 'ab') as f:
+        w = RecordWriter(f)
+        lsn = 0
+        for tx in gen.transactions(ntx, 3):
+            for chunk in tx:
+                lsn += 0x10
+                w.write(lsn, 1000.0 + lsn / 1000.0, chunk.encode('ascii'))
+
+
+@pytest.mark.parametrize('ndjson', [False, True])
+def test_replay_pipeline(tmpdir, capsys, ndjson):
+    fn = str(tmpdir.join('rec'))
+    record_stream(fn, ndjson=ndjson)
+
+    conf = {
+        'receiver': {
+            'class': 'ReplayReceiver',
+            'options': {'filename': fn, 'ndjson': ndjson}},
+        'filters': [{
+            'class': 'TableRenamer',
+            'options': {'from_table': 'bench_0', 'to_table': 'foo'}}],
+        'consumer': {'class': 'Printer'}}
+    pl = make_pipeline(conf)
+    assert isinstance(pl.receiver, ReplayReceiver)
+    pl.start()
+
+    out = capsys.readouterr()[0].splitlines()
+    assert len(out) == 10
+    for line in out:
+        msg = json.loads(line)
+        assert len(msg['tx']) == 3
+        for ch in msg['tx']:
+            assert ch['table'] in ('foo', 'bench_1')
+
+
+def test_replay_raw(tmpdir, capsys):
+    fn = str(tmpdir.join('rec'))
+    record_stream(fn)
+
+    conf = {
+        'receiver': {'class': 'ReplayReceiver', 'options': {'filename': fn}},
+        'consumer': {'class': 'Printer'}}
+    pl = make_pipeline(conf)
+    pl.start()
+    assert pl.receiver.raw
+
+    # The messages are printed as received
+    with open(fn, 'rb') as f:
+        data = b''.join(rec[2] for rec in RecordReader(f))
+    out = capsys.readouterr()[0]
+    assert out.replace('\n', '') == data.decode('ascii')
+    assert len(out.splitlines()) == 10
+
+
+@pytest.mark.parametrize('options, raw', [
+    ({}, True),
+    ({'ndjson': True}, False),
+    ({'stream_changes': True}, False),
+    ({'decode_bytea': True}, False)])
+def test_replay_raw_options(tmpdir, options, raw):
+    fn = str(tmpdir.join('rec'))
+    record_stream(fn, ndjson=options.get('ndjson', False))
+
+    received = []
+
+    class RawConsumer(object):
+        accepts_raw = True
+
+        def __call__(self, msg):
+            received.append(msg)
+
+    # The messages the receiver assembles or changes are never raw
+    options = dict(options, filename=fn)
+    pl = Pipeline()
+    pl.receiver = ReplayReceiver.from_config(options)
+    pl.consumer = RawConsumer()
+    pl.start()
+    assert pl.receiver.raw == raw
+    assert len(received) == 10
+    assert all(isinstance(msg, raw and bytes or dict) for msg in received)
+
+
+@pytest.mark.parametrize('ndjson', [False, True])
+def test_replay_from_lsn(tmpdir, ndjson):
+    fn = str(tmpdir.join('rec'))
+    record_stream(fn, ndjson=ndjson, ntx=4)
+
+    # Every transaction is 5 chunks, 0x10 apart: skip the first two
+    received = []
+    rr = ReplayReceiver(
+        filename=fn, options=[('ndjson', ndjson and 't' or 'f')],
+        message_cb=received.append)
+    rr.start(lsn='0/%X' % (0x10 * 10 + 1))
+    assert len(received) == 2
+
+    # A transaction ending after the position is received whole
+    del received[:]
+    rr.start(lsn='0/%X' % (0x10 * 8))
+    assert len(received) == 3
+    assert [len(msg['tx']) for msg in received] == [3, 3, 3]
+
+
+def test_replay_stream_from_lsn(tmpdir):
+    fn = str(tmpdir.join('rec'))
+    with open(fn, 'ab') as f:
+        w = RecordWriter(f)
+        for lsn, chunk in [
+                (0x10, b'{"stream":"block","xid":11,"tx":['),
+                (0x11, b'{"op":"I","xid":11,"table":"t","values":[1]}'),
+                (0x12, b']}'),
+                (0x20, b'{"xid":12,"tx":['),
+                (0x21, b'{"op":"I","table":"t","values":[10]}'),
+                (0x22, b']}'),
+                (0x30, b'{"stream":"block","xid":11,"tx":['),
+                (0x31, b'{"op":"I","xid":11,"table":"t","values":[2]}'),
+                (0x32, b']}'),
+                (0x40, b'{"stream":"commit","xid":11,"tx":['),
+                (0x41, b']}'),
+                (0x50, b'{"xid":13,"tx":['),
+                (0x51, b'{"op":"I","table":"t","values":[20]}'),
+                (0x52, b']}')]:
+            w.write(lsn, 1000.0, chunk)
+
+    # A streamed transaction committed after the position is received whole
+    received = []
+    rr = ReplayReceiver(
+        filename=fn, options=[('stream-changes', 't')],
+        message_cb=received.append)
+    rr.start(lsn='0/23')
+    assert [[ch['values'][0] for ch in msg['tx']] for msg in received] == [
+        [1, 2], [20]]
+
+    del received[:]
+    rr.start(lsn='0/42')
+    assert [[ch['values'][0] for ch in msg['tx']] for msg in received] == [
+        [20]]
+    assert rr.message_cb == received.append
+
+
+def test_replay_speed(tmpdir):
+    fn = str(tmpdir.join('rec'))
+    with open(fn, 'ab') as f:
+        w = RecordWriter(f)
+        w.write(1, 1000.0, b'{"tx":[')
+        w.write(2, 1000.0, b']}')
+        w.write(3, 1000.4, b'{"tx":[')
+        w.write(4, 1000.4, b']}')
+
+    received = []
+    rr = ReplayReceiver(filename=fn, speed=2, message_cb=received.append)
+    t0 = time.time()
+    rr.start()
+    assert len(received) == 2
+    assert time.time() - t0 >= 0.2
+
+
+def test_replay_config():
+    with pytest.raises(ConfigError):
+        ReplayReceiver.from_config({})
+    with pytest.raises(ConfigError):
+        ReplayReceiver.from_config({'filename': 'x', 'speed': 'fast'})
+
+    rr = ReplayReceiver.from_config(
+        {'filename': 'x', 'speed': '1.5', 'include_lsn': True})
+    assert rr.filename == 'x'
+    assert rr.speed == 1.5
+    assert rr.options == [('include-lsn', 't')]
@@ -0,0 +1,282 @@
+import json
+import time
+
+import pytest
+from psycopg2 import sql
+
+from replisome import sync
+from replisome.errors import ConfigError
+from replisome.pipeline import Pipeline
+from replisome.consumers.DataUpdater import DataUpdater, copy_text
+from replisome.filters.TableRenamer import TableRenamer
+from replisome.receivers.JsonReceiver import JsonReceiver
+
+
+def test_parse_copy_line():
+    reader = sync.CopyReader(
+        [None, int, sync.parse_float, sync.parse_bool, sync.parse_bytea,
+            None], None)
+    assert reader.parse_line(
+        u'a\\tb\\\\c\\nd\t42\t2.5\tt\t\\\\x00ff\t\\N') == \
+        [u'a\tb\\c\nd', 42, 2.5, True, b'\x00\xff', None]
+    assert reader.parse_line(u'\\N\t\\N\tNaN\tf\t\\N\t') == \
+        [None, None, None, False, None, u'']
+    assert reader.parse_line(u'x\t1\t-Infinity\tf\t\\\\x\tx') == \
+        [u'x', 1, None, False, b'', u'x']
+
+
+def test_copy_text_round_trip():
+    values = [u'a\tb\\c\nd\re', 42, 2.5, True, False, b'\x00\xff', None,
+        u'\u20ac']
+    reader = sync.CopyReader(
+        [None, int, sync.parse_float, sync.parse_bool, sync.parse_bool,
+            sync.parse_bytea, int, None], None)
+    assert reader.parse_line(copy_text(values)) == values
+
+
+def test_copy_reader_split():
+    rows = []
+    reader = sync.CopyReader([int], rows.append)
+    reader.write(b'1\tfoo\n2\tb')
+    reader.write(b'ar\n')
+    reader.write(b'3\t\xe2\x82\xac\n')
+    reader.close()
+    assert rows == [[1, u'foo'], [2, u'bar'], [3, u'\u20ac']]
+
+    reader.write(b'4\tba')
+    with pytest.raises(Exception):
+        reader.close()
+
+
+def test_changes_batch():
+    t = sync.SyncTable(1, 'public', 'foo')
+    t.columns = [('id', 23, 'int4'), ('data', 25, 'text')]
+    msgs = []
+    batch = sync.ChangesBatch(t, 2, True, True, msgs.append)
+    for i in range(5):
+        batch.add([i, 'x'])
+    batch.flush()
+
+    assert batch.count == 5
+    assert [len(m['tx']) for m in msgs] == [2, 2, 1]
+    for m in msgs:
+        first = m['tx'][0]
+        assert first['colnames'] == ['id', 'data']
+        assert first['coltypes'] == ['int4', 'text']
+        for ch in m['tx'][1:]:
+            assert 'colnames' not in ch
+        for ch in m['tx']:
+            assert ch['op'] == 'I'
+            assert ch['schema'] == 'public'
+            assert ch['table'] == 'foo'
+
+    msgs = []
+    batch = sync.ChangesBatch(t, 10, False, False, msgs.append)
+    batch.add([1, 'x'])
+    batch.flush()
+    assert msgs == [{'tx': [
+        {'op': 'I', 'table': 'foo', 'colnames': ['id', 'data'],
+            'values': [1, 'x']}]}]
+
+
+def test_choose_command():
+    def syncer(*cmds):
+        opts = [(k, json.dumps(c)) for k, c in cmds]
+        return sync.Syncer(JsonReceiver(options=opts), None)
+
+    assert syncer().choose_command([]) == {}
+
+    s = syncer(
+        ('include', {'schema': 'a'}),
+        ('exclude', {'table': 'b'}),
+        ('include', {'tables': '^b', 'where': 'id > 0'}))
+    assert s.choose_command([False, False, False]) is None
+    assert s.choose_command([True, False, False]) == {'schema': 'a'}
+    assert s.choose_command([True, True, False]) is None
+    assert s.choose_command([True, True, True]) == {
+        'tables': '^b', 'where': 'id > 0'}
+
+    s = syncer(
+        ('exclude', {'table': 'b'}),
+        ('include', {'table': 'b', 'where': 'id > 0'}))
+    assert s.choose_command([False, False]) == {}
+    assert s.choose_command([True, False]) is None
+    assert s.choose_command([True, True]) == {'table': 'b', 'where': 'id > 0'}
+
+
+def test_process_bulk():
+    class Consumer(object):
+        def __init__(self):
+            self.bulk = []
+            self.msgs = []
+
+        def __call__(self, msg):
+            self.msgs.append(msg)
+
+        def bulk_load(self, msg):
+            self.bulk.append(msg)
+
+    msg = {'tx': [{'op': 'I', 'table': 'foo', 'values': [1]}]}
+
+    pl = Pipeline()
+    pl.filters.append(TableRenamer(from_table='foo', to_table='bar'))
+    pl.consumer = Consumer()
+    pl.process_bulk(msg)
+    assert pl.consumer.bulk == [msg]
+    assert msg['tx'][0]['table'] == 'bar'
+    assert not pl.consumer.msgs
+
+    received = []
+    pl.consumer = received.append
+    pl.process_bulk(msg)
+    assert received == [msg]
+
+    pl.filters.append(lambda msg: None)
+    pl.process_bulk(msg)
+    assert received == [msg]
+
+
+def test_sync(src_db, tgt_db):
+    scur = src_db.conn.cursor()
+    scur.execute("""
+        drop table if exists testsync;
+        create table testsync (
+            id serial primary key, data text, more text, flag bool,
+            num float8);
+        insert into testsync (data, more, flag, num)
+            select 'd' || i, 'm' || i, i % 2 = 0, i / 2.0
+            from generate_series(1, 1000) s(i);
+        analyze testsync;
+        """)
+
+    tcur = tgt_db.conn.cursor()
+    tcur.execute("""
+        drop table if exists testsync;
+        create table testsync (
+            id int primary key, data text, flag bool, num float8);
+        """)
+
+    receiver = JsonReceiver(
+        slot='rs_sync_test', dsn=src_db.dsn,
+        options=[('include', json.dumps({
+            'table': 'testsync', 'skip_columns': ['more'],
+            'where': 'id <> 3'}))])
+    src_db.at_exit(receiver.drop_slot)
+
+    def make_pipeline():
+        pl = Pipeline()
+        pl.consumer = DataUpdater(tgt_db.dsn)
+        return pl
+
+    syncer = sync.Syncer(
+        receiver, make_pipeline, jobs=3, chunk_rows=100, batch_rows=30)
+    lsn = syncer.run()
+
+    # The changes after the snapshot are not copied
+    scur.execute("insert into testsync (data) values ('after')")
+
+    tcur.execute("select count(*), sum(id) from testsync")
+    assert tcur.fetchone() == (999, 1000 * 1001 // 2 - 3)
+    tcur.execute("select * from testsync where id = 10")
+    assert tcur.fetchone() == (10, 'd10', True, 5.0)
+
+    # They are streamed from the slot consistent point
+    received = []
+    receiver.message_cb = received.append
+    src_db.thread_receive(receiver, receiver.create_connection(),
+        target=lambda cnn: receiver.start(cnn, lsn=lsn))
+
+    for i in range(50):
+        if received:
+            break
+        time.sleep(0.1)
+
+    assert len(received) == 1
+    assert received[0]['tx'][0]['values'][:2] == [1001, 'after']
+
+
+def test_sync_origin(src_db, tgt_db):
+    scur = src_db.conn.cursor()
+    scur.execute("""
+        drop table if exists testsyncorig;
+        create table testsyncorig (id serial primary key, data text);
+        insert into testsyncorig (data)
+            select 'd' || i from generate_series(1, 1000) s(i);
+        analyze testsyncorig;
+        """)
+
+    tcur = tgt_db.conn.cursor()
+    tcur.execute("""
+        drop table if exists testsyncorig;
+        create table testsyncorig (id int primary key, data text);
+        """)
+
+    receiver = JsonReceiver(
+        slot='rs_sync_test', dsn=src_db.dsn,
+        options=[('include', json.dumps({'table': 'testsyncorig'}))])
+    src_db.at_exit(receiver.drop_slot)
+
+    def make_pipeline():
+        pl = Pipeline()
+        pl.consumer = DataUpdater(
+            tgt_db.dsn, origin='replisome_test', track_progress=True)
+        return pl
+
+    # Every job loads the data without using the origin
+    syncer = sync.Syncer(
+        receiver, make_pipeline, jobs=3, chunk_rows=100, batch_rows=30)
+    lsn = syncer.run()
+
+    tcur.execute("select count(*) from testsyncorig")
+    assert tcur.fetchone()[0] == 1000
+
+    tcur.execute("""
+        select pg_replication_origin_progress('replisome_test', true)
+        from pg_replication_origin where roname = 'replisome_test'
+        """)
+    assert tcur.fetchone() in (None, (None,))
+
+    # The consistent point is recorded once
+    du = make_pipeline().consumer
+    du.set_progress(lsn)
+    tcur.execute("select %s::pg_lsn = %s::pg_lsn", [du.start_lsn(), lsn])
+    assert tcur.fetchone()[0]
+
+    du._connection.close()
+    tcur.execute("select pg_replication_origin_drop('replisome_test')")
+
+
+def test_partition_cond(src_db):
+    cur = src_db.conn.cursor()
+    cur.execute("""
+        drop table if exists testsyncpart;
+        create table testsyncpart (
+            id int, name varchar, data text, primary key (id, name));
+        insert into testsyncpart
+            select i, 'n' || i, 'd' || i from generate_series(1, 100) s(i);
+        """)
+    cur.execute("select 'testsyncpart'::regclass::oid")
+    oid = cur.fetchone()[0]
+
+    syncer = sync.Syncer(JsonReceiver(dsn=src_db.dsn), None)
+    for r in range(3):
+        part = {'by': 'key', 'modulus': 3, 'remainder': r}
+        t = sync.SyncTable(oid, 'public', 'testsyncpart')
+        syncer.setup_table(src_db.conn, t, {'partition': part})
+        cur.execute(sql.SQL("select id from testsyncpart where {}").format(
+            t.partition))
+        copied = sorted(rec[0] for rec in cur)
+
+        # The rows copied are the ones the plugin emits
+        cur.execute("""
+            select data from pg_logical_slot_peek_changes(
+                %s, null, null, 'include', %s)
+            """, [src_db.slot, json.dumps(
+                {'table': 'testsyncpart', 'partition': part})])
+        emitted = sorted(
+            ch['values'][0] for rec in cur
+            for ch in json.loads(rec[0])['tx'])
+        assert copied == emitted
+
+    with pytest.raises(ConfigError):
+        syncer.setup_table(src_db.conn, t, {'partition': {'by': 'key'}})
@@ -0,0 +1,23 @@
+\set VERBOSITY terse
+\pset format unaligned
+
+-- predictability
+SET synchronous_commit = on;
+
+DROP TABLE IF EXISTS bytea1;
+
+CREATE TABLE bytea1 (id bytea PRIMARY KEY, data bytea, label text);
+
+SELECT slot_create();
+
+-- Bad config
+SELECT data FROM slot_get('bytea-format', 'octal');
+
+INSERT INTO bytea1 VALUES ('\x00ff', '', '\xnot bytea');
+INSERT INTO bytea1 VALUES ('a', 'ab', NULL);
+UPDATE bytea1 SET data = 'abc' WHERE id = 'a';
+
+SELECT data FROM slot_peek('bytea-format', 'hex');
+SELECT data FROM slot_get('bytea-format', 'base64');
+
+SELECT slot_drop();
@@ -0,0 +1,33 @@
+\set VERBOSITY terse
+\pset format unaligned
+
+-- predictability
+SET synchronous_commit = on;
+
+DROP TABLE IF EXISTS chunks1;
+
+CREATE TABLE chunks1 (id int PRIMARY KEY, data text);
+
+SELECT slot_create();
+
+-- Bad config
+SELECT data FROM slot_get('chunk-size', 'big');
+SELECT data FROM slot_get('chunk-size', '-1');
+
+INSERT INTO chunks1 SELECT i, 'data ' || i FROM generate_series(1, 10) i;
+
+-- One chunk per change
+SELECT count(*) FROM slot_peek('write-in-chunks', '1');
+
+-- The changes are coalesced, the end of the transaction is on its own
+SELECT count(*) FROM slot_peek('write-in-chunks', '1', 'chunk-size', '100000');
+SELECT data FROM slot_peek('write-in-chunks', '1', 'chunk-size', '100000')
+OFFSET 1;
+
+-- The content is the same
+SELECT (SELECT string_agg(data, '') FROM slot_peek('write-in-chunks', '1'))
+	= (SELECT string_agg(data, '') FROM slot_peek(
+		'write-in-chunks', '1', 'chunk-size', '200'))
+	AS same;
+
+SELECT slot_drop();
@@ -0,0 +1,37 @@
+\set VERBOSITY terse
+\pset format unaligned
+
+-- predictability
+SET synchronous_commit = on;
+
+DROP TABLE IF EXISTS cmp1;
+
+CREATE TABLE cmp1 (id int PRIMARY KEY, data text);
+
+SELECT slot_create();
+
+-- Bad config
+SELECT data FROM slot_get('compression', 'gzip');
+SELECT data FROM slot_get('compression', 'zlib', 'compression-level', '12');
+SELECT data FROM slot_get('compression', 'zlib', 'compression-level', 'high');
+SELECT data FROM slot_get('compression', 'zlib', 'compression-threshold', '-1');
+
+INSERT INTO cmp1 SELECT i, 'data ' || i FROM generate_series(1, 100) i;
+
+-- Compressed data
+SELECT get_byte(data, 0) = 0 AS compressed,
+	chr(get_byte(data, 1)) AS method,
+	(get_byte(data, 2) << 24) + (get_byte(data, 3) << 16)
+		+ (get_byte(data, 4) << 8) + get_byte(data, 5)
+		= (SELECT octet_length(data) FROM slot_peek()) AS size_ok
+FROM pg_logical_slot_peek_binary_changes('regression_slot', NULL, NULL,
+	'pretty-print', '1', 'compression', 'zlib', 'compression-threshold', '0');
+
+-- Messages smaller than the threshold are not compressed
+SELECT get_byte(data, 0) = 0 AS compressed,
+	convert_from(data, 'utf8') = (SELECT data FROM slot_peek()) AS data_ok
+FROM pg_logical_slot_peek_binary_changes('regression_slot', NULL, NULL,
+	'pretty-print', '1', 'compression', 'zlib',
+	'compression-threshold', '1000000');
+
+SELECT slot_drop();
@@ -0,0 +1,33 @@
+\set VERBOSITY terse
+\pset format unaligned
+
+-- predictability
+SET synchronous_commit = on;
+
+DROP TABLE IF EXISTS hb1;
+DROP TABLE IF EXISTS hb2;
+
+CREATE TABLE hb1 (id int PRIMARY KEY);
+CREATE TABLE hb2 (id int PRIMARY KEY);
+
+SELECT slot_create();
+
+-- Bad config
+SELECT data FROM slot_get('heartbeat-xacts', '-1');
+SELECT data FROM slot_get('heartbeat-interval', 'often');
+
+INSERT INTO hb2 VALUES (1);
+INSERT INTO hb2 VALUES (2);
+INSERT INTO hb1 VALUES (1);
+INSERT INTO hb2 VALUES (3);
+INSERT INTO hb2 VALUES (4);
+INSERT INTO hb2 VALUES (5);
+
+-- No heartbeat by default
+SELECT count(*) FROM slot_peek('include', '{"table": "hb1"}');
+
+SELECT regexp_replace(data, '"nextlsn": "[^"]*"', '"nextlsn": "X/X"')
+FROM slot_get(
+	'include', '{"table": "hb1"}', 'heartbeat-xacts', '2');
+
+SELECT slot_drop();
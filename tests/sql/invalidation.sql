@@ -0,0 +1,34 @@
+\set VERBOSITY terse
+\pset format unaligned
+
+-- predictability
+SET synchronous_commit = on;
+
+DROP TABLE IF EXISTS inval1;
+
+CREATE TABLE inval1 (id int PRIMARY KEY, data text);
+
+SELECT slot_create();
+
+-- Invalidations not changing the table don't emit the names again
+begin;
+insert into inval1 values (1, 'a');
+update inval1 set data = 'b' where id = 1;
+create index inval1_data on inval1 (data);
+grant select on inval1 to public;
+analyze inval1;
+insert into inval1 values (2, 'a');
+update inval1 set data = 'b' where id = 2;
+commit;
+SELECT data FROM slot_get(
+	'include', '{"table": "inval1", "where": "data = ''b''"}');
+
+-- Changes to the table emit the names again
+begin;
+update inval1 set data = 'c' where id = 1;
+alter table inval1 add more text;
+update inval1 set data = 'd' where id = 1;
+commit;
+SELECT data FROM slot_get();
+
+SELECT slot_drop();
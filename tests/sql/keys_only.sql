@@ -0,0 +1,34 @@
+\set VERBOSITY terse
+\pset format unaligned
+
+-- predictability
+SET synchronous_commit = on;
+
+DROP TABLE IF EXISTS keys1;
+DROP TABLE IF EXISTS keys2;
+
+CREATE TABLE keys1 (data text, id int PRIMARY KEY, doc text);
+CREATE TABLE keys2 (id int, data text);
+
+SELECT slot_create();
+
+-- Bad config
+SELECT data FROM slot_get(
+	'include', '{"table": "keys1", "keys_only": "maybe"}');
+SELECT data FROM slot_get(
+	'exclude', '{"table": "keys1", "keys_only": true}');
+
+INSERT INTO keys1 VALUES ('foo', 1, repeat('x', 10000));
+UPDATE keys1 SET data = 'bar' WHERE id = 1;
+UPDATE keys1 SET id = 2 WHERE id = 1;
+DELETE FROM keys1 WHERE id = 2;
+
+SELECT data FROM slot_get(
+	'include', '{"table": "keys1", "keys_only": true}');
+
+-- Error found when we first see the table
+INSERT INTO keys2 VALUES (1, 'foo');
+SELECT data FROM slot_peek(
+	'include', '{"table": "keys2", "keys_only": true}');
+
+SELECT slot_drop();
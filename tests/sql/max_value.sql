@@ -0,0 +1,35 @@
+\set VERBOSITY terse
+\pset format unaligned
+
+-- predictability
+SET synchronous_commit = on;
+
+DROP TABLE IF EXISTS big1;
+
+CREATE TABLE big1 (id text PRIMARY KEY, body text, blob bytea, doc jsonb, n int);
+
+SELECT slot_create();
+
+-- Bad config
+SELECT data FROM slot_get(
+	'include', '{"table": "big1", "max_value_bytes": 0}');
+SELECT data FROM slot_get(
+	'include', '{"table": "big1", "max_value_bytes": "many"}');
+SELECT data FROM slot_get(
+	'include', '{"table": "big1", "hash_columns": "body"}');
+SELECT data FROM slot_get(
+	'exclude', '{"table": "big1", "max_value_bytes": 10}');
+
+INSERT INTO big1 VALUES ('abcdefghijkl', repeat('x', 10000),
+	'\x000102030405060708090a', '{"a": "bcdefghij"}', 42);
+UPDATE big1 SET n = 43;
+
+-- The key is never truncated
+SELECT data FROM slot_peek(
+	'include', '{"table": "big1", "max_value_bytes": 7}');
+
+-- The key is never hashed
+SELECT data FROM slot_get(
+	'include', '{"table": "big1", "hash_columns": ["id", "body", "blob", "doc", "n"]}');
+
+SELECT slot_drop();
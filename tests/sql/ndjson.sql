@@ -0,0 +1,24 @@
+\set VERBOSITY terse
+\pset format unaligned
+
+-- predictability
+SET synchronous_commit = on;
+
+DROP TABLE IF EXISTS nd1;
+
+CREATE TABLE nd1 (id int PRIMARY KEY, data text);
+
+SELECT slot_create();
+
+-- Bad config
+SELECT data FROM slot_get('ndjson', '1');
+
+INSERT INTO nd1 VALUES (1, 'foo'), (2, 'bar');
+UPDATE nd1 SET data = 'baz' WHERE id = 1;
+
+-- Every record is a message on a line of its own
+SELECT (data::jsonb - 'xid' - 'lsn' - 'nextlsn')::text AS record,
+	right(data, 1) = E'\n' AS newline
+FROM slot_get('pretty-print', '0', 'ndjson', '1');
+
+SELECT slot_drop();
@@ -0,0 +1,32 @@
+\set VERBOSITY terse
+\pset format unaligned
+
+-- predictability
+SET synchronous_commit = on;
+
+DROP TABLE IF EXISTS noopup;
+
+CREATE TABLE noopup (id int PRIMARY KEY, data text, seen_at int);
+ALTER TABLE noopup REPLICA IDENTITY FULL;
+INSERT INTO noopup VALUES (1, 'foo', 10);
+INSERT INTO noopup VALUES (2, 'bar', 10);
+
+SELECT slot_create();
+
+-- Updates only on the skipped column are dropped
+UPDATE noopup SET seen_at = 20 WHERE id = 1;
+UPDATE noopup SET seen_at = 30, data = 'baz' WHERE id = 1;
+
+-- Records entering the row filter are emitted anyway
+UPDATE noopup SET seen_at = 40 WHERE id = 2;
+
+SELECT data FROM slot_peek(
+	'include', '{"table": "noopup", "skip_columns": ["seen_at"]}');
+SELECT data FROM slot_get(
+	'include', '{"table": "noopup", "skip_columns": ["seen_at"], "where": "seen_at > 30 or id = 1"}');
+
+-- Without columns selection updates are emitted
+UPDATE noopup SET seen_at = 50 WHERE id = 1;
+SELECT data FROM slot_get('include', '{"table": "noopup"}');
+
+SELECT slot_drop();
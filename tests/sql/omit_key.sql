@@ -0,0 +1,26 @@
+\set VERBOSITY terse
+\pset format unaligned
+
+-- predictability
+SET synchronous_commit = on;
+
+DROP TABLE IF EXISTS omitkey;
+
+CREATE TABLE omitkey (id int PRIMARY KEY, data text);
+INSERT INTO omitkey VALUES (1, 'foo');
+
+SELECT slot_create();
+
+UPDATE omitkey SET data = 'bar' WHERE id = 1;
+UPDATE omitkey SET data = 'baz' WHERE id = 1;
+-- The key changed: emit it
+UPDATE omitkey SET id = 2 WHERE id = 1;
+DELETE FROM omitkey WHERE id = 2;
+
+SELECT data FROM slot_peek('omit-unchanged-key', '1');
+
+-- The key is not in the values: emit it
+SELECT data FROM slot_get('omit-unchanged-key', '1',
+	'include', '{"table": "omitkey", "columns": ["data"]}');
+
+SELECT slot_drop();
@@ -0,0 +1,32 @@
+\set VERBOSITY terse
+\pset format unaligned
+
+-- predictability
+SET synchronous_commit = on;
+
+DROP TABLE IF EXISTS ops1;
+
+CREATE TABLE ops1 (id int PRIMARY KEY, data text);
+
+SELECT slot_create();
+
+-- Bad config
+SELECT data FROM slot_get(
+	'include', '{"table": "ops1", "ops": "I"}');
+SELECT data FROM slot_get(
+	'include', '{"table": "ops1", "ops": []}');
+SELECT data FROM slot_get(
+	'include', '{"table": "ops1", "ops": ["I", "X"]}');
+SELECT data FROM slot_get(
+	'exclude', '{"table": "ops1", "ops": ["I"]}');
+
+INSERT INTO ops1 VALUES (1, 'foo');
+UPDATE ops1 SET data = 'bar' WHERE id = 1;
+DELETE FROM ops1 WHERE id = 1;
+
+SELECT data FROM slot_peek(
+	'include', '{"table": "ops1", "ops": ["I"]}');
+SELECT data FROM slot_peek(
+	'include', '{"table": "ops1", "ops": ["U", "D"]}');
+
+SELECT slot_drop();
@@ -0,0 +1,28 @@
+\set VERBOSITY terse
+\pset format unaligned
+
+-- predictability
+SET synchronous_commit = on;
+
+DROP TABLE IF EXISTS origin1;
+
+CREATE TABLE origin1 (id int PRIMARY KEY);
+
+SELECT slot_create();
+
+SELECT pg_replication_origin_create('regression_origin') IS NOT NULL AS created;
+
+-- A change applied by a replication process
+SELECT pg_replication_origin_session_setup('regression_origin');
+INSERT INTO origin1 VALUES (1);
+SELECT pg_replication_origin_session_reset();
+
+-- A local change
+INSERT INTO origin1 VALUES (2);
+
+SELECT count(*) FROM slot_peek();
+SELECT data FROM slot_get('only-local', '1');
+
+SELECT pg_replication_origin_drop('regression_origin');
+
+SELECT slot_drop();
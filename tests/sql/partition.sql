@@ -0,0 +1,111 @@
+\set VERBOSITY terse
+\pset format unaligned
+
+-- predictability
+SET synchronous_commit = on;
+
+DROP TABLE IF EXISTS part1;
+DROP TABLE IF EXISTS part2;
+
+CREATE TABLE part1 (id int PRIMARY KEY, data text);
+CREATE TABLE part2 (id int, data text);
+
+SELECT slot_create();
+
+-- Bad config
+SELECT data FROM slot_get(
+	'include', '{"table": "part1", "partition": 3}');
+SELECT data FROM slot_get(
+	'include', '{"table": "part1", "partition": {"by": "value", "modulus": 3, "remainder": 0}}');
+SELECT data FROM slot_get(
+	'include', '{"table": "part1", "partition": {"by": "key", "modulus": 0, "remainder": 0}}');
+SELECT data FROM slot_get(
+	'include', '{"table": "part1", "partition": {"by": "key", "modulus": 3}}');
+SELECT data FROM slot_get(
+	'include', '{"table": "part1", "partition": {"by": "key", "modulus": 3, "remainder": 3}}');
+SELECT data FROM slot_get(
+	'exclude', '{"table": "part1", "partition": {"by": "key", "modulus": 3, "remainder": 0}}');
+
+-- The partitions emitted together cover every record exactly once
+INSERT INTO part1 SELECT i, 'x' || i FROM generate_series(1, 20) i;
+DELETE FROM part1 WHERE id % 2 = 0;
+
+SELECT r, array_agg(m.v[1]::int ORDER BY m.v[1]::int) = (
+		SELECT array_agg(i ORDER BY i) FROM generate_series(1, 20) i
+		WHERE (hashint4(i)::bigint & 4294967295) % 3 = r) AS inserted
+FROM generate_series(0, 2) r,
+	slot_peek('include', format(
+		'{"table": "part1", "partition": {"by": "key", "modulus": 3, "remainder": %s}}', r)) s,
+	regexp_matches(s.data, '"values": \[(\d+)', 'g') m(v)
+GROUP BY r ORDER BY r;
+
+SELECT r, array_agg(m.v[1]::int ORDER BY m.v[1]::int) = (
+		SELECT array_agg(i ORDER BY i) FROM generate_series(2, 20, 2) i
+		WHERE (hashint4(i)::bigint & 4294967295) % 3 = r) AS deleted
+FROM generate_series(0, 2) r,
+	slot_peek('include', format(
+		'{"table": "part1", "partition": {"by": "key", "modulus": 3, "remainder": %s}}', r)) s,
+	regexp_matches(s.data, '"oldkey": \[(\d+)', 'g') m(v)
+GROUP BY r ORDER BY r;
+
+SELECT count(*) FROM slot_get();
+
+-- An update moving a record to another partition is emitted as a delete
+-- from the partition of the old key and an insert into the new one
+UPDATE part1 SET id = id + 100;
+
+SELECT r, e.changes = s.changes AS updated
+FROM (
+	SELECT r, array_agg(format('%s %s', CASE
+			WHEN o = r AND n = r THEN 'U' WHEN o = r THEN 'D' ELSE 'I' END, i)
+		ORDER BY i) AS changes
+	FROM generate_series(0, 1) r,
+		LATERAL (SELECT i, (hashint4(i)::bigint & 4294967295) % 2 AS o,
+			(hashint4(i + 100)::bigint & 4294967295) % 2 AS n
+			FROM generate_series(1, 19, 2) i) h
+	WHERE o = r OR n = r
+	GROUP BY r) e
+JOIN (
+	SELECT r, array_agg(format('%s %s', x.op, x.i) ORDER BY x.i) AS changes
+	FROM generate_series(0, 1) r,
+		slot_peek('include', format(
+			'{"table": "part1", "partition": {"by": "key", "modulus": 2, "remainder": %s}}', r)) d,
+		json_array_elements(d.data::json->'tx') c,
+		LATERAL (SELECT c->>'op' AS op, coalesce((c->'oldkey'->>0)::int,
+			(c->'values'->>0)::int - 100) AS i) x
+	GROUP BY r) s USING (r)
+ORDER BY r;
+
+-- The operations requested are checked on the operation emitted
+SELECT r, k.op, coalesce(e.ids, '{}') = coalesce(s.ids, '{}')
+	AND s.same_op IS NOT FALSE AS emitted
+FROM generate_series(0, 1) r
+CROSS JOIN unnest('{I,U,D}'::text[]) k(op)
+LEFT JOIN LATERAL (
+	SELECT array_agg(i ORDER BY i) AS ids
+	FROM (SELECT i, (hashint4(i)::bigint & 4294967295) % 2 AS o,
+			(hashint4(i + 100)::bigint & 4294967295) % 2 AS n
+		FROM generate_series(1, 19, 2) i) h
+	WHERE CASE k.op WHEN 'U' THEN o = r AND n = r
+		WHEN 'D' THEN o = r AND n <> r
+		ELSE o <> r AND n = r END) e ON true
+LEFT JOIN LATERAL (
+	SELECT array_agg(x.i ORDER BY x.i) AS ids, bool_and(x.kind = k.op) AS same_op
+	FROM slot_peek('include', format(
+			'{"table": "part1", "ops": ["%s"], "partition": {"by": "key", "modulus": 2, "remainder": %s}}', k.op, r)) d,
+		json_array_elements(d.data::json->'tx') c,
+		LATERAL (SELECT c->>'op' AS kind, coalesce((c->'oldkey'->>0)::int,
+			(c->'values'->>0)::int - 100) AS i) x) s ON true
+ORDER BY r, k.op;
+
+SELECT count(*) FROM slot_get();
+
+-- Errors found when we first see the table
+INSERT INTO part1 VALUES (2, 'foo');
+INSERT INTO part2 VALUES (1, 'foo');
+SELECT data FROM slot_peek(
+	'include', '{"table": "part2", "partition": {"by": "key", "modulus": 3, "remainder": 0}}');
+SELECT data FROM slot_peek(
+	'include', '{"table": "part1", "columns": ["data"], "partition": {"by": "key", "modulus": 3, "remainder": 0}}');
+
+SELECT slot_drop();
@@ -0,0 +1,36 @@
+\set VERBOSITY terse
+\pset format unaligned
+
+-- predictability
+SET synchronous_commit = on;
+
+DROP TABLE IF EXISTS relids1;
+DROP TABLE IF EXISTS relids2;
+DROP SCHEMA IF EXISTS relids_schema CASCADE;
+
+CREATE TABLE relids1 (id int PRIMARY KEY, data text);
+CREATE TABLE relids2 (id int PRIMARY KEY);
+CREATE SCHEMA relids_schema;
+
+SELECT slot_create();
+
+BEGIN;
+INSERT INTO relids1 VALUES (1, 'foo');
+INSERT INTO relids2 VALUES (1);
+INSERT INTO relids1 VALUES (2, 'bar');
+COMMIT;
+DELETE FROM relids2;
+
+-- A new id after a schema change
+ALTER TABLE relids1 ADD more int;
+INSERT INTO relids1 VALUES (3, 'baz', 42);
+
+-- A new id after a rename or a change of schema
+ALTER TABLE relids2 RENAME TO relids3;
+INSERT INTO relids3 VALUES (2);
+ALTER TABLE relids3 SET SCHEMA relids_schema;
+INSERT INTO relids_schema.relids3 VALUES (3);
+
+SELECT data FROM slot_get('relation-ids', '1');
+
+SELECT slot_drop();
@@ -0,0 +1,59 @@
+\set VERBOSITY terse
+\pset format unaligned
+
+-- predictability
+SET synchronous_commit = on;
+
+DROP TABLE IF EXISTS stats1;
+DROP TABLE IF EXISTS stats2;
+DROP TABLE IF EXISTS stats3;
+
+CREATE TABLE stats1 (id int PRIMARY KEY, data text);
+CREATE TABLE stats2 (id int PRIMARY KEY, data text);
+CREATE TABLE stats3 (id int PRIMARY KEY, data text, other text);
+ALTER TABLE stats3 REPLICA IDENTITY FULL;
+
+SELECT slot_create();
+
+-- Bad config
+SELECT data FROM slot_get('stats-interval', '-1');
+
+begin;
+INSERT INTO stats1 VALUES (1, 'foo');
+INSERT INTO stats1 VALUES (2, 'bar');
+INSERT INTO stats1 VALUES (3, 'baz');
+DELETE FROM stats1 WHERE id = 3;
+INSERT INTO stats2 VALUES (1, 'foo');
+commit;
+
+INSERT INTO stats1 VALUES (4, 'qux');
+
+-- Stats emitted after the first transaction, then after the interval
+SELECT t->>'table' AS "table", t->>'changes' AS changes,
+	t->>'excluded' AS excluded, t->>'filtered' AS filtered,
+	t->>'skipped_ops' AS skipped_ops, (t->>'bytes')::int > 0 AS bytes,
+	(t->>'filter_time')::float8 >= 0 AS filter_time
+FROM slot_get(
+		'stats-interval', '3600',
+		'include', '{"table": "stats1", "where": "id > 1", "ops": ["I"]}') d,
+	json_array_elements(d.data::json->'tables') t
+WHERE d.data::json->>'stats' = 'true'
+ORDER BY 1;
+
+-- Updates not changing the columns emitted are counted as filtered
+begin;
+INSERT INTO stats3 VALUES (1, 'foo', 'bar');
+UPDATE stats3 SET other = 'baz' WHERE id = 1;
+UPDATE stats3 SET data = 'qux' WHERE id = 1;
+commit;
+
+SELECT t->>'table' AS "table", t->>'changes' AS changes,
+	t->>'filtered' AS filtered
+FROM slot_get(
+		'stats-interval', '3600',
+		'include', '{"table": "stats3", "columns": ["id", "data"]}') d,
+	json_array_elements(d.data::json->'tables') t
+WHERE d.data::json->>'stats' = 'true'
+ORDER BY 1;
+
+SELECT slot_drop();
@@ -0,0 +1,27 @@
+\set VERBOSITY terse
+\pset format unaligned
+
+-- predictability
+SET synchronous_commit = on;
+
+DROP TABLE IF EXISTS upchg;
+DROP TABLE IF EXISTS upchg_default;
+
+CREATE TABLE upchg (id int PRIMARY KEY, a text, b int, c text);
+ALTER TABLE upchg REPLICA IDENTITY FULL;
+INSERT INTO upchg VALUES (1, 'foo', 10, NULL);
+
+CREATE TABLE upchg_default (id int PRIMARY KEY, a text, b int);
+INSERT INTO upchg_default VALUES (1, 'foo', 10);
+
+SELECT slot_create();
+
+UPDATE upchg SET b = 20 WHERE id = 1;
+UPDATE upchg SET a = 'bar', c = 'baz' WHERE id = 1;
+UPDATE upchg SET c = NULL, b = 20 WHERE id = 1;
+
+-- Old values not available: emit everything
+UPDATE upchg_default SET b = 20 WHERE id = 1;
+
+SELECT data FROM slot_get('update-changed-only', '1');
+SELECT slot_drop();